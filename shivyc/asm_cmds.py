@@ -16,6 +16,8 @@ class _ASMCommand:
     name = None
 
     def __init__(self, dest=None, source=None, size=None):
+        self.dest_spot = dest
+        self.source_spot = source
         self.dest = dest.asm_str(size) if dest else None
         self.source = source.asm_str(size) if source else None
         self.size = size
@@ -38,6 +40,8 @@ class _ASMCommandMultiSize:
     name = None
 
     def __init__(self, dest, source, source_size, dest_size):
+        self.dest_spot = dest
+        self.source_spot = source
         self.dest = dest.asm_str(source_size)
         self.source = source.asm_str(dest_size)
         self.source_size = source_size
@@ -168,12 +172,18 @@ class Cdq(_ASMCommand): name = "cdq"  # noqa: D101
 class Cqo(_ASMCommand): name = "cqo"  # noqa: D101
 
 
+class RepMovsq(_ASMCommand): name = "rep movsq"  # noqa: D101
+
+
 class Xor(_ASMCommand): name = "xor"  # noqa: D101
 
 
 class Cmp(_ASMCommand): name = "cmp"  # noqa: D101
 
 
+class Test(_ASMCommand): name = "test"  # noqa: D101
+
+
 class Pop(_ASMCommand): name = "pop"  # noqa: D101
 
 
@@ -183,6 +193,16 @@ class Push(_ASMCommand): name = "push"  # noqa: D101
 class Call(_ASMCommand): name = "call"  # noqa: D101
 
 
+class JmpTo(_ASMCommand):
+    """Jump to the address held in a register or memory.
+
+    Unlike Jmp, which jumps to a label, this is used to jump to a function
+    through a function pointer.
+    """
+
+    name = "jmp"
+
+
 class Ret(_ASMCommand): name = "ret"  # noqa: D101
 
 
@@ -0,0 +1,525 @@
+"""Built-in x86-64 encoder for the ASM commands in asm_cmds.py.
+
+This module converts the list of ASM command objects in an ASMCode object
+directly into machine code, without going through the text assembly
+source and the external assembler. The encodings chosen match those the
+GNU assembler chooses for the same Intel-syntax source, so the generated
+machine code is byte-for-byte identical to assembling the `.s` file with
+`as`.
+
+Only the subset of instructions and operand forms that ShivyC generates
+is supported. Any other form raises EncodeError, in which case the caller
+should fall back to the external assembler.
+"""
+
+import shivyc.asm_cmds as asm_cmds
+from shivyc.spots import RegSpot, MemSpot, LiteralSpot
+
+
+class EncodeError(Exception):
+    """Raised when some ASM code cannot be encoded by this module."""
+
+    pass
+
+
+# Hardware register numbers.
+reg_nums = {"rax": 0, "rcx": 1, "rdx": 2, "rbx": 3,
+            "rsp": 4, "rbp": 5, "rsi": 6, "rdi": 7,
+            "r8": 8, "r9": 9, "r10": 10, "r11": 11,
+            "r12": 12, "r13": 13, "r14": 14, "r15": 15}
+
+# Condition code of each conditional jump.
+cond_codes = {"jb": 0x2, "jae": 0x3, "je": 0x4, "jne": 0x5, "jbe": 0x6,
+              "ja": 0x7, "jl": 0xC, "jge": 0xD, "jle": 0xE, "jg": 0xF}
+
+# The /digit opcode extension of the group 1 arithmetic instructions.
+alu_ops = {"add": 0, "sub": 5, "xor": 6, "cmp": 7}
+
+# The /digit opcode extension of the group 3 unary instructions.
+unary_ops = {"not": 2, "neg": 3, "div": 6, "idiv": 7}
+
+# The /digit opcode extension of the group 2 shift instructions.
+shift_ops = {"sal": 4, "sar": 7}
+
+scale_bits = {1: 0, 2: 1, 4: 2, 8: 3}
+
+# Relocation type for an absolute, sign-extended 32-bit address.
+R_X86_64_32S = 11
+
+
+def _fits8(val):
+    """Return whether val fits in a signed 8-bit immediate."""
+    return -128 <= val < 128
+
+
+def _fits32(val):
+    """Return whether val fits in a signed 32-bit immediate."""
+    return -(1 << 31) <= val < (1 << 31)
+
+
+def _imm_value(spot, size):
+    """Return the integer value of a literal spot, as seen for given size.
+
+    For sizes below 8, the value is truncated and sign-extended the way the
+    assembler reads an immediate for an operand of that size.
+    """
+    val = int(spot.detail)
+    if size < 8:
+        bits = size * 8
+        if not -(1 << (bits - 1)) <= val < (1 << bits):
+            raise EncodeError("immediate out of range")
+        val &= (1 << bits) - 1
+        if val >= 1 << (bits - 1):
+            val -= 1 << bits
+    elif not -(1 << 63) <= val < (1 << 64):
+        raise EncodeError("immediate out of range")
+    return val
+
+
+def _imm_bytes(val, size):
+    """Return the little-endian encoding of an immediate of given size."""
+    return (val & ((1 << (size * 8)) - 1)).to_bytes(size, "little")
+
+
+class _Mem:
+    """A decoded memory operand.
+
+    base (int) - Number of the base register, or None
+    index (int) - Number of the index register, or None
+    scale (int) - Scale of the index register
+    disp (int) - Constant displacement
+    symbol (str) - Name of the symbol the displacement is relative to,
+    or None
+    """
+
+    def __init__(self, spot):  # noqa: D102
+        self.base = None
+        self.symbol = None
+        self.index = None
+        self.scale = 1
+
+        if isinstance(spot.base, RegSpot):
+            self.base = reg_nums[spot.base.name]
+        elif isinstance(spot.base, str):
+            self.symbol = spot.base
+        else:
+            raise EncodeError("unsupported memory base")
+
+        # This mirrors the address computation of MemSpot.asm_str.
+        if not spot.count:
+            self.disp = spot.offset + spot.chunk
+        else:
+            self.disp = spot.offset
+            if isinstance(spot.count, LiteralSpot):
+                self.disp += spot.chunk * int(spot.count.detail)
+            elif spot.chunk > 0:
+                self.index = reg_nums[spot.count.name]
+                self.scale = spot.chunk
+            elif spot.chunk < 0:
+                raise EncodeError("negative index scale")
+
+        if self.index == 4 or self.scale not in scale_bits:
+            raise EncodeError("unsupported index register")
+        if not _fits32(self.disp):
+            raise EncodeError("displacement out of range")
+
+
+class Instruction:
+    """An encoded instruction.
+
+    code (bytes) - Machine code of this instruction.
+    relocs (List) - Relocations in this instruction, as a list of (offset,
+    symbol, addend, type) tuples where offset is relative to the start of
+    the instruction.
+    """
+
+    def __init__(self, code, relocs=None):  # noqa: D102
+        self.code = code
+        self.relocs = relocs or []
+
+
+class Encoder:
+    """Encodes ASM commands into x86-64 machine code."""
+
+    def encode(self, cmd):
+        """Return the Instruction for a non-jump, non-label ASM command."""
+        name = cmd.name
+
+        if name in alu_ops:
+            return self._alu(alu_ops[name], cmd.dest_spot, cmd.source_spot,
+                             cmd.size)
+        elif name == "mov":
+            return self._mov(cmd.dest_spot, cmd.source_spot, cmd.size)
+        elif name == "test":
+            return self._test(cmd.dest_spot, cmd.source_spot, cmd.size)
+        elif name == "imul":
+            return self._imul(cmd.dest_spot, cmd.source_spot, cmd.size)
+        elif name in unary_ops:
+            size = cmd.size
+            opcode = b"\xf6" if size == 1 else b"\xf7"
+            return self._rm(opcode, unary_ops[name], cmd.dest_spot, size)
+        elif name in shift_ops:
+            return self._shift(shift_ops[name], cmd.dest_spot,
+                               cmd.source_spot, cmd.source_size)
+        elif name == "cdq":
+            return Instruction(b"\x99")
+        elif name == "cqo":
+            return Instruction(b"\x48\x99")
+        elif name == "rep movsq":
+            return Instruction(b"\xf3\x48\xa5")
+        elif name == "ret":
+            return Instruction(b"\xc3")
+        elif name in {"push", "pop"}:
+            return self._push_pop(name, cmd.dest_spot)
+        elif name == "call":
+            # Call is always 64-bit, so no operand size is given.
+            return self._rm(b"\xff", 2, cmd.dest_spot, 4)
+        elif name == "jmp":
+            # An indirect jump, which is also always 64-bit.
+            return self._rm(b"\xff", 4, cmd.dest_spot, 4)
+        elif name == "lea":
+            return self._reg_rm(b"\x8d", cmd.dest, cmd.source, 8)
+        elif name in {"movsx", "movzx"}:
+            # The dest and source sizes are passed to the multi-size
+            # commands in this order; see Set.make_asm.
+            return self._movx(name, cmd.dest_spot, cmd.source_spot,
+                              cmd.source_size, cmd.dest_size)
+
+        raise EncodeError(f"cannot encode '{name}'")
+
+    def jump(self, cmd, long):
+        """Return opcode bytes for a jump command, without displacement.
+
+        long (bool) - Whether to use the 32-bit displacement form.
+        """
+        if cmd.name == "jmp":
+            return b"\xe9" if long else b"\xeb"
+        cc = cond_codes[cmd.name]
+        return bytes([0x0F, 0x80 + cc]) if long else bytes([0x70 + cc])
+
+    def _alu(self, op, dest, source, size):
+        """Encode a group 1 arithmetic instruction like add or cmp."""
+        if isinstance(source, LiteralSpot):
+            val = _imm_value(source, size)
+            dest_acc = dest == RegSpot("rax")
+
+            if size == 1:
+                if dest_acc:
+                    return Instruction(bytes([op * 8 + 4]) +
+                                       _imm_bytes(val, 1))
+                return self._rm(b"\x80", op, dest, size, _imm_bytes(val, 1))
+            elif _fits8(val):
+                return self._rm(b"\x83", op, dest, size, _imm_bytes(val, 1))
+
+            imm_size = min(size, 4)
+            if size == 8 and not _fits32(val):
+                raise EncodeError("64-bit immediate")
+            imm = _imm_bytes(val, imm_size)
+            if dest_acc:
+                return Instruction(self._prefixes(size) +
+                                   bytes([op * 8 + 5]) + imm)
+            return self._rm(b"\x81", op, dest, size, imm)
+
+        elif isinstance(source, RegSpot):
+            opcode = bytes([op * 8 + (0 if size == 1 else 1)])
+            return self._reg_rm(opcode, source, dest, size)
+
+        elif isinstance(dest, RegSpot):
+            opcode = bytes([op * 8 + (2 if size == 1 else 3)])
+            return self._reg_rm(opcode, dest, source, size)
+
+        raise EncodeError("unsupported operands")
+
+    def _mov(self, dest, source, size):
+        """Encode a mov instruction."""
+        if isinstance(source, LiteralSpot):
+            val = _imm_value(source, size)
+            if isinstance(dest, RegSpot) and (size != 8 or not _fits32(val)):
+                num = reg_nums[dest.name]
+                opcode = bytes([(0xB0 if size == 1 else 0xB8) + (num & 7)])
+                prefix = self._prefixes(size, b=num,
+                                        byte_regs=[num] if size == 1 else [])
+                return Instruction(prefix + opcode + _imm_bytes(val, size))
+
+            if size == 8 and not _fits32(val):
+                raise EncodeError("64-bit immediate to memory")
+            opcode = b"\xc6" if size == 1 else b"\xc7"
+            return self._rm(opcode, 0, dest, size,
+                            _imm_bytes(val, min(size, 4)))
+
+        elif isinstance(source, RegSpot):
+            opcode = b"\x88" if size == 1 else b"\x89"
+            return self._reg_rm(opcode, source, dest, size)
+
+        elif isinstance(dest, RegSpot):
+            opcode = b"\x8a" if size == 1 else b"\x8b"
+            return self._reg_rm(opcode, dest, source, size)
+
+        raise EncodeError("unsupported operands")
+
+    def _test(self, dest, source, size):
+        """Encode a test instruction between two operands."""
+        if not isinstance(source, RegSpot):
+            raise EncodeError("unsupported operands")
+        opcode = b"\x84" if size == 1 else b"\x85"
+        return self._reg_rm(opcode, source, dest, size)
+
+    def _imul(self, dest, source, size):
+        """Encode a two-operand imul instruction."""
+        if not isinstance(dest, RegSpot) or size == 1:
+            raise EncodeError("unsupported operands")
+
+        if isinstance(source, LiteralSpot):
+            val = _imm_value(source, size)
+            if _fits8(val):
+                return self._reg_rm(b"\x6b", dest, dest, size,
+                                    _imm_bytes(val, 1))
+            if size == 8 and not _fits32(val):
+                raise EncodeError("64-bit immediate")
+            return self._reg_rm(b"\x69", dest, dest, size,
+                                _imm_bytes(val, min(size, 4)))
+
+        return self._reg_rm(b"\x0f\xaf", dest, source, size)
+
+    def _shift(self, op, dest, source, size):
+        """Encode a shift by CL or by an immediate."""
+        if isinstance(source, LiteralSpot):
+            val = int(source.detail) & 0xFF
+            if val == 1:
+                opcode = b"\xd0" if size == 1 else b"\xd1"
+                return self._rm(opcode, op, dest, size)
+            opcode = b"\xc0" if size == 1 else b"\xc1"
+            return self._rm(opcode, op, dest, size, bytes([val]))
+
+        elif source == RegSpot("rcx"):
+            opcode = b"\xd2" if size == 1 else b"\xd3"
+            return self._rm(opcode, op, dest, size)
+
+        raise EncodeError("unsupported shift count")
+
+    def _push_pop(self, name, spot):
+        """Encode a push or pop of a 64-bit register."""
+        if not isinstance(spot, RegSpot):
+            raise EncodeError("unsupported operands")
+        num = reg_nums[spot.name]
+        base = 0x50 if name == "push" else 0x58
+        return Instruction(self._prefixes(4, b=num) +
+                           bytes([base + (num & 7)]))
+
+    def _movx(self, name, dest, source, dest_size, source_size):
+        """Encode a movsx or movzx instruction."""
+        if not isinstance(dest, RegSpot):
+            raise EncodeError("unsupported operands")
+
+        if source_size == 4 and name == "movsx":
+            opcode = b"\x63"
+        elif source_size in {1, 2}:
+            opcode = {("movsx", 1): b"\x0f\xbe",
+                      ("movsx", 2): b"\x0f\xbf",
+                      ("movzx", 1): b"\x0f\xb6",
+                      ("movzx", 2): b"\x0f\xb7"}[name, source_size]
+        else:
+            raise EncodeError("unsupported operand sizes")
+
+        return self._reg_rm(opcode, dest, source, dest_size,
+                            rm_size=source_size)
+
+    def _prefixes(self, size, r=0, x=0, b=0, byte_regs=()):
+        """Return the operand size prefix and REX prefix bytes.
+
+        r, x, b - Register numbers whose high bit goes into REX.R, REX.X,
+        and REX.B respectively.
+        byte_regs - Numbers of registers accessed as 8-bit registers. The
+        registers spl, bpl, sil, and dil require an empty REX prefix.
+        """
+        prefix = b"\x66" if size == 2 else b""
+        rex = ((8 if size == 8 else 0) | (r >> 3) << 2 |
+               (x >> 3) << 1 | (b >> 3))
+        if rex or any(4 <= n < 8 for n in byte_regs):
+            prefix += bytes([0x40 | rex])
+        return prefix
+
+    def _rm(self, opcode, digit, spot, size, imm=b""):
+        """Encode an instruction with an opcode extension in ModRM.reg."""
+        return self._encode(opcode, digit, None, spot, size, size, imm)
+
+    def _reg_rm(self, opcode, reg, spot, size, imm=b"", rm_size=None):
+        """Encode an instruction with a register in ModRM.reg."""
+        reg_num = reg_nums[reg.name]
+        rm_size = size if rm_size is None else rm_size
+        return self._encode(opcode, reg_num, size, spot, size, rm_size, imm)
+
+    def _encode(self, opcode, reg_field, reg_size, spot, size, rm_size,
+                imm):
+        """Encode the full instruction from its ModRM operands.
+
+        reg_field (int) - Register number or opcode extension for ModRM.reg
+        reg_size (int) - Size of the ModRM.reg register, or None if
+        reg_field is an opcode extension
+        spot (Spot) - The ModRM.rm operand
+        size (int) - Operand size of the instruction
+        rm_size (int) - Size of the ModRM.rm operand
+        """
+        byte_regs = []
+        if reg_size == 1:
+            byte_regs.append(reg_field)
+
+        if isinstance(spot, RegSpot):
+            rm_num = reg_nums[spot.name]
+            if rm_size == 1:
+                byte_regs.append(rm_num)
+            prefix = self._prefixes(size, r=reg_field, b=rm_num,
+                                    byte_regs=byte_regs)
+            modrm = 0xC0 | (reg_field & 7) << 3 | (rm_num & 7)
+            return Instruction(prefix + opcode + bytes([modrm]) + imm)
+
+        elif isinstance(spot, MemSpot):
+            mem = _Mem(spot)
+            prefix = self._prefixes(size, r=reg_field, x=mem.index or 0,
+                                    b=mem.base or 0, byte_regs=byte_regs)
+            addr, reloc = self._address(reg_field, mem)
+            start = len(prefix) + len(opcode)
+
+            relocs = []
+            if reloc is not None:
+                relocs.append((start + reloc, mem.symbol, mem.disp,
+                               R_X86_64_32S))
+
+            return Instruction(prefix + opcode + addr + imm, relocs)
+
+        raise EncodeError("unsupported operand")
+
+    def _address(self, reg_field, mem):
+        """Return the ModRM, SIB, and displacement bytes for a memory operand.
+
+        Also returns the offset of a 32-bit relocation within these bytes,
+        or None if the displacement needs no relocation.
+        """
+        reg_bits = (reg_field & 7) << 3
+
+        if mem.symbol is not None:
+            index = 4 if mem.index is None else mem.index & 7
+            sib = scale_bits[mem.scale] << 6 | index << 3 | 5
+            return bytes([reg_bits | 4, sib]) + b"\0\0\0\0", 2
+
+        base = mem.base & 7
+        if mem.disp == 0 and base != 5:
+            mod, disp = 0x00, b""
+        elif _fits8(mem.disp):
+            mod, disp = 0x40, _imm_bytes(mem.disp, 1)
+        else:
+            mod, disp = 0x80, _imm_bytes(mem.disp, 4)
+
+        if mem.index is None and base != 4:
+            return bytes([mod | reg_bits | base]) + disp, None
+
+        index = 4 if mem.index is None else mem.index & 7
+        sib = scale_bits[mem.scale] << 6 | index << 3 | base
+        return bytes([mod | reg_bits | 4, sib]) + disp, None
+
+
+class TextSection:
+    """The assembled .text section.
+
+    code (bytes) - Machine code.
+    labels (dict) - Mapping from label name to its offset in the code, in
+    order of definition.
+    relocs (List) - Relocations, as (offset, symbol, addend, type) tuples.
+    symbols (List(str)) - Names of all labels and symbols, in order of
+    first appearance.
+    """
+
+    def __init__(self, lines):
+        """Assemble the given list of ASM commands."""
+        encoder = Encoder()
+
+        # Each item is either an Instruction, a Label, or a jump command.
+        items = []
+        self.symbols = []
+        seen = set()
+
+        def mention(name):
+            if name not in seen:
+                seen.add(name)
+                self.symbols.append(name)
+
+        for line in lines:
+            if isinstance(line, asm_cmds.Comment):
+                continue
+            elif isinstance(line, asm_cmds.Label):
+                mention(line.label)
+                items.append(line)
+            elif isinstance(line, asm_cmds._JumpCommand):
+                mention(line.target)
+                items.append(line)
+            else:
+                inst = encoder.encode(line)
+                for _, symbol, _, _ in inst.relocs:
+                    mention(symbol)
+                items.append(inst)
+
+        # Relax jumps: every jump starts in the short form, and jumps
+        # whose target is out of range are grown until nothing changes.
+        long_jumps = set()
+        while True:
+            labels = self._layout(items, long_jumps, encoder)
+            grown = False
+            pos = 0
+            for i, item in enumerate(items):
+                size = self._size(i, item, long_jumps, encoder)
+                pos += size
+                if isinstance(item, asm_cmds._JumpCommand):
+                    if item.target not in labels:
+                        raise EncodeError("jump to unknown label")
+                    if (i not in long_jumps and
+                         not _fits8(labels[item.target] - pos)):
+                        long_jumps.add(i)
+                        grown = True
+            if not grown:
+                break
+
+        code = bytearray()
+        self.relocs = []
+        for i, item in enumerate(items):
+            if isinstance(item, Instruction):
+                for offset, symbol, addend, kind in item.relocs:
+                    self.relocs.append(
+                        (len(code) + offset, symbol, addend, kind))
+                code += item.code
+            elif isinstance(item, asm_cmds._JumpCommand):
+                long = i in long_jumps
+                opcode = encoder.jump(item, long)
+                end = len(code) + len(opcode) + (4 if long else 1)
+                disp = labels[item.target] - end
+                code += opcode + _imm_bytes(disp, 4 if long else 1)
+
+        self.code = bytes(code)
+        self.labels = labels
+
+    def _size(self, i, item, long_jumps, encoder):
+        """Return the size in bytes of the given item."""
+        if isinstance(item, Instruction):
+            return len(item.code)
+        elif isinstance(item, asm_cmds._JumpCommand):
+            long = i in long_jumps
+            return len(encoder.jump(item, long)) + (4 if long else 1)
+        return 0
+
+    def _layout(self, items, long_jumps, encoder):
+        """Return the mapping from label to offset for the given jumps."""
+        labels = {}
+        pos = 0
+        for i, item in enumerate(items):
+            if isinstance(item, asm_cmds.Label):
+                if item.label in labels:
+                    raise EncodeError("duplicate label")
+                labels[item.label] = pos
+            pos += self._size(i, item, long_jumps, encoder)
+        return labels
+
+
+def data_bytes(size, init):
+    """Return the bytes of a static data item as written by ASMCode."""
+    if not init:
+        return bytes(size)
+    return _imm_bytes(int(init), size)
@@ -1,9 +1,12 @@
 """Objects for the IL->ASM stage of the compiler."""
 
+import io
 import itertools
+import multiprocessing
 
 import shivyc.asm_cmds as asm_cmds
 import shivyc.spots as spots
+from shivyc.il_opt.cfg import CFG, live_in, live_out
 from shivyc.spots import Spot, RegSpot, MemSpot, LiteralSpot
 
 
@@ -13,10 +16,16 @@ class ASMCode:
     lines (List) - Lines of ASM code recorded. The commands are stored as
     tuples in this list, where the first value is the name of the command and
     the next values are the command arguments.
+    comm (List) - Common symbols, as (name, size, local) tuples.
+    globals (List(str)) - Names declared global.
+    data (List) - Static data, as (name, size, init) tuples.
+    string_literals (List) - String literals, as (name, chars) tuples.
+    label_prefix (str) - Prefix of the labels returned by new_label, or None
+    to use get_label.
 
     """
 
-    def __init__(self):
+    def __init__(self, label_prefix=None):
         """Initialize ASMCode."""
         self.lines = []
         self.comm = []
@@ -24,6 +33,9 @@ class ASMCode:
         self.data = []
         self.string_literals = []
 
+        self.label_prefix = label_prefix
+        self.label_count = 0
+
     def add(self, cmd):
         """Add a command to the code.
 
@@ -40,41 +52,39 @@ class ASMCode:
         ASMCode.label_num += 1
         return f"__shivyc_label{ASMCode.label_num}"
 
+    def new_label(self):
+        """Return a unique label string for use in this code.
+
+        Code generated in a worker process numbers its labels after its own
+        prefix, so they never collide with labels made by other processes.
+        """
+        if self.label_prefix is None:
+            return self.get_label()
+        self.label_count += 1
+        return f"{self.label_prefix}{self.label_count}"
+
     def add_global(self, name):
         """Add a name to the code as global.
 
         name (str) - The name to add.
 
         """
-        self.globals.append(f"\t.global {name}")
+        self.globals.append(name)
 
     def add_data(self, name, size, init):
         """Add static data to the code.
 
         init - the value to initialize `name` to
         """
-        self.data.append(f"{name}:")
-        size_strs = {1: "byte",
-                     2: "word",
-                     4: "int",
-                     8: "quad"}
-
-        if init:
-            self.data.append(f"\t.{size_strs[size]} {init}")
-        else:
-            self.data.append(f"\t.zero {size}")
+        self.data.append((name, size, init))
 
     def add_comm(self, name, size, local):
         """Add a common symbol to the code."""
-        if local:
-            self.comm.append(f"\t.local {name}")
-        self.comm.append(f"\t.comm {name} {size}")
+        self.comm.append((name, size, local))
 
     def add_string_literal(self, name, chars):
         """Add a string literal to the ASM code."""
-        self.string_literals.append(f"{name}:")
-        data = ",".join(str(char) for char in chars)
-        self.string_literals.append(f"\t.byte {data}")
+        self.string_literals.append((name, chars))
 
     def full_code(self):  # noqa: D202
         """Produce the full assembly code.
@@ -83,18 +93,65 @@ class ASMCode:
         assembling.
 
         """
-        header = ["\t.intel_syntax noprefix"]
-        header += self.comm
+        out = io.StringIO()
+        self.write(out)
+        return out.getvalue()
+
+    def write(self, stream, chunk_lines=512):
+        """Write the full assembly code to the given text stream.
+
+        The code is written in chunks of `chunk_lines` lines, so the full
+        assembly source never needs to be built up in memory when `stream`
+        is a file or pipe.
+
+        stream - Text stream with a `write` method.
+        chunk_lines (int) - Number of lines to write at a time.
+
+        """
+        chunk = []
+        for line in self._code_lines():
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                chunk.append("")
+                stream.write("\n".join(chunk))
+                chunk = []
+
+        chunk.append("")
+        stream.write("\n".join(chunk))
+
+    def _code_lines(self):
+        """Yield each line of the full assembly code as a string."""
+        yield "\t.intel_syntax noprefix"
+        for name, size, local in self.comm:
+            if local:
+                yield f"\t.local {name}"
+            yield f"\t.comm {name} {size}"
+
         if self.string_literals or self.data:
-            header += ["\t.section .data"]
-            header += self.data
-            header += self.string_literals
-            header += [""]
+            yield "\t.section .data"
+
+            size_strs = {1: "byte",
+                         2: "word",
+                         4: "int",
+                         8: "quad"}
+            for name, size, init in self.data:
+                yield f"{name}:"
+                if init:
+                    yield f"\t.{size_strs[size]} {init}"
+                else:
+                    yield f"\t.zero {size}"
 
-        header += ["\t.section .text"] + self.globals
-        header += [str(line) for line in self.lines]
+            for name, chars in self.string_literals:
+                yield f"{name}:"
+                yield "\t.byte " + ",".join(str(char) for char in chars)
 
-        return "\n".join(header + ["\t.att_syntax noprefix", ""])
+            yield ""
+
+        yield "\t.section .text"
+        for name in self.globals:
+            yield f"\t.global {name}"
+        yield from map(str, self.lines)
+        yield "\t.att_syntax noprefix"
 
 
 class NodeGraph:
@@ -142,6 +199,10 @@ class NodeGraph:
 
     def add_pref(self, n1, n2):
         """Add a preference edge between n1 and n2."""
+        # A command may prefer its output in the same spot as an input
+        # which is the very same value.
+        if n1 == n2:
+            return
         if n2 not in self._pref[n1]:
             self._pref[n1].append(n2)
         if n1 not in self._pref[n2]:
@@ -250,6 +311,22 @@ class NodeGraph:
                 "\n".join(str((v, self._pref[v])) for v in self._all_nodes))
 
 
+# ASMGen object and global spotmap of the make_asm call which started the
+# current worker process, if any.
+_worker_gen = None
+
+
+def _make_function_asm(index):
+    """Return the ASM lines of the function at the given index.
+
+    This runs in a worker process started by ASMGen.make_asm.
+    """
+    asm_gen, global_spotmap = _worker_gen
+    asm_gen.asm_code = ASMCode(f"__shivyc_f{index}_label")
+    asm_gen._make_asm(list(asm_gen.il_code.commands)[index], global_spotmap)
+    return asm_gen.asm_code.lines
+
+
 class ASMGen:
     """Contains the main logic for generation of the ASM from the IL.
 
@@ -276,27 +353,70 @@ class ASMGen:
         self.offset = 0
 
     def make_asm(self):
-        """Generate ASM code."""
+        """Generate ASM code.
+
+        If the `codegen_jobs` argument is above 1, the functions are
+        generated in that many worker processes. Their code is added in the
+        order of the functions in the IL code, whichever worker finishes
+        first.
+        """
+        global _worker_gen
+
         global_spotmap = self._get_global_spotmap()
-        for func in self.il_code.commands:
-            self.asm_code.add(asm_cmds.Label(func))
-            self._make_asm(self.il_code.commands[func], global_spotmap)
+        funcs = list(self.il_code.commands)
+        jobs = min(self.arguments.codegen_jobs, len(funcs))
+
+        if jobs > 1:
+            # The workers are forked, so they inherit this object rather
+            # than unpickling a copy of all the IL for each function.
+            _worker_gen = self, global_spotmap
+            context = multiprocessing.get_context("fork")
+            try:
+                with context.Pool(jobs) as pool:
+                    func_lines = pool.map(_make_function_asm,
+                                          range(len(funcs)))
+            finally:
+                _worker_gen = None
+
+            for func, lines in zip(funcs, func_lines):
+                self.asm_code.add(asm_cmds.Label(func))
+                self.asm_code.lines += lines
+        else:
+            for func in funcs:
+                self.asm_code.add(asm_cmds.Label(func))
+                self._make_asm(func, global_spotmap)
 
-    def _make_asm(self, commands, global_spotmap):
-        """Generate ASM code for given command list."""
+    def _make_asm(self, func, global_spotmap):
+        """Generate ASM code for the given function."""
+        commands = self.il_code.commands[func]
+        profile = self.il_code.profile.get(func)
+
+        # Stack spots are only assigned for this function.
+        global_spotmap = global_spotmap.copy()
+        self.offset = 0
 
         # Get free values
         free_values = self._get_free_values(commands, global_spotmap)
 
         # If any variable may have its address referenced, assign it a
-        # permanent memory spot if it doesn't yet have one.
-        move_to_mem = []
+        # permanent memory spot if it doesn't yet have one. These spots are
+        # assigned in order of first appearance of each variable, so the
+        # stack layout does not depend on which commands taking an address
+        # survive optimization.
+        referenced = set()
+        for command in commands:
+            for line in command.references().values():
+                referenced.update(line)
+
+        first_seen = {}
         for command in commands:
-            refs = command.references().values()
-            for line in refs:
-                for v in line:
-                    if v not in refs:
-                        move_to_mem.append(v)
+            values = command.inputs() + command.outputs()
+            for line in command.references().values():
+                values += line
+            for v in values:
+                if v in referenced:
+                    first_seen[v] = None
+        move_to_mem = list(first_seen)
 
         # In addition, move all IL values of strange size to memory because
         # they won't fit in a register.
@@ -325,6 +445,12 @@ class ASMGen:
         for v in move_to_mem:
             if v in free_values:
                 self.offset += v.ctype.size
+
+                # Align values of at least 8 bytes, like arrays and most
+                # structs, to 8 bytes so they are copied with aligned moves.
+                if v.ctype.size >= 8:
+                    self.offset += -self.offset % 8
+
                 global_spotmap[v] = MemSpot(spots.RBP, -self.offset)
                 free_values.remove(v)
 
@@ -334,6 +460,11 @@ class ASMGen:
         # Generate conflict and preference graph
         g_bak = self._generate_graph(commands, free_values, live_vars)
 
+        if profile:
+            weights = self._spill_weights(commands, profile)
+        else:
+            weights = None
+
         spilled_nodes = []
 
         while True:
@@ -368,8 +499,13 @@ class ASMGen:
                 # Spill node with highest number of conflicts. This node
                 # will never be a merged node because we merge nodes
                 # conservatively, so any recently merged node can be
-                # simplified immediately.
-                n = max(g.nodes(), key=lambda n: len(g.confs(n)))
+                # simplified immediately. With a profile, the number of
+                # conflicts is weighed against how often the node is used.
+                if weights:
+                    n = max(g.nodes(), key=lambda n: len(g.confs(n)) /
+                            (1 + weights.get(n, 0)))
+                else:
+                    n = max(g.nodes(), key=lambda n: len(g.confs(n)))
                 spilled_nodes.append(n)
 
         # Move any remaining nodes from graph into removed_nodes
@@ -437,6 +573,22 @@ class ASMGen:
 
         return global_spotmap
 
+    def _spill_weights(self, commands, profile):
+        """Return the number of times each value is used or set.
+
+        The count of each command is that of the last label before it
+        which has a count in the profile, or that of the entry block.
+        """
+        weights = {}
+        count = profile[None]
+        for command in commands:
+            label = command.label_name()
+            if label and label in profile:
+                count = profile[label]
+            for v in command.inputs() + command.outputs():
+                weights[v] = weights.get(v, 0) + count
+        return weights
+
     def _get_nondynamic_spot(self, v, num):
         """Get a spot for non-dynamic values.
 
@@ -502,44 +654,25 @@ class ASMGen:
         element is a list of variables live coming into the command and the
         second is a list of the variables live exiting the command
         """
-        # Preprocess all commands to get a mapping from labels to command
-        # number.
-        labels = {c.label_name(): i for i, c in enumerate(commands)
-                  if c.label_name()}
-
-        # Last iteration of live variables
-        prev_live_vars = None
-
-        # This iteration of live variables
-        live_vars = [([], []) for i in range(len(commands))]
-
-        while live_vars != prev_live_vars:
-            prev_live_vars = live_vars[:]
+        free = set(free_values)
+        cfg = CFG(commands)
+        live = live_in(cfg, free)
 
+        live_vars = []
+        for block in cfg.blocks:
             # List of currently live variables
-            cur_live = []
-
-            # Iterate through commands in backwards order
-            for i, command in list(enumerate(commands))[::-1]:
-                # If current command is a jump, add the live inputs of all
-                # possible targets to the current live list.
-                for label in command.targets():
-                    i2 = labels[label]
-                    for v in prev_live_vars[i2][0]:
-                        if v not in cur_live:
-                            cur_live.append(v)
+            cur_live = list(live_out(block, live, free))
 
+            block_live_vars = []
+            for command in reversed(block.commands):
                 # Variables live on output from this command
                 out_live = cur_live[:]
 
-                # Add variables used in this command to current live variables
-                for v in command.inputs():
-                    if v in free_values and v not in cur_live:
-                        cur_live.append(v)
-
-                # Remove variables defined in this command to live variables
+                # Remove variables defined in this command from live
+                # variables. This comes first because a command may read the
+                # previous value of a variable it writes.
                 for v in command.outputs():
-                    if v in free_values:
+                    if v in free:
                         if v in cur_live:
                             cur_live.remove(v)
                         else:
@@ -548,13 +681,21 @@ class ASMGen:
 
                             # TODO: Deal with this more efficiently.
                             # If the output is not live, then we don't actually
-                            # need to perform this computation.
+                            # need to perform this computation. At -O1, the
+                            # dead code elimination pass has already removed
+                            # such commands unless they have side effects.
                             out_live.append(v)
 
+                # Then add variables used in this command to live variables
+                for v in command.inputs():
+                    if v in free and v not in cur_live:
+                        cur_live.append(v)
+
                 # Variables live on input from this command
                 in_live = cur_live[:]
 
-                live_vars[i] = (in_live, out_live)
+                block_live_vars.append((in_live, out_live))
+            live_vars += block_live_vars[::-1]
 
         return live_vars
 
@@ -798,7 +939,9 @@ class ASMGen:
 
         # Generate code for each command
         for i, command in enumerate(commands):
-            self.asm_code.add(asm_cmds.Comment(type(command).__name__.upper()))
+            if self.arguments.verbose_asm:
+                self.asm_code.add(
+                    asm_cmds.Comment(type(command).__name__.upper()))
 
             def get_reg(pref=None, conf=None):
                 if not pref: pref = []
@@ -1,35 +1,73 @@
-"""This module defines all of the C types recognized by the compiler."""
+"""This module defines all of the C types recognized by the compiler.
+
+C types are interned, so that there is only one instance of each type.
+Integer and void types are instantiated once below, struct and union types
+once per declaration, and the other types are looked up in a table when
+they are constructed. The qualified versions of each type are made once,
+too. So, two types are the same exactly when they are the same object,
+and most compatibility checks are identity checks.
+"""
 
 import copy
+import functools
+import types
+import weakref
 
 import shivyc.token_kinds as token_kinds
 
 
+# Maps the class and constructor arguments of each interned type to the
+# type. Entries are removed when their type is no longer used.
+_interned = weakref.WeakValueDictionary()
+
+
+class _Interned(type):
+    """Metaclass of the types looked up in the table when constructed.
+
+    Constructing a type with the same arguments as an existing one returns
+    the existing type. List arguments are compared by their elements.
+    """
+
+    def __call__(cls, *args):
+        """Return the type of this class with the given arguments."""
+        key = (cls,) + tuple(tuple(arg) if isinstance(arg, list) else arg
+                             for arg in args)
+        ctype = _interned.get(key)
+        if ctype is None:
+            ctype = _interned[key] = super().__call__(*args)
+        return ctype
+
+
 class CType:
     """Represents a C type, like `int` or `double` or a struct or union.
 
     size (int) - The result of sizeof on this type.
+    align (int) - The alignment of this type, in bytes.
+    const (bool) - Whether this type is const qualified.
     """
 
-    def __init__(self, size, const=False):
+    def __init__(self, size, align=None):
         """Initialize type."""
         self.size = size
-        self.const = const
+        self.align = align or size
+        self.const = False
 
         # Required because casting to bool is special in C11.
         self._bool = False
 
-        # Required for super hacky struct trick, see the weak_compat
-        # function for the struct.
-        self._orig = self
+        # The unqualified and const versions of this type. The const
+        # version is made when first needed.
+        self._unqual = self
+        self._const = None
 
     def weak_compat(self, other):
         """Check for weak compatibility with `other` ctype.
 
         Two types are "weakly compatible" if their unqualified version are
-        compatible.
+        compatible. Each type is compatible with itself only, unless a
+        subclass says otherwise.
         """
-        raise NotImplementedError
+        return self._unqual is other._unqual
 
     def is_complete(self):
         """Check whether this is a complete type."""
@@ -84,7 +122,8 @@ class CType:
 
     def compatible(self, other):
         """Check whether given `other` C type is compatible with self."""
-        return self.weak_compat(other) and self.const == other.const
+        return self is other or (self.const == other.const
+                                 and self.weak_compat(other))
 
     def is_scalar(self):
         """Check whether this has scalar type."""
@@ -96,15 +135,15 @@ class CType:
 
     def make_const(self):
         """Return a const version of this type."""
-        const_self = copy.copy(self)
-        const_self.const = True
-        return const_self
+        unqual = self._unqual
+        if not unqual._const:
+            unqual._const = copy.copy(unqual)
+            unqual._const.const = True
+        return unqual._const
 
     def make_unqual(self):
         """Return an unqualified version of this type."""
-        unqual_self = copy.copy(self)
-        unqual_self.const = False
-        return unqual_self
+        return self._unqual
 
 
 class IntegerCType(CType):
@@ -122,14 +161,6 @@ class IntegerCType(CType):
         self.signed = signed
         super().__init__(size)
 
-    def weak_compat(self, other):
-        """Check whether two types are compatible."""
-
-        # TODO: _orig stuff is hacky...
-        # Find a more reliable way to talk about types being equal.
-        return (other._orig == self._orig and self.signed == other.signed and
-                self.is_bool() == other.is_bool())
-
     def is_complete(self):
         """Check if this is a complete type."""
         return True
@@ -148,9 +179,8 @@ class IntegerCType(CType):
 
     def make_unsigned(self):
         """Return an unsigned version of this type."""
-        unsig_self = copy.copy(self)
-        unsig_self.signed = False
-        return unsig_self
+        unsig_self = _unsigned.get(self._unqual, self._unqual)
+        return unsig_self.make_const() if self.const else unsig_self
 
 
 class VoidCType(CType):
@@ -164,10 +194,6 @@ class VoidCType(CType):
         """Initialize type."""
         super().__init__(1)
 
-    def weak_compat(self, other):
-        """Return True iff other is a compatible type to self."""
-        return other.is_void()
-
     def is_incomplete(self):
         """Check if this is a complete type."""
         return True
@@ -180,21 +206,26 @@ class VoidCType(CType):
         return True
 
 
-class PointerCType(CType):
+class PointerCType(CType, metaclass=_Interned):
     """Represents a pointer C type.
 
     arg (CType) - Type pointed to.
 
     """
 
-    def __init__(self, arg, const=False):
+    def __init__(self, arg):
         """Initialize type."""
         self.arg = arg
-        super().__init__(8, const)
+        super().__init__(8)
 
     def weak_compat(self, other):
-        """Return True iff other is a compatible type to self."""
-        return other.is_pointer() and self.arg.compatible(other.arg)
+        """Return True iff other is a compatible type to self.
+
+        Pointers to distinct types are compatible when the types pointed
+        to are, like an array of unknown size and one of known size.
+        """
+        return (self._unqual is other._unqual or
+                (other.is_pointer() and self.arg.compatible(other.arg)))
 
     def is_complete(self):
         """Check if this is a complete type."""
@@ -209,7 +240,7 @@ class PointerCType(CType):
         return True
 
 
-class ArrayCType(CType):
+class ArrayCType(CType, metaclass=_Interned):
     """Represents an array C type.
 
     el (CType) - Type of each element in array.
@@ -221,12 +252,13 @@ class ArrayCType(CType):
         """Initialize type."""
         self.el = el
         self.n = n
-        super().__init__((n or 1) * self.el.size)
+        super().__init__((n or 1) * self.el.size, self.el.align)
 
     def compatible(self, other):
         """Return True iff other is a compatible type to self."""
-        return (other.is_array() and self.el.compatible(other.el) and
-                (self.n is None or other.n is None or self.n == other.n))
+        return self is other or (
+            other.is_array() and self.el.compatible(other.el) and
+            (self.n is None or other.n is None or self.n == other.n))
 
     def is_complete(self):
         """Check if this is a complete type."""
@@ -244,7 +276,7 @@ class ArrayCType(CType):
         return True
 
 
-class FunctionCType(CType):
+class FunctionCType(CType, metaclass=_Interned):
     """Represents a function C type.
 
     args (List(CType)) - List of the argument ctypes, from left to right, or
@@ -265,7 +297,9 @@ class FunctionCType(CType):
     def weak_compat(self, other):
         """Return True iff other is a compatible type to self."""
 
-        if not other.is_function():
+        if self._unqual is other._unqual:
+            return True
+        elif not other.is_function():
             return False
         elif not self.ret.compatible(other.ret):
             return False
@@ -287,6 +321,60 @@ class FunctionCType(CType):
         return True
 
 
+class Layout:
+    """The placement of the members of a complete struct or union.
+
+    A layout is made once, when the members of its type are set, and is
+    never changed afterwards.
+
+    size (int) - Size of the type. It includes the padding at the end which
+    keeps the elements of an array of the type aligned.
+    align (int) - Alignment of the type, the largest alignment of a member.
+    offsets (tuple(int)) - Offset of each member, in declaration order.
+    index (Mapping) - Maps the name of each member to an (offset, ctype)
+    tuple. The members of anonymous struct and union members are included,
+    with their offsets from the start of this type.
+    """
+
+    def __init__(self, size, align, offsets, index):  # noqa: D102
+        self.size = size
+        self.align = align
+        self.offsets = offsets
+        self.index = types.MappingProxyType(index)
+
+
+@functools.lru_cache(maxsize=None)
+def _place(union, shapes):
+    """Return the offsets, size, and alignment of a struct or union.
+
+    union (bool) - Whether the members are those of a union.
+    shapes (tuple) - Tuple of the (size, alignment) of each member.
+
+    The result only depends on the sizes and alignments of the members, so
+    it is cached for all types with the same shape, like the structs of a
+    header included in many translation units, or read from many IL files.
+    """
+    offsets = []
+    size = 0
+    align = 1
+    for member_size, member_align in shapes:
+        align = max(align, member_align)
+        if union:
+            offsets.append(0)
+            size = max(size, member_size)
+        else:
+            offset = _round_up(size, member_align)
+            offsets.append(offset)
+            size = offset + member_size
+
+    return tuple(offsets), _round_up(size, align), align
+
+
+def _round_up(n, align):
+    """Return the first multiple of align at or above n."""
+    return -(-n // align) * align
+
+
 class _UnionStructCType(CType):
     """Base class for struct and union C types.
 
@@ -294,23 +382,24 @@ class _UnionStructCType(CType):
 
     members - List of members of this type. Each element of the list should be
     a tuple (str, ctype) where `str` is the string of the identifier used to
-    access that member and ctype is the ctype of that member.
-    complete - Boolean indicating whether this type is complete
+    access that member and ctype is the ctype of that member. The string is
+    None for an anonymous struct or union member, whose own members are
+    accessed as members of this type.
+    layout (Layout) - Layout of the members, or None if this type is
+    incomplete.
     """
 
+    # Whether all members of this type are at offset zero.
+    _union = False
+
     def __init__(self, tag, members=None):
         self.tag = tag
-        self.members = members
-        self.offsets = {}
+        self.members = None
+        self.layout = None
         super().__init__(1)
 
-    def weak_compat(self, other):
-        """Return True if other is a compatible type to self.
-
-        Within a single translation unit, two structs are compatible if
-        they are the exact same declaration.
-        """
-        return self._orig is other._orig
+        if members is not None:
+            self.set_members(members)
 
     def is_complete(self):
         """Check whether this is a complete type."""
@@ -332,50 +421,56 @@ class _UnionStructCType(CType):
 
         If the member does not exist, this function returns None tuple.
         """
-        return self.offsets.get(member, (None, None))
+        if not self.layout:
+            return None, None
+        return self.layout.index.get(member, (None, None))
 
     def set_members(self, members):
-        """Add the given members to this type.
+        """Add the given members to this type and its const version.
 
         The members list is given in the format as described in the class
         description.
         """
-        raise NotImplementedError
+        offsets, size, align = _place(
+            self._union, tuple((ctype.size, ctype.align)
+                               for _, ctype in members))
+
+        index = {}
+        for (member, ctype), offset in zip(members, offsets):
+            if member is None:
+                for name, (inner, inner_ctype) in ctype.layout.index.items():
+                    index[name] = offset + inner, inner_ctype
+            else:
+                index[member] = offset, ctype
+
+        layout = Layout(size, align, offsets, index)
+        for ctype in (self._unqual, self._unqual._const):
+            if ctype:
+                ctype.members = members
+                ctype.layout = layout
+                ctype.size = size
+                ctype.align = align
 
 
 class StructCType(_UnionStructCType):
     """Represents a struct ctype."""
 
-    def set_members(self, members):
-        self.members = members
-
-        cur_offset = 0
-        for member, ctype in members:
-            self.offsets[member] = cur_offset, ctype
-            cur_offset += ctype.size
-
-        self.size = cur_offset
+    pass
 
 
 class UnionCType(_UnionStructCType):
     """Represents a union ctype.
 
-    Similar to struct type, but different offset is used.
+    Similar to struct type, but all members are at offset zero.
     """
 
-    def set_members(self, members):
-        self.members = members
-        self.size = max([ctype.size for _, ctype in members], default=0)
-        for member, ctype in members:
-            self.offsets[member] = 0, ctype
+    _union = True
 
 
 # These definitions are here to permit convenient creation of new integer,
-# char, etc. types. However, DO NOT test whether a ctype is one of these by
-# checking equality. That is, do not use `ctype == ctypes.integer` to check
-# whether `ctype` is an integer. This is because functions like
-# "make_unsigned" or "make_const" return a copy of the type, so equality
-# checking will not work.
+# char, etc. types. Each is the only instance of its unqualified type, but
+# a qualified version is a separate instance, so use `compatible` or
+# `weak_compat` rather than `==` to test whether a ctype is one of these.
 
 
 void = VoidCType()
@@ -400,6 +495,10 @@ unsig_longint = IntegerCType(8, False)
 long_max = 9223372036854775807
 long_min = -9223372036854775808
 
+# The unsigned version of each signed integer type.
+_unsigned = {char: unsig_char, short: unsig_short, integer: unsig_int,
+             longint: unsig_longint}
+
 
 simple_types = {token_kinds.void_kw: void,
                 token_kinds.bool_kw: bool_t,
@@ -0,0 +1,222 @@
+"""Writer for relocatable ELF64 object files.
+
+This module lays out an ASMCode object as a relocatable x86-64 ELF object
+file, using the built-in encoder in asm_encode.py for the .text section.
+The layout of symbols and relocations follows the conventions of the GNU
+assembler: references to local symbols are relocated against the symbol
+of the section that defines them, and global or undefined symbols are
+referenced directly.
+"""
+
+import struct
+
+from shivyc.asm_encode import TextSection, data_bytes
+
+# Section header types
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_RELA = 4
+SHT_NOBITS = 8
+
+# Section header flags
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+SHF_INFO_LINK = 0x40
+
+# Symbol bindings and types
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STT_NOTYPE = 0
+STT_OBJECT = 1
+STT_SECTION = 3
+
+# Special section indices
+SHN_UNDEF = 0
+SHN_COMMON = 0xFFF2
+
+# Indices of the sections in the output file.
+TEXT, RELA_TEXT, DATA, BSS, SYMTAB, STRTAB, SHSTRTAB = range(1, 8)
+section_names = [None, ".text", ".rela.text", ".data", ".bss",
+                 ".symtab", ".strtab", ".shstrtab"]
+
+
+class _Symbol:
+    """A symbol of the object file.
+
+    name (str) - Symbol name, or None for a section symbol
+    section (int) - Index of the defining section, or SHN_UNDEF/SHN_COMMON
+    value (int) - Offset in section, or alignment for common symbols
+    size (int) - Size of the object, or 0 if unknown
+    is_global (bool) - Whether this symbol has global binding
+    kind (int) - One of the STT_* constants
+    """
+
+    def __init__(self, name, section, value=0, size=0, is_global=False,
+                 kind=STT_NOTYPE):  # noqa: D102
+        self.name = name
+        self.section = section
+        self.value = value
+        self.size = size
+        self.is_global = is_global
+        self.kind = kind
+
+
+class _StringTable:
+    """Builder for an ELF string table."""
+
+    def __init__(self):  # noqa: D102
+        self.data = bytearray(b"\0")
+        self.offsets = {"": 0}
+
+    def add(self, name):
+        """Add the given string and return its offset."""
+        if name not in self.offsets:
+            self.offsets[name] = len(self.data)
+            self.data += name.encode() + b"\0"
+        return self.offsets[name]
+
+
+def _comm_align(size):
+    """Return the alignment the assembler gives a global common symbol."""
+    align = 1
+    while align < size and align < 16:
+        align *= 2
+    return align
+
+
+def object_file(asm_code):
+    """Return the bytes of an ELF64 object file for the given ASMCode.
+
+    Raises EncodeError if the code contains an instruction the built-in
+    encoder does not support.
+    """
+    text = TextSection(asm_code.lines)
+    globals_ = set(asm_code.globals)
+
+    # Symbols are created in the order the assembler first sees them.
+    symbols = {}
+
+    def add_symbol(name, section, value=0, size=0, kind=STT_NOTYPE):
+        sym = symbols.get(name)
+        if not sym:
+            sym = _Symbol(name, SHN_UNDEF, is_global=name in globals_)
+            symbols[name] = sym
+        if section != SHN_UNDEF:
+            sym.section, sym.value, sym.size = section, value, size
+            sym.kind = kind
+
+    bss_size = 0
+    for name, size, local in asm_code.comm:
+        if local:
+            add_symbol(name, BSS, bss_size, size, STT_OBJECT)
+            bss_size += size
+        else:
+            add_symbol(name, SHN_COMMON, _comm_align(size), size, STT_OBJECT)
+            symbols[name].is_global = True
+
+    data = bytearray()
+    for name, size, init in asm_code.data:
+        add_symbol(name, DATA, len(data))
+        data += data_bytes(size, init)
+    for name, chars in asm_code.string_literals:
+        add_symbol(name, DATA, len(data))
+        data += bytes(chars)
+
+    for name in asm_code.globals:
+        add_symbol(name, SHN_UNDEF)
+    for name in text.symbols:
+        add_symbol(name, SHN_UNDEF)
+    for name, offset in text.labels.items():
+        add_symbol(name, TEXT, offset)
+
+    # Symbols referenced but never defined are external.
+    for sym in symbols.values():
+        if sym.section == SHN_UNDEF:
+            sym.is_global = True
+
+    # Resolve relocations, using section symbols for local targets.
+    relocs = []
+    section_syms = {}
+    for offset, name, addend, kind in text.relocs:
+        sym = symbols[name]
+        if not sym.is_global:
+            section_syms[sym.section] = None
+            relocs.append((offset, sym.section, sym.value + addend, kind))
+        else:
+            relocs.append((offset, name, addend, kind))
+
+    ordered = [_Symbol("", SHN_UNDEF)]
+    for section in sorted(section_syms):
+        section_syms[section] = len(ordered)
+        ordered.append(_Symbol(None, section, kind=STT_SECTION))
+
+    locals_ = [s for s in symbols.values() if not s.is_global]
+    globals_list = [s for s in symbols.values() if s.is_global]
+    first_global = len(ordered) + len(locals_)
+    ordered += locals_ + globals_list
+    indices = {sym.name: i for i, sym in enumerate(ordered) if sym.name}
+
+    strtab = _StringTable()
+    symtab = bytearray()
+    for sym in ordered:
+        name = strtab.add(sym.name) if sym.name else 0
+        bind = STB_GLOBAL if sym.is_global else STB_LOCAL
+        symtab += struct.pack("<IBBHQQ", name, bind << 4 | sym.kind, 0,
+                              sym.section, sym.value, sym.size)
+
+    rela = bytearray()
+    for offset, target, addend, kind in relocs:
+        if isinstance(target, int):
+            index = section_syms[target]
+        else:
+            index = indices[target]
+        rela += struct.pack("<QQq", offset, index << 32 | kind, addend)
+
+    shstrtab = _StringTable()
+    name_offsets = [shstrtab.add(name or "") for name in section_names]
+
+    # Each entry is (type, flags, contents, size, link, info, align,
+    # entsize).
+    sections = [
+        None,
+        (SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR, text.code,
+         len(text.code), 0, 0, 1, 0),
+        (SHT_RELA, SHF_INFO_LINK, bytes(rela), len(rela), SYMTAB, TEXT,
+         8, 24),
+        (SHT_PROGBITS, SHF_WRITE | SHF_ALLOC, bytes(data), len(data),
+         0, 0, 1, 0),
+        (SHT_NOBITS, SHF_WRITE | SHF_ALLOC, b"", bss_size, 0, 0, 1, 0),
+        (SHT_SYMTAB, 0, bytes(symtab), len(symtab), STRTAB, first_global,
+         8, 24),
+        (SHT_STRTAB, 0, bytes(strtab.data), len(strtab.data), 0, 0, 1, 0),
+        (SHT_STRTAB, 0, bytes(shstrtab.data), len(shstrtab.data),
+         0, 0, 1, 0),
+    ]
+
+    # Lay out the section contents after the 64-byte ELF header.
+    body = bytearray()
+    offsets = [0]
+    for section in sections[1:]:
+        _, _, contents, _, _, _, align, _ = section
+        pos = 64 + len(body)
+        pad = -pos % align
+        body += bytes(pad)
+        offsets.append(64 + len(body))
+        body += contents
+    body += bytes(-(64 + len(body)) % 8)
+    shoff = 64 + len(body)
+
+    headers = bytearray(64)
+    for i, section in enumerate(sections[1:], 1):
+        kind, flags, _, size, link, info, align, entsize = section
+        headers += struct.pack("<IIQQQQIIQQ", name_offsets[i], kind, flags,
+                               0, offsets[i], size, link, info, align,
+                               entsize)
+
+    ident = b"\x7fELF" + bytes([2, 1, 1, 0]) + bytes(8)
+    header = ident + struct.pack("<HHIQQQIHHHHHH", 1, 62, 1, 0, 0, shoff,
+                                 0, 64, 0, 0, 64, len(sections), SHSTRTAB)
+
+    return header + bytes(body) + bytes(headers)
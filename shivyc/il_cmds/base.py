@@ -107,6 +107,36 @@ class ILCommand:
         """
         return []
 
+    def is_pure(self):
+        """Return whether writing its outputs is this command's only effect.
+
+        A pure command does not write memory, transfer control, or
+        otherwise affect anything but the ILValues it outputs, so it can be
+        deleted if none of its outputs are ever read. Note that a pure
+        command may still clobber registers (see `clobber`), because the
+        register allocator accounts for those.
+        """
+        return False
+
+    def replace_values(self, inputs, outputs):
+        """Substitute the ILValues read and written by this command.
+
+        inputs (dict) - Maps ILValues read by this command to the ILValues
+        to read instead.
+        outputs (dict) - Maps ILValues written by this command to the
+        ILValues to write instead.
+
+        Every command stores the values it writes in its `output` or `ret`
+        attribute, and any other ILValue attribute (or list of them) is
+        read, so this default implementation rewrites those attributes.
+        """
+        for name, attr in list(vars(self).items()):
+            mapping = outputs if name in ("output", "ret") else inputs
+            if isinstance(attr, list):
+                setattr(self, name, [mapping.get(a, a) for a in attr])
+            elif attr is not None and not isinstance(attr, (int, str)):
+                setattr(self, name, mapping.get(attr, attr))
+
     def label_name(self):
         """If this command is a label, return its name."""
         return None
@@ -115,6 +145,18 @@ class ILCommand:
         """Return list of any labels to which this command may jump."""
         return []
 
+    def replace_target(self, old, new):
+        """Make this command jump to label `new` wherever it jumps to `old`."""
+        pass
+
+    def falls_through(self):
+        """Return whether the next command may be executed after this one.
+
+        This is False for commands like unconditional jumps and returns,
+        which always transfer control elsewhere.
+        """
+        return True
+
     def make_asm(self, spotmap, home_spots, get_reg, asm_code):
         """Generate assembly code for this command.
 
@@ -5,30 +5,12 @@ from shivyc.il_cmds.base import ILCommand
 from shivyc.spots import MemSpot, LiteralSpot
 
 
-class _GeneralCmp(ILCommand):
-    """_GeneralCmp - base class for the comparison commands.
-
-    IL value output must have int type. arg1, arg2 must have types that can
-    be compared for equality bit-by-bit. No type conversion or promotion is
-    done here.
+class _CmpBase(ILCommand):
+    """Base class for the commands comparing two values arg1 and arg2.
 
+    arg1, arg2 must have types that can be compared for equality
+    bit-by-bit. No type conversion or promotion is done here.
     """
-    signed_cmp_cmd = None
-    unsigned_cmp_cmd = None
-
-    def __init__(self, output, arg1, arg2): # noqa D102
-        self.output = output
-        self.arg1 = arg1
-        self.arg2 = arg2
-
-    def inputs(self): # noqa D102
-        return [self.arg1, self.arg2]
-
-    def outputs(self): # noqa D102
-        return [self.output]
-
-    def rel_spot_conf(self):  # noqa D102
-        return {self.output: [self.arg1, self.arg2]}
 
     def _fix_both_literal_or_mem(self, arg1_spot, arg2_spot, regs,
                                  get_reg, asm_code):
@@ -79,6 +61,69 @@ class _GeneralCmp(ILCommand):
         else:
             return arg1_spot, arg2_spot
 
+    def _compare(self, spotmap, regs, get_reg, asm_code):
+        """Compare arg1 with arg2.
+
+        Adds any called registers to given regs list. Returns whether the
+        arguments were swapped, in which case the comparison emitted is of
+        arg2 with arg1.
+        """
+        arg1_spot, arg2_spot = self._fix_both_literal_or_mem(
+            spotmap[self.arg1], spotmap[self.arg2], regs, get_reg, asm_code)
+        arg1_spot, arg2_spot = self._fix_either_literal64(
+            arg1_spot, arg2_spot, regs, get_reg, asm_code)
+        swapped = self._is_imm(arg1_spot)
+        arg1_spot, arg2_spot = self._fix_literal_wrong_order(
+            arg1_spot, arg2_spot)
+
+        arg_size = self.arg1.ctype.size
+        asm_code.add(asm_cmds.Cmp(arg1_spot, arg2_spot, arg_size))
+        return swapped
+
+    def _jump_command(self, cmp, swapped):
+        """Return the ASM jump taken if the given comparison holds.
+
+        cmp (type) - The _GeneralCmp subclass of the comparison.
+        swapped (bool) - Whether the arguments were swapped by _compare.
+        """
+        if swapped:
+            cmp = swaps[cmp]
+
+        ctype = self.arg1.ctype
+        if ctype.is_pointer() or (ctype.is_integral() and not ctype.signed):
+            return cmp.unsigned_cmp_cmd
+        else:
+            return cmp.signed_cmp_cmd
+
+
+class _GeneralCmp(_CmpBase):
+    """_GeneralCmp - base class for the comparison commands.
+
+    IL value output must have int type. arg1, arg2 must have types that can
+    be compared for equality bit-by-bit. No type conversion or promotion is
+    done here.
+
+    """
+    signed_cmp_cmd = None
+    unsigned_cmp_cmd = None
+
+    def __init__(self, output, arg1, arg2): # noqa D102
+        self.output = output
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def inputs(self): # noqa D102
+        return [self.arg1, self.arg2]
+
+    def outputs(self): # noqa D102
+        return [self.output]
+
+    def is_pure(self):  # noqa D102
+        return True
+
+    def rel_spot_conf(self):  # noqa D102
+        return {self.output: [self.arg1, self.arg2]}
+
     def make_asm(self, spotmap, home_spots, get_reg, asm_code):  # noqa D102
         regs = []
 
@@ -90,32 +135,18 @@ class _GeneralCmp(ILCommand):
         eq_val_spot = LiteralSpot(1)
         asm_code.add(asm_cmds.Mov(result, eq_val_spot, out_size))
 
-        arg1_spot, arg2_spot = self._fix_both_literal_or_mem(
-            spotmap[self.arg1], spotmap[self.arg2], regs, get_reg, asm_code)
-        arg1_spot, arg2_spot = self._fix_either_literal64(
-            arg1_spot, arg2_spot, regs, get_reg, asm_code)
-        arg1_spot, arg2_spot = self._fix_literal_wrong_order(
-            arg1_spot, arg2_spot)
+        swapped = self._compare(spotmap, regs, get_reg, asm_code)
 
-        arg_size = self.arg1.ctype.size
         neq_val_spot = LiteralSpot(0)
-        label = asm_code.get_label()
+        label = asm_code.new_label()
 
-        asm_code.add(asm_cmds.Cmp(arg1_spot, arg2_spot, arg_size))
-        asm_code.add(self.cmp_command()(label))
+        asm_code.add(self._jump_command(type(self), swapped)(label))
         asm_code.add(asm_cmds.Mov(result, neq_val_spot, out_size))
         asm_code.add(asm_cmds.Label(label))
 
         if result != spotmap[self.output]:
             asm_code.add(asm_cmds.Mov(spotmap[self.output], result, out_size))
 
-    def cmp_command(self):
-        ctype = self.arg1.ctype
-        if ctype.is_pointer() or (ctype.is_integral() and not ctype.signed):
-            return self.unsigned_cmp_cmd
-        else:
-            return self.signed_cmp_cmd
-
 
 class NotEqualCmp(_GeneralCmp):
     """NotEqualCmp - checks whether arg1 and arg2 are not equal.
@@ -157,3 +188,49 @@ class LessOrEqCmp(_GeneralCmp):
 class GreaterOrEqCmp(_GeneralCmp):
     signed_cmp_cmd = asm_cmds.Jge
     unsigned_cmp_cmd = asm_cmds.Jae
+
+
+class JumpCmp(_CmpBase):
+    """Jumps to a label if a comparison of arg1 with arg2 holds.
+
+    This has the effect of a comparison followed by a JumpNotZero on its
+    result, but compiles to a single compare and conditional jump.
+
+    cmp (type) - The _GeneralCmp subclass of the comparison.
+    label (str) - Label to jump to.
+    """
+
+    def __init__(self, cmp, arg1, arg2, label): # noqa D102
+        self.cmp = cmp
+        self.arg1 = arg1
+        self.arg2 = arg2
+        self.label = label
+
+    def inputs(self): # noqa D102
+        return [self.arg1, self.arg2]
+
+    def outputs(self): # noqa D102
+        return []
+
+    def targets(self): # noqa D102
+        return [self.label]
+
+    def replace_target(self, old, new):  # noqa D102
+        if self.label == old:
+            self.label = new
+
+    def make_asm(self, spotmap, home_spots, get_reg, asm_code): # noqa D102
+        swapped = self._compare(spotmap, [], get_reg, asm_code)
+        asm_code.add(self._jump_command(self.cmp, swapped)(self.label))
+
+
+# The comparison which holds exactly when the given one does not.
+negations = {EqualCmp: NotEqualCmp, NotEqualCmp: EqualCmp,
+             LessCmp: GreaterOrEqCmp, GreaterOrEqCmp: LessCmp,
+             GreaterCmp: LessOrEqCmp, LessOrEqCmp: GreaterCmp}
+
+# The comparison which holds for (arg2, arg1) exactly when the given one
+# holds for (arg1, arg2).
+swaps = {EqualCmp: EqualCmp, NotEqualCmp: NotEqualCmp,
+         LessCmp: GreaterCmp, GreaterCmp: LessCmp,
+         LessOrEqCmp: GreaterOrEqCmp, GreaterOrEqCmp: LessOrEqCmp}
@@ -41,6 +41,13 @@ class Jump(ILCommand):
     def targets(self): # noqa D102
         return [self.label]
 
+    def replace_target(self, old, new):  # noqa D102
+        if self.label == old:
+            self.label = new
+
+    def falls_through(self):  # noqa D102
+        return False
+
     def make_asm(self, spotmap, home_spots, get_reg, asm_code): # noqa D102
         asm_code.add(asm_cmds.Jmp(self.label))
 
@@ -65,6 +72,10 @@ class _GeneralJump(ILCommand):
     def targets(self): # noqa D102
         return [self.label]
 
+    def replace_target(self, old, new):  # noqa D102
+        if self.label == old:
+            self.label = new
+
     def make_asm(self, spotmap, home_spots, get_reg, asm_code): # noqa D102
         size = self.cond.ctype.size
 
@@ -113,6 +124,9 @@ class Return(ILCommand):
     def clobber(self):  # noqa D102
         return [spots.RAX]
 
+    def falls_through(self):  # noqa D102
+        return False
+
     def abs_spot_pref(self):  # noqa D102
         return {self.arg: [spots.RAX]}
 
@@ -177,17 +191,31 @@ class Call(ILCommand):
         return self.args
 
     def make_asm(self, spotmap, home_spots, get_reg, asm_code): # noqa D102
-        func_spot = spotmap[self.func]
+        func_spot = self._move_args(spotmap, get_reg, asm_code, False)
+        ret_size = self.func.ctype.arg.ret.size
+
+        asm_code.add(asm_cmds.Call(func_spot, None, self.func.ctype.size))
 
+        if not self.void_return and spotmap[self.ret] != spots.RAX:
+            asm_code.add(asm_cmds.Mov(spotmap[self.ret], spots.RAX, ret_size))
+
+    def _move_args(self, spotmap, get_reg, asm_code, reg_only):
+        """Move the arguments into their registers.
+
+        Returns the spot holding the function pointer once the arguments
+        are in place. If reg_only is True, this spot is always a register.
+        """
+        func_spot = spotmap[self.func]
         func_size = self.func.ctype.size
-        ret_size = self.func.ctype.arg.ret.size
+        arg_regs = self.arg_regs[0:len(self.args)]
 
         # Check if function pointer spot will be clobbered by moving the
         # arguments into the correct registers.
-        if spotmap[self.func] in self.arg_regs[0:len(self.args)]:
+        if func_spot in arg_regs or (
+                reg_only and not isinstance(func_spot, spots.RegSpot)):
             # Get a register which isn't one of the unallowed registers.
-            r = get_reg([], self.arg_regs[0:len(self.args)])
-            asm_code.add(asm_cmds.Mov(r, spotmap[self.func], func_size))
+            r = get_reg([], arg_regs + [spotmap[arg] for arg in self.args])
+            asm_code.add(asm_cmds.Mov(r, func_spot, func_size))
             func_spot = r
 
         for arg, reg in zip(self.args, self.arg_regs):
@@ -195,7 +223,36 @@ class Call(ILCommand):
                 continue
             asm_code.add(asm_cmds.Mov(reg, spotmap[arg], arg.ctype.size))
 
-        asm_code.add(asm_cmds.Call(func_spot, None, self.func.ctype.size))
+        return func_spot
 
-        if not self.void_return and spotmap[self.ret] != spots.RAX:
-            asm_code.add(asm_cmds.Mov(spotmap[self.ret], spots.RAX, ret_size))
+
+class TailCall(Call):
+    """Call a given function in place of returning from this one.
+
+    The frame of the current function is torn down before jumping to the
+    called function, which then returns directly to the caller of the
+    current function. The called function's return value is returned as
+    is, so its return type must match that of the current function.
+
+    This must only be used if no pointer into the frame of the current
+    function may be passed to the called function.
+    """
+
+    def __init__(self, func, args): # noqa D102
+        super().__init__(func, args, None)
+
+    def outputs(self): # noqa D102
+        return []
+
+    def falls_through(self):  # noqa D102
+        return False
+
+    def abs_spot_pref(self): # noqa D102
+        return dict(zip(self.args, [[reg] for reg in self.arg_regs]))
+
+    def make_asm(self, spotmap, home_spots, get_reg, asm_code): # noqa D102
+        func_spot = self._move_args(spotmap, get_reg, asm_code, True)
+
+        asm_code.add(asm_cmds.Mov(spots.RSP, spots.RBP, 8))
+        asm_code.add(asm_cmds.Pop(spots.RBP, None, 8))
+        asm_code.add(asm_cmds.JmpTo(func_spot, None, 8))
@@ -28,6 +28,9 @@ class _AddMult(ILCommand):
     def outputs(self): # noqa D102
         return [self.output]
 
+    def is_pure(self):  # noqa D102
+        return True
+
     def rel_spot_pref(self): # noqa D102
         return {self.output: [self.arg1, self.arg2]}
 
@@ -114,6 +117,32 @@ class Mult(_AddMult):
     comm = True
     Inst = asm_cmds.Imul
 
+    def make_asm(self, spotmap, home_spots, get_reg, asm_code): # noqa D102
+        # Multiplying by a power of two is a left shift.
+        for arg, lit in ((self.arg1, self.arg2), (self.arg2, self.arg1)):
+            lit_spot = spotmap[lit]
+            if (not isinstance(lit_spot, spots.LiteralSpot)
+                  or isinstance(spotmap[arg], spots.LiteralSpot)):
+                continue
+
+            val = int(lit_spot.detail)
+            if val <= 0 or val & (val - 1):
+                continue
+
+            size = self.arg1.ctype.size
+            out_spot = spotmap[self.output]
+            temp = get_reg([out_spot, spotmap[arg]])
+            if temp != spotmap[arg]:
+                asm_code.add(asm_cmds.Mov(temp, spotmap[arg], size))
+            if val > 1:
+                shift = spots.LiteralSpot(val.bit_length() - 1)
+                asm_code.add(asm_cmds.Sal(temp, shift, size, 1))
+            if temp != out_spot:
+                asm_code.add(asm_cmds.Mov(out_spot, temp, size))
+            return
+
+        super().make_asm(spotmap, home_spots, get_reg, asm_code)
+
 
 class _BitShiftCmd(ILCommand):
     """Base class for bitwise shift commands."""
@@ -133,6 +162,9 @@ class _BitShiftCmd(ILCommand):
     def outputs(self): # noqa D102
         return [self.output]
 
+    def is_pure(self):  # noqa D102
+        return True
+
     def clobber(self):  # noqa D102
         return [spots.RCX]
 
@@ -208,6 +240,9 @@ class _DivMod(ILCommand):
     def outputs(self):  # noqa D102
         return [self.output]
 
+    def is_pure(self):  # noqa D102
+        return True
+
     def clobber(self):  # noqa D102
         return [spots.RAX, spots.RDX]
 
@@ -301,6 +336,9 @@ class _NegNot(ILCommand):
     def outputs(self):  # noqa D102
         return [self.output]
 
+    def is_pure(self):  # noqa D102
+        return True
+
     def rel_spot_pref(self):  # noqa D102
         return {self.output: [self.arg]}
 
@@ -13,6 +13,10 @@ class _ValueCmd(ILCommand):
     This class defines a helper function for moving data from one location
     to another.
     """
+    # Largest size of data moved with a sequence of mov commands. Larger
+    # data is moved with `rep movsq`.
+    max_unrolled_move = 64
+
     def move_data(self, target_spot, start_spot, size, reg, asm_code):
         """Emits code to move data from start to target.
 
@@ -27,24 +31,77 @@ class _ValueCmd(ILCommand):
         for `reg` to be one of these two, and in fact it is recommended
         that if either of target_spot or start_spot is a register then
         `reg` be equal to that.
+
+        Data larger than max_unrolled_move bytes is moved with `rep movsq`,
+        which clobbers RCX, RSI, and RDI. Commands which may move such data
+        must list these in their clobber list (see move_clobber).
         """
-        # TODO: consider padding everything to 8 bytes to reduce the
-        # number of mov operations emitted for struct copying.
-        shift = 0
-        while shift < size:
-            reg_size = self._reg_size(size - shift)
-            start_spot = start_spot.shift(shift)
-            target_spot = target_spot.shift(shift)
+        if not size:
+            return
+
+        if (size > self.max_unrolled_move and
+              self._move_block(target_spot, start_spot, size, asm_code)):
+            return
+
+        # Move the data in chunks of the largest register size that fits.
+        # If the size is not a multiple of that register size, the last
+        # chunk overlaps the one before it instead of being split into
+        # several smaller moves.
+        reg_size = self._reg_size(min(size, 8))
+        shifts = list(range(0, size - reg_size + 1, reg_size))
+        if size % reg_size:
+            shifts.append(size - reg_size)
+
+        for shift in shifts:
+            start_shifted = start_spot.shift(shift)
+            target_shifted = target_spot.shift(shift)
+
+            if isinstance(start_shifted, LiteralSpot):
+                reg = start_shifted
+            elif reg != start_shifted:
+                asm_code.add(asm_cmds.Mov(reg, start_shifted, reg_size))
+
+            if reg != target_shifted:
+                asm_code.add(asm_cmds.Mov(target_shifted, reg, reg_size))
+
+    def move_clobber(self, size):
+        """Return the registers clobbered by moving data of the given size."""
+        if size > self.max_unrolled_move:
+            return [spots.RCX, spots.RSI, spots.RDI]
+        return []
+
+    def _move_block(self, target_spot, start_spot, size, asm_code):
+        """Emit code to move data between two memory spots with rep movsq.
 
-            if isinstance(start_spot, LiteralSpot):
-                reg = start_spot
-            elif reg != start_spot:
-                asm_code.add(asm_cmds.Mov(reg, start_spot, reg_size))
+        Returns False without emitting anything if the addresses of the
+        spots cannot be loaded into RDI and RSI, because each spot is
+        addressed through the register the other must be loaded into.
+        """
+        def uses(spot, reg):
+            return reg in (spot.base, spot.count)
+
+        if not uses(start_spot, spots.RDI):
+            asm_code.add(asm_cmds.Lea(spots.RDI, target_spot))
+            asm_code.add(asm_cmds.Lea(spots.RSI, start_spot))
+        elif not uses(target_spot, spots.RSI):
+            asm_code.add(asm_cmds.Lea(spots.RSI, start_spot))
+            asm_code.add(asm_cmds.Lea(spots.RDI, target_spot))
+        else:
+            return False
 
-            if reg != target_spot:
-                asm_code.add(asm_cmds.Mov(target_spot, reg, reg_size))
+        count = LiteralSpot(size // 8)
+        asm_code.add(asm_cmds.Mov(spots.RCX, count, 4))
+        asm_code.add(asm_cmds.RepMovsq())
 
-            shift += reg_size
+        # RSI and RDI now point just past the data moved, so move the
+        # remaining bytes with one 8-byte move ending at the end of the data.
+        if size % 8:
+            tail = size % 8 - 8
+            asm_code.add(
+                asm_cmds.Mov(spots.RCX, MemSpot(spots.RSI, tail), 8))
+            asm_code.add(
+                asm_cmds.Mov(MemSpot(spots.RDI, tail), spots.RCX, 8))
+        return True
 
     def _reg_size(self, size):
         """Return largest register size that does not overfit given size."""
@@ -75,6 +132,7 @@ class LoadArg(ILCommand):
 
     def __init__(self, output, arg_num):
         self.output = output
+        self.arg_num = arg_num
         self.arg_reg = self.arg_regs[arg_num]
 
     def inputs(self):
@@ -83,6 +141,9 @@ class LoadArg(ILCommand):
     def outputs(self):
         return [self.output]
 
+    def is_pure(self):  # noqa D102
+        return True
+
     def clobber(self):
         return [self.arg_reg]
 
@@ -116,6 +177,12 @@ class Set(_ValueCmd):
     def outputs(self): # noqa D102
         return [self.output]
 
+    def is_pure(self):  # noqa D102
+        return True
+
+    def clobber(self):  # noqa D102
+        return self.move_clobber(self.output.ctype.size)
+
     def rel_spot_pref(self): # noqa D102
         if self.output.ctype.weak_compat(ctypes.bool_t):
             return {}
@@ -136,6 +203,13 @@ class Set(_ValueCmd):
             out_spot = spotmap[self.output]
             arg_spot = spotmap[self.arg]
             size = self.output.ctype.size
+
+            # A 64-bit immediate can only be moved into a register.
+            if (size == 8 and self._is_imm64(arg_spot)
+                  and not isinstance(out_spot, RegSpot)):
+                r = get_reg()
+                asm_code.add(asm_cmds.Mov(r, arg_spot, size))
+                arg_spot = r
             asm_code.add(asm_cmds.Mov(out_spot, arg_spot, size))
 
         elif self.output.ctype.size <= self.arg.ctype.size:
@@ -187,7 +261,7 @@ class Set(_ValueCmd):
         else:
             arg_spot = spotmap[self.arg]
 
-        label = asm_code.get_label()
+        label = asm_code.new_label()
         output_spot = spotmap[self.output]
 
         zero = LiteralSpot("0")
@@ -217,6 +291,9 @@ class AddrOf(ILCommand):
     def outputs(self):  # noqa D102
         return [self.output]
 
+    def is_pure(self):  # noqa D102
+        return True
+
     def references(self):  # noqa D102
         return {self.output: [self.var]}
 
@@ -246,6 +323,12 @@ class ReadAt(_ValueCmd):
     def outputs(self):  # noqa D102
         return [self.output]
 
+    def is_pure(self):  # noqa D102
+        return True
+
+    def clobber(self):  # noqa D102
+        return self.move_clobber(self.output.ctype.size)
+
     def indir_read(self):  # noqa D102
         return [self.addr]
 
@@ -286,6 +369,9 @@ class SetAt(_ValueCmd):
     def outputs(self):  # noqa D102
         return []
 
+    def clobber(self):  # noqa D102
+        return self.move_clobber(self.val.ctype.size)
+
     def indir_write(self):  # noqa D102
         return [self.addr]
 
@@ -312,22 +398,29 @@ class SetAt(_ValueCmd):
 class _RelCommand(_ValueCmd):
     """Parent class for the relative commands."""
 
-    def __init__(self, val, base, chunk, count):  # noqa D102
+    def __init__(self, val, base, chunk, count, offset):  # noqa D102
         self.val = val
         self.base = base
         self.chunk = chunk
         self.count = count
+        self.offset = offset
 
         # Keep track of which registers have been used from a call to
         # get_reg so we don't accidentally reuse them.
         self._used_regs = []
 
+    def clobber(self):  # noqa D102
+        return self.move_clobber(self.val.ctype.size)
+
     def get_rel_spot(self, spotmap, get_reg, asm_code):
         """Get a relative spot for the relative value."""
+        self._used_regs = []
 
         # If there's no count, we only need to shift by the chunk
         if not self.count:
-            return spotmap[self.base].shift(self.chunk)
+            return spotmap[self.base].shift(self.offset + self.chunk)
+
+        base_spot = spotmap[self.base].shift(self.offset)
 
         # If there is a count in a literal spot, we're good to go. Also,
         # if count is already in a register, we're good to go by just using
@@ -336,7 +429,7 @@ class _RelCommand(_ValueCmd):
         # count).
         if (isinstance(spotmap[self.count], LiteralSpot) or
              isinstance(spotmap[self.count], RegSpot)):
-            return spotmap[self.base].shift(self.chunk, spotmap[self.count])
+            return base_spot.shift(self.chunk, spotmap[self.count])
 
         # Otherwise, move count to a register.
         r = get_reg([], [spotmap[self.val]] + self._used_regs)
@@ -345,7 +438,7 @@ class _RelCommand(_ValueCmd):
         count_size = self.count.ctype.size
         asm_code.add(asm_cmds.Mov(r, spotmap[self.count], count_size))
 
-        return spotmap[self.base].shift(self.chunk, r)
+        return base_spot.shift(self.chunk, r)
 
     def get_reg_spot(self, reg_val, spotmap, get_reg):
         """Get a register or literal spot for self.reg_val."""
@@ -354,7 +447,8 @@ class _RelCommand(_ValueCmd):
              isinstance(spotmap[reg_val], RegSpot)):
             return spotmap[reg_val]
 
-        val_spot = get_reg([], [spotmap[self.count]] + self._used_regs)
+        conf = [spotmap[self.count]] if self.count else []
+        val_spot = get_reg([], conf + self._used_regs)
         self._used_regs.append(val_spot)
         return val_spot
 
@@ -374,18 +468,22 @@ class SetRel(_RelCommand):
     number of chunks of offset. If this value is provided, then `chunk`
     must be in {1, 2, 4, 8}.
 
+    offset - A Python integer added to the address, so that a constant
+    offset and a scaled count can be used together.
+
     In summary, if `count` is provided, then the address of the object
     represented by this LValue is:
 
-        &base + chunk * count
+        &base + offset + chunk * count
 
     and if `count` is not provided, the address is just
 
-        &base + chunk
+        &base + offset + chunk
     """
 
-    def __init__(self, val, base, chunk=0, count=None):  # noqa D102
-        super().__init__(val, base, chunk, count)
+    def __init__(self, val, base, chunk=0, count=None,  # noqa D102
+                 offset=0):
+        super().__init__(val, base, chunk, count, offset)
         self.val = val
 
     def inputs(self):  # noqa D102
@@ -417,8 +515,9 @@ class AddrRel(_RelCommand):
     For further documentation, see SetRel.
 
     """
-    def __init__(self, output, base, chunk=0, count=None):  # noqa D102
-        super().__init__(output, base, chunk, count)
+    def __init__(self, output, base, chunk=0, count=None,  # noqa D102
+                 offset=0):
+        super().__init__(output, base, chunk, count, offset)
         self.output = output
 
     def inputs(self):  # noqa D102
@@ -427,6 +526,13 @@ class AddrRel(_RelCommand):
     def outputs(self):  # noqa D102
         return [self.output]
 
+    def is_pure(self):  # noqa D102
+        return True
+
+    def replace_values(self, inputs, outputs):  # noqa D102
+        super().replace_values(inputs, outputs)
+        self.val = self.output
+
     def references(self):  # noqa D102
         return {self.output: [self.base]}
 
@@ -449,8 +555,9 @@ class ReadRel(_RelCommand):
 
     """
 
-    def __init__(self, output, base, chunk=0, count=None):  # noqa D102
-        super().__init__(output, base, chunk, count)
+    def __init__(self, output, base, chunk=0, count=None,  # noqa D102
+                 offset=0):
+        super().__init__(output, base, chunk, count, offset)
         self.output = output
 
     def inputs(self):  # noqa D102
@@ -459,6 +566,13 @@ class ReadRel(_RelCommand):
     def outputs(self):  # noqa D102
         return [self.output]
 
+    def is_pure(self):  # noqa D102
+        return True
+
+    def replace_values(self, inputs, outputs):  # noqa D102
+        super().replace_values(inputs, outputs)
+        self.val = self.output
+
     def references(self):  # noqa D102
         return {None: [self.base]}
 
@@ -471,3 +585,36 @@ class ReadRel(_RelCommand):
 
         out_size = self.output.ctype.size
         self.move_data(spotmap[self.output], rel_spot, out_size, reg, asm_code)
+
+
+class Phi(ILCommand):
+    """Sets output to a value chosen by the block control came from.
+
+    Phi commands only appear while a function is in SSA form, where they
+    come before all commands of their basic block other than its label.
+    They are replaced by Set commands before ASM generation.
+
+    output - IL value to set.
+    args (dict) - Maps each predecessor BasicBlock to the IL value output
+    takes when control arrives from that block.
+    """
+
+    def __init__(self, output, args=None):  # noqa D102
+        self.output = output
+        self.args = args or {}
+
+    def inputs(self):  # noqa D102
+        return list(self.args.values())
+
+    def outputs(self):  # noqa D102
+        return [self.output]
+
+    def is_pure(self):  # noqa D102
+        return True
+
+    def replace_values(self, inputs, outputs):  # noqa D102
+        self.output = outputs.get(self.output, self.output)
+        self.args = {block: inputs.get(v, v) for block, v in self.args.items()}
+
+    def make_asm(self, spotmap, home_spots, get_reg, asm_code):  # noqa D102
+        raise NotImplementedError("phi command left in IL")
@@ -15,6 +15,10 @@ class ILCode:
     that function.
     cur_func (str) - Name of the function current commands are for
     label_num (int) - Unique identifier returned by get_label
+    profile (dict) - Maps the name of each function laid out using a
+    profile to a dictionary, which maps the labels of its blocks to the
+    number of times they ran when profiled. The None key holds the count of
+    the entry block.
     """
     def __init__(self):
         """Initialize IL code."""
@@ -26,6 +30,7 @@ class ILCode:
         self.static_inits = {}
         self.literals = {}
         self.string_literals = {}
+        self.profile = {}
 
     def copy(self):
         """Make copy of this object.
@@ -38,10 +43,11 @@ class ILCode:
         new.commands = {name: self.commands[name].copy()
                         for name in self.commands}
         new.cur_func = self.cur_func
-        self.label_num = self.label_num
-        self.static_inits = self.static_inits.copy()
-        self.literals = self.literals.copy()
-        self.string_literals = self.string_literals.copy()
+        new.label_num = self.label_num
+        new.static_inits = self.static_inits.copy()
+        new.literals = self.literals.copy()
+        new.string_literals = self.string_literals.copy()
+        new.profile = self.profile.copy()
         return new
 
     def start_func(self, func):
@@ -0,0 +1,680 @@
+"""Interpreter of IL code.
+
+The interpreter runs the IL of a program directly, without generating or
+assembling any code, so it checks quickly what the IL generator and the
+IL optimizations do. It also counts how many IL commands each function
+runs, which measures the effect of an optimization exactly.
+
+Memory is a flat array of bytes. The first `null_size` addresses are
+never valid, so following a null pointer is caught. The stack follows
+them and grows down from its end, like the machine stack. After it come
+the static objects, string literals, and heap, which grow as needed.
+Each function is given a one byte object too, so that pointers to
+functions are distinct addresses.
+
+ILValues whose address may be taken, and those of struct, union or array
+type, are kept in memory. All other values are kept as Python integers in
+the frame of the function using them.
+
+Calls to functions that are not in the IL go to a small shim of the C
+library, which has the functions most test programs use.
+"""
+
+import operator
+import re
+import sys
+
+import shivyc.il_cmds.compare as compare_cmds
+import shivyc.il_cmds.control as control_cmds
+import shivyc.il_cmds.math as math_cmds
+import shivyc.il_cmds.value as value_cmds
+
+# Number of invalid addresses at the start of memory.
+null_size = 0x1000
+
+# Size of the stack, in bytes.
+stack_size = 1 << 20
+
+# Alignment of the objects after the stack, in bytes.
+alignment = 16
+
+# The operation computed by each command of two arguments.
+_arithmetic = {
+    math_cmds.Add: operator.add,
+    math_cmds.Subtr: operator.sub,
+    math_cmds.Mult: operator.mul,
+    math_cmds.LBitShift: operator.lshift,
+    math_cmds.RBitShift: operator.rshift}
+
+# The comparison made by each comparison command.
+_comparisons = {
+    compare_cmds.EqualCmp: operator.eq,
+    compare_cmds.NotEqualCmp: operator.ne,
+    compare_cmds.LessCmp: operator.lt,
+    compare_cmds.GreaterCmp: operator.gt,
+    compare_cmds.LessOrEqCmp: operator.le,
+    compare_cmds.GreaterOrEqCmp: operator.ge}
+
+# A conversion specification in a printf format string.
+_conversion = re.compile(
+    rb"%([-+ #0]*)(\*|\d+)?(?:\.(\*|\d*))?(hh|h|ll|l|z|j|t)?([diouxXcsp%])")
+
+# Number of bits of the argument of each printf length modifier.
+_length_bits = {None: 32, b"hh": 8, b"h": 16, b"l": 64, b"ll": 64,
+                b"z": 64, b"j": 64, b"t": 64}
+
+
+class InterpreterError(Exception):
+    """Raised when the interpreted program cannot continue.
+
+    This happens when it does something undefined, like dividing by zero or
+    following an invalid pointer, or calls a function the interpreter does
+    not have.
+    """
+
+    pass
+
+
+class _Exit(Exception):
+    """Raised when the interpreted program calls exit()."""
+
+    def __init__(self, status):  # noqa: D102
+        super().__init__()
+        self.status = status
+
+
+class _Function:
+    """A function of the IL, prepared for running.
+
+    name (str) - Name of the function.
+    commands (List(ILCommand)) - Commands of the function.
+    labels (dict) - Maps each label to the index of its command.
+    memory (set) - Local values which must be kept in memory.
+    """
+
+    def __init__(self, name, commands):  # noqa: D102
+        self.name = name
+        self.commands = commands
+        self.labels = {command.label_name(): i
+                       for i, command in enumerate(commands)
+                       if command.label_name()}
+
+        self.memory = set()
+        for command in commands:
+            for values in command.references().values():
+                self.memory.update(values)
+            for v in command.inputs() + command.outputs():
+                if v and not v.ctype.is_scalar():
+                    self.memory.add(v)
+
+
+class _Frame:
+    """The state of one call of a function.
+
+    function (_Function) - The function called.
+    args (List(int)) - Values of the arguments.
+    values (dict) - Maps the local values not kept in memory to their
+    current values.
+    addrs (dict) - Maps the local values kept in memory to their addresses.
+    sp (int) - The stack pointer when the function was called.
+    """
+
+    def __init__(self, function, args, sp):  # noqa: D102
+        self.function = function
+        self.args = args
+        self.values = {}
+        self.addrs = {}
+        self.sp = sp
+
+
+class Interpreter:
+    """Interpreter of the IL code of a whole program.
+
+    il_code (ILCode) - IL code of the program. It must not be in SSA form.
+    symbol_table (SymbolTable) - Symbol table of the program.
+    stdout - Text stream to which the program writes its output.
+    counts (dict) - Maps the name of each function to the number of IL
+    commands it ran, not counting labels.
+    """
+
+    def __init__(self, il_code, symbol_table, stdout=None):  # noqa: D102
+        self.il_code = il_code
+        self.symbol_table = symbol_table
+        self.stdout = stdout or sys.stdout
+        self.counts = {name: 0 for name in il_code.commands}
+
+        self.memory = bytearray(null_size + stack_size)
+        self.sp = null_size + stack_size
+        self.brk = len(self.memory)
+
+        self.functions = {}
+        self.statics = {}
+        self.heap = {}
+        self.prepared = {}
+        self.literals = {v: self._wrap(int(value), v.ctype)
+                         for v, value in il_code.literals.items()}
+
+        self.handlers = {
+            control_cmds.Label: lambda command, frame: None,
+            control_cmds.Jump: lambda command, frame: command.label,
+            control_cmds.JumpZero: self._jump_zero,
+            control_cmds.JumpNotZero: self._jump_not_zero,
+            control_cmds.Call: self._call_cmd,
+            compare_cmds.JumpCmp: self._jump_cmp,
+            math_cmds.Div: self._div_mod,
+            math_cmds.Mod: self._div_mod,
+            math_cmds.Neg: self._neg_not,
+            math_cmds.Not: self._neg_not,
+            value_cmds.LoadArg: self._load_arg,
+            value_cmds.Set: self._set_cmd,
+            value_cmds.AddrOf: self._addr_of,
+            value_cmds.ReadAt: self._read_at,
+            value_cmds.SetAt: self._set_at,
+            value_cmds.ReadRel: self._read_rel,
+            value_cmds.SetRel: self._set_rel,
+            value_cmds.AddrRel: self._addr_rel}
+        for cls in _arithmetic:
+            self.handlers[cls] = self._arithmetic
+        for cls in _comparisons:
+            self.handlers[cls] = self._compare
+
+        self.libc = {
+            "printf": self._printf, "puts": self._puts,
+            "putchar": self._putchar, "malloc": self._malloc,
+            "calloc": self._calloc, "realloc": self._realloc,
+            "free": self._free, "strlen": self._strlen,
+            "strcmp": self._strcmp, "strncmp": self._strncmp,
+            "strcpy": self._strcpy, "strncpy": self._strncpy,
+            "memcpy": self._memcpy, "memset": self._memset,
+            "atoi": self._atoi, "abs": self._abs, "exit": self._exit,
+            "isalpha": self._char_test(bytes.isalpha),
+            "isdigit": self._char_test(bytes.isdigit),
+            "isspace": self._char_test(bytes.isspace),
+            "isalnum": self._char_test(bytes.isalnum),
+            "isupper": self._char_test(bytes.isupper),
+            "islower": self._char_test(bytes.islower),
+            "tolower": self._char_map(bytes.lower),
+            "toupper": self._char_map(bytes.upper)}
+
+    def run(self, func="main"):
+        """Run the program from the given function.
+
+        The function is called with an argc of 1 and an argv holding only
+        the program name. Returns the value it returns, or the status
+        passed to exit(). Raises InterpreterError if the program cannot be
+        run to the end.
+        """
+        if func not in self.il_code.commands:
+            raise InterpreterError(f"no function '{func}' to run")
+
+        name = self._alloc(4)
+        self.memory[name:name + 4] = b"out\0"
+        argv = self._alloc(16)
+        self._write_int(argv, name, 8)
+
+        try:
+            return self._call(func, [1, argv]) or 0
+        except _Exit as e:
+            return e.status
+        except RecursionError:
+            raise InterpreterError("call stack too deep")
+
+    def _call(self, name, args):
+        """Call the named function and return its result.
+
+        Tail calls replace the frame of the caller rather than adding a new
+        one, so tail recursion can go arbitrarily deep.
+        """
+        while True:
+            if name not in self.il_code.commands:
+                if name not in self.libc:
+                    err = f"call to unsupported function '{name}'"
+                    raise InterpreterError(err)
+                return self.libc[name](args)
+
+            if name not in self.prepared:
+                self.prepared[name] = _Function(
+                    name, self.il_code.commands[name])
+
+            frame = _Frame(self.prepared[name], args, self.sp)
+            try:
+                result = self._run(frame)
+            finally:
+                self.sp = frame.sp
+
+            if not isinstance(result, control_cmds.TailCall):
+                return result
+            name = self._function_name(self._get(result.func, frame))
+            args = [self._get(arg, frame) for arg in result.args]
+
+    def _run(self, frame):
+        """Run the function of a frame.
+
+        Returns the value it returns, or its final TailCall command.
+        """
+        function = frame.function
+        commands = function.commands
+        labels = function.labels
+        handlers = self.handlers
+        counts = self.counts
+
+        i = 0
+        while i < len(commands):
+            command = commands[i]
+            cls = type(command)
+            i += 1
+
+            if cls is not control_cmds.Label:
+                counts[function.name] += 1
+            if cls is control_cmds.Return:
+                return self._get(command.arg, frame) if command.arg else None
+            elif cls is control_cmds.TailCall:
+                return command
+
+            if cls not in handlers:
+                err = f"cannot interpret {cls.__name__} commands"
+                raise InterpreterError(err)
+            label = handlers[cls](command, frame)
+            if label:
+                i = labels[label]
+        return None
+
+    def _get(self, v, frame):
+        """Return the current value of a scalar ILValue."""
+        if v in frame.values:
+            return frame.values[v]
+        elif v in self.literals:
+            return self.literals[v]
+
+        addr = self._address(v, frame)
+        if addr is None:
+            # The value was never set.
+            return 0
+        return self._read(addr, v.ctype)
+
+    def _set(self, v, value, frame):
+        """Set a scalar ILValue to the given integer."""
+        addr = self._address(v, frame)
+        if addr is None:
+            frame.values[v] = self._wrap(value, v.ctype)
+        else:
+            self._write(addr, value, v.ctype)
+
+    def _address(self, v, frame):
+        """Return the address of an ILValue, or None if not in memory.
+
+        Static objects and function values are placed in memory the first
+        time they are used, and local values at their first use in each
+        call.
+        """
+        if v in frame.addrs:
+            return frame.addrs[v]
+        elif v in self.statics:
+            return self.statics[v]
+
+        storage = self.symbol_table.storage.get(v,
+                                                self.symbol_table.AUTOMATIC)
+        if storage == self.symbol_table.AUTOMATIC:
+            if v in self.il_code.string_literals:
+                addr = self.statics[v] = self._alloc(v.ctype.size)
+                chars = self.il_code.string_literals[v]
+                self.memory[addr:addr + len(chars)] = bytes(
+                    c % 256 for c in chars)
+                return addr
+            elif v not in frame.function.memory:
+                return None
+
+            # Like the machine stack, the stack grows down, and each object
+            # is aligned only to its size.
+            size = v.ctype.size
+            align = min(size & -size, 8) or 1
+            addr = self.sp = (self.sp - size) // align * align
+            if addr < null_size:
+                raise InterpreterError("stack overflow")
+            self.memory[addr:addr + size] = bytes(size)
+            frame.addrs[v] = addr
+            return addr
+
+        elif storage is None:
+            # A function.
+            addr = self.statics[v] = self._alloc(1)
+            self.functions[addr] = self.symbol_table.names[v]
+            return addr
+
+        addr = self.statics[v] = self._alloc(v.ctype.size)
+        if v in self.il_code.static_inits:
+            self._write(addr, self.il_code.static_inits[v], v.ctype)
+        return addr
+
+    def _alloc(self, size):
+        """Return the address of a new zeroed object after the stack."""
+        addr = self.brk
+        self.brk = self._aligned(addr + max(size, 1))
+        self.memory.extend(bytes(self.brk - len(self.memory)))
+        return addr
+
+    def _aligned(self, addr):
+        """Return the first aligned address at or after addr."""
+        return -(-addr // alignment) * alignment
+
+    def _check(self, addr, size):
+        """Raise InterpreterError if the given bytes are not valid."""
+        if addr < null_size or addr + size > len(self.memory):
+            err = f"invalid memory access at address {addr:#x}"
+            raise InterpreterError(err)
+
+    def _read(self, addr, ctype):
+        """Return the scalar value of the given type at addr."""
+        return self._wrap(self._read_int(addr, ctype.size), ctype)
+
+    def _write(self, addr, value, ctype):
+        """Write a scalar value of the given type at addr."""
+        self._write_int(addr, self._wrap(value, ctype), ctype.size)
+
+    def _read_int(self, addr, size):
+        """Return the unsigned integer of the given size at addr."""
+        self._check(addr, size)
+        return int.from_bytes(self.memory[addr:addr + size], "little")
+
+    def _write_int(self, addr, value, size):
+        """Write the integer value in the given number of bytes at addr."""
+        self._check(addr, size)
+        value %= 1 << (8 * size)
+        self.memory[addr:addr + size] = value.to_bytes(size, "little")
+
+    def _copy(self, dest, src, size):
+        """Copy size bytes from src to dest."""
+        self._check(dest, size)
+        self._check(src, size)
+        self.memory[dest:dest + size] = self.memory[src:src + size]
+
+    def _wrap(self, value, ctype):
+        """Return an integer converted to the given scalar type."""
+        if ctype.is_bool():
+            return int(value != 0)
+
+        bits = 8 * ctype.size
+        value %= 1 << bits
+        if ctype.is_integral() and ctype.signed and value >> (bits - 1):
+            value -= 1 << bits
+        return value
+
+    def _function_name(self, addr):
+        """Return the name of the function at the given address."""
+        if addr not in self.functions:
+            err = f"call through invalid function pointer {addr:#x}"
+            raise InterpreterError(err)
+        return self.functions[addr]
+
+    def _move(self, output, addr, frame):
+        """Set output to the object at addr."""
+        if output.ctype.is_scalar():
+            self._set(output, self._read(addr, output.ctype), frame)
+        else:
+            dest = self._address(output, frame)
+            self._copy(dest, addr, output.ctype.size)
+
+    def _store(self, addr, val, frame):
+        """Store the value of val at addr."""
+        if val.ctype.is_scalar():
+            self._write(addr, self._get(val, frame), val.ctype)
+        else:
+            src = self._address(val, frame)
+            self._copy(addr, src, val.ctype.size)
+
+    def _rel_address(self, command, frame):
+        """Return the address a relative command refers to."""
+        addr = self._address(command.base, frame) + command.offset
+        if command.count:
+            return addr + command.chunk * self._get(command.count, frame)
+        return addr + command.chunk
+
+    # The handlers of the commands. Each returns the label to jump to, if
+    # any.
+
+    def _jump_zero(self, command, frame):
+        if not self._get(command.cond, frame):
+            return command.label
+
+    def _jump_not_zero(self, command, frame):
+        if self._get(command.cond, frame):
+            return command.label
+
+    def _jump_cmp(self, command, frame):
+        if _comparisons[command.cmp](self._get(command.arg1, frame),
+                                     self._get(command.arg2, frame)):
+            return command.label
+
+    def _call_cmd(self, command, frame):
+        name = self._function_name(self._get(command.func, frame))
+        args = [self._get(arg, frame) for arg in command.args]
+        result = self._call(name, args)
+        if not command.void_return:
+            self._set(command.ret, result or 0, frame)
+
+    def _arithmetic(self, command, frame):
+        arg1 = self._get(command.arg1, frame)
+        arg2 = self._get(command.arg2, frame)
+        if isinstance(command, math_cmds._BitShiftCmd):
+            # Like the machine, use only the low bits of the shift count.
+            arg2 %= 64 if command.arg1.ctype.size == 8 else 32
+        value = _arithmetic[type(command)](arg1, arg2)
+        self._set(command.output, value, frame)
+
+    def _div_mod(self, command, frame):
+        arg1 = self._get(command.arg1, frame)
+        arg2 = self._get(command.arg2, frame)
+        if not arg2:
+            raise InterpreterError("division by zero")
+
+        # Division in C rounds toward zero.
+        quotient = abs(arg1) // abs(arg2)
+        if (arg1 < 0) != (arg2 < 0):
+            quotient = -quotient
+        if isinstance(command, math_cmds.Div):
+            self._set(command.output, quotient, frame)
+        else:
+            self._set(command.output, arg1 - arg2 * quotient, frame)
+
+    def _neg_not(self, command, frame):
+        arg = self._get(command.arg, frame)
+        value = -arg if isinstance(command, math_cmds.Neg) else ~arg
+        self._set(command.output, value, frame)
+
+    def _compare(self, command, frame):
+        value = _comparisons[type(command)](self._get(command.arg1, frame),
+                                            self._get(command.arg2, frame))
+        self._set(command.output, int(value), frame)
+
+    def _load_arg(self, command, frame):
+        args = frame.args
+        value = args[command.arg_num] if command.arg_num < len(args) else 0
+        self._set(command.output, value, frame)
+
+    def _set_cmd(self, command, frame):
+        if command.output.ctype.is_scalar():
+            self._set(command.output, self._get(command.arg, frame), frame)
+        else:
+            self._move(command.output, self._address(command.arg, frame),
+                       frame)
+
+    def _addr_of(self, command, frame):
+        addr = self._address(command.var, frame)
+        self._set(command.output, addr, frame)
+
+    def _read_at(self, command, frame):
+        self._move(command.output, self._get(command.addr, frame), frame)
+
+    def _set_at(self, command, frame):
+        self._store(self._get(command.addr, frame), command.val, frame)
+
+    def _read_rel(self, command, frame):
+        addr = self._rel_address(command, frame)
+        self._move(command.output, addr, frame)
+
+    def _set_rel(self, command, frame):
+        self._store(self._rel_address(command, frame), command.val, frame)
+
+    def _addr_rel(self, command, frame):
+        addr = self._rel_address(command, frame)
+        self._set(command.output, addr, frame)
+
+    def _string(self, addr):
+        """Return the null-terminated string at addr, without the null."""
+        self._check(addr, 1)
+        end = self.memory.find(0, addr)
+        if end == -1:
+            raise InterpreterError(f"unterminated string at {addr:#x}")
+        return bytes(self.memory[addr:end])
+
+    def _output(self, data):
+        """Write bytes to the standard output of the program."""
+        self.stdout.write(data.decode("utf-8", "replace"))
+
+    # The functions of the C library shim. Each takes the list of argument
+    # values and returns the value of the call.
+
+    def _printf(self, args):
+        args = iter(args)
+        fmt = self._string(next(args))
+
+        out = []
+        start = 0
+        for match in _conversion.finditer(fmt):
+            out.append(fmt[start:match.start()])
+            start = match.end()
+
+            flags, width, precision, length, conv = match.groups()
+            if conv == b"%":
+                out.append(b"%")
+                continue
+
+            if width == b"*":
+                width = str(_signed(next(args, 0), 32)).encode()
+            if precision == b"*":
+                precision = str(_signed(next(args, 0), 32)).encode()
+
+            value = next(args, 0)
+            bits = _length_bits[length]
+            if conv in b"di":
+                value = _signed(value, bits)
+                conv = b"d"
+            elif conv in b"ouxX":
+                value %= 1 << bits
+                conv = b"d" if conv == b"u" else conv
+            elif conv == b"c":
+                value %= 256
+            elif conv == b"s":
+                value = self._string(value)
+            elif conv == b"p":
+                value = b"0x%x" % (value % (1 << 64))
+                conv = b"s"
+
+            spec = b"%" + flags + (width or b"")
+            if precision is not None:
+                spec += b"." + (precision or b"0")
+            out.append((spec + conv) % value)
+        out.append(fmt[start:])
+
+        data = b"".join(out)
+        self._output(data)
+        return len(data)
+
+    def _puts(self, args):
+        self._output(self._string(args[0]) + b"\n")
+        return 1
+
+    def _putchar(self, args):
+        self._output(bytes([args[0] % 256]))
+        return args[0] % 256
+
+    def _malloc(self, args):
+        addr = self._alloc(args[0])
+        self.heap[addr] = args[0]
+        return addr
+
+    def _calloc(self, args):
+        return self._malloc([args[0] * args[1]])
+
+    def _realloc(self, args):
+        self._check_heap(args[0], "realloc")
+        addr = self._malloc([args[1]])
+        if args[0]:
+            self._copy(addr, args[0], min(self.heap[args[0]], args[1]))
+        return addr
+
+    def _free(self, args):
+        self._check_heap(args[0], "free")
+
+    def _check_heap(self, addr, func):
+        """Raise InterpreterError if addr is not null or from malloc."""
+        if addr and addr not in self.heap:
+            raise InterpreterError(f"{func} of invalid pointer {addr:#x}")
+
+    def _strlen(self, args):
+        return len(self._string(args[0]))
+
+    def _strcmp(self, args):
+        return _cmp(self._string(args[0]), self._string(args[1]))
+
+    def _strncmp(self, args):
+        n = args[2]
+        return _cmp(self._string(args[0])[:n], self._string(args[1])[:n])
+
+    def _strcpy(self, args):
+        chars = self._string(args[1]) + b"\0"
+        self._check(args[0], len(chars))
+        self.memory[args[0]:args[0] + len(chars)] = chars
+        return args[0]
+
+    def _strncpy(self, args):
+        n = args[2]
+        chars = self._string(args[1])[:n].ljust(n, b"\0")
+        self._check(args[0], n)
+        self.memory[args[0]:args[0] + n] = chars
+        return args[0]
+
+    def _memcpy(self, args):
+        self._copy(args[0], args[1], args[2])
+        return args[0]
+
+    def _memset(self, args):
+        self._check(args[0], args[2])
+        self.memory[args[0]:args[0] + args[2]] = bytes([args[1] % 256]
+                                                       * args[2])
+        return args[0]
+
+    def _atoi(self, args):
+        match = re.match(rb"\s*([-+]?\d+)", self._string(args[0]))
+        return _signed(int(match.group(1)), 32) if match else 0
+
+    def _abs(self, args):
+        return _signed(abs(args[0]), 32)
+
+    def _exit(self, args):
+        raise _Exit(args[0])
+
+    def _char_test(self, test):
+        """Return the shim of a <ctype.h> function testing a character."""
+        def char_test(args):
+            return int(0 <= args[0] < 128 and test(bytes([args[0]])))
+        return char_test
+
+    def _char_map(self, change):
+        """Return the shim of a <ctype.h> function changing a character."""
+        def char_map(args):
+            if 0 <= args[0] < 128:
+                return change(bytes([args[0]]))[0]
+            return args[0]
+        return char_map
+
+
+def _signed(value, bits):
+    """Return the signed integer of the given width with value's bits."""
+    value %= 1 << bits
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+def _cmp(a, b):
+    """Compare two strings of bytes like strcmp."""
+    return (a > b) - (a < b)
@@ -0,0 +1 @@
+"""Package for analyses and optimizations over the IL."""
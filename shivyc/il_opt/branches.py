@@ -0,0 +1,56 @@
+"""Fusion of comparisons with the conditional jumps reading them.
+
+A condition like `a < b` is computed by a LessCmp, which sets a register
+to 0 or 1, and then tested by a JumpZero or JumpNotZero, which compares
+that register against zero again. When the result of a comparison is read
+only by one conditional jump, this pass replaces the two commands with a
+single JumpCmp, which compiles to one compare and conditional jump.
+"""
+
+import shivyc.il_cmds.compare as compare_cmds
+import shivyc.il_cmds.control as control_cmds
+
+
+def fuse_compare_branches(func):
+    """Replace the comparisons used only by a branch with JumpCmp commands."""
+    uses = {}
+    for block in func.cfg.blocks:
+        for command in block.commands:
+            for v in command.inputs():
+                uses[v] = uses.get(v, 0) + 1
+
+    for block in func.cfg.blocks:
+        commands = block.commands
+        jump = commands[-1] if commands else None
+        if not (isinstance(jump, control_cmds._GeneralJump)
+                and jump.cond in func.versions and uses[jump.cond] == 1):
+            continue
+
+        defs = [i for i, c in enumerate(commands) if jump.cond in c.outputs()]
+        if not defs:
+            continue
+
+        i = defs[0]
+        cmp = commands[i]
+        if not isinstance(cmp, compare_cmds._GeneralCmp) or not all(
+                _preserves(func, c, v) for c in commands[i + 1:-1]
+                for v in cmp.inputs()):
+            continue
+
+        cmp_type = type(cmp)
+        if isinstance(jump, control_cmds.JumpZero):
+            cmp_type = compare_cmds.negations[cmp_type]
+
+        block.commands = commands[:i] + commands[i + 1:-1] + [
+            compare_cmds.JumpCmp(cmp_type, cmp.arg1, cmp.arg2, jump.label)]
+
+
+def _preserves(func, command, v):
+    """Return whether a command leaves the value of v unchanged.
+
+    SSA values and literals never change. Any other value is only known to
+    be unchanged by a pure command which does not write it, since other
+    commands may write memory.
+    """
+    return (v in func.versions or v in func.il_code.literals
+            or (command.is_pure() and v not in command.outputs()))
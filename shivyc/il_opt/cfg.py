@@ -0,0 +1,501 @@
+"""Control-flow graph over the IL commands of a single function.
+
+A CFG splits the flat list of ILCommand objects for one function into basic
+blocks connected by predecessor and successor edges. Passes that edit the
+IL do so through the CFG methods, which keep the edges up to date. The
+dominator tree, dominance frontiers, and loop nesting are computed on
+first use and recomputed only after the shape of the graph changes.
+
+The blocks are kept in layout order, which is the order their commands
+are emitted in. A block which falls through always falls through to the
+block directly after it in the layout.
+"""
+
+from shivyc.il_cmds.control import Jump, Label
+from shivyc.il_cmds.value import Phi
+
+
+class BasicBlock:
+    """A straight-line sequence of IL commands.
+
+    Only the first command of a block may be a label, and only the last
+    command of a block may jump or return. Commands in between may be
+    edited in place in `commands` without notifying the CFG, because they
+    do not affect its edges.
+
+    commands (List(ILCommand)) - Commands in this block, in order.
+    preds (List(BasicBlock)) - Blocks which may execute just before this one.
+    succs (List(BasicBlock)) - Blocks which may execute just after this one.
+    """
+
+    def __init__(self, commands):  # noqa: D102
+        self.commands = commands
+        self.preds = []
+        self.succs = []
+
+    def label(self):
+        """Return the label name starting this block, or None."""
+        if self.commands:
+            return self.commands[0].label_name()
+        return None
+
+    def targets(self):
+        """Return the labels the last command of this block may jump to."""
+        return self.commands[-1].targets() if self.commands else []
+
+    def falls_through(self):
+        """Return whether control may pass to the next block in the layout."""
+        return not self.commands or self.commands[-1].falls_through()
+
+    def phis(self):
+        """Return the Phi commands at the start of this block."""
+        start = 1 if self.label() else 0
+        end = start
+        while end < len(self.commands) and isinstance(self.commands[end], Phi):
+            end += 1
+        return self.commands[start:end]
+
+    def add_at_end(self, commands):
+        """Add commands at the end of this block, before any jump or return.
+
+        A block ending in a conditional jump still falls through after the
+        new commands, so the caller must make sure they are wanted on both
+        paths.
+        """
+        if self.targets() or not self.falls_through():
+            self.commands[-1:-1] = commands
+        else:
+            self.commands += commands
+
+
+class Loop:
+    """A natural loop in the CFG.
+
+    header (BasicBlock) - The single entry block of this loop.
+    blocks (Set(BasicBlock)) - All blocks in this loop, including the blocks
+    of any nested loops.
+    parent (Loop) - Innermost loop containing this one, or None.
+    children (List(Loop)) - Loops directly nested in this one.
+    depth (int) - Nesting depth, 1 for an outermost loop.
+    """
+
+    def __init__(self, header):  # noqa: D102
+        self.header = header
+        self.blocks = {header}
+        self.parent = None
+        self.children = []
+        self.depth = 1
+
+
+class CFG:
+    """Control-flow graph of one function.
+
+    blocks (List(BasicBlock)) - Blocks in layout order. The first block is
+    the entry block, which never has predecessors. The list must only be
+    changed through the methods of this class, which keep the position of
+    each block up to date.
+    """
+
+    def __init__(self, commands):  # noqa: D102
+        block_cmds = [[]]
+        for command in commands:
+            if command.label_name() and block_cmds[-1]:
+                block_cmds.append([])
+            block_cmds[-1].append(command)
+            if command.targets() or not command.falls_through():
+                block_cmds.append([])
+
+        if not block_cmds[-1]:
+            block_cmds.pop()
+
+        # Make sure the entry block is not the target of any jump.
+        if not block_cmds or block_cmds[0][0].label_name():
+            block_cmds.insert(0, [])
+
+        self.blocks = [BasicBlock(cmds) for cmds in block_cmds]
+        self._indices = {}
+        self._reindex(0)
+        self._labels = {}
+        for block in self.blocks:
+            if block.label():
+                self._labels[block.label()] = block
+        for i, block in enumerate(self.blocks):
+            self._link(block, i)
+
+        self._invalidate()
+
+    def entry(self):
+        """Return the entry block."""
+        return self.blocks[0]
+
+    def block_of(self, label):
+        """Return the block starting with the given label."""
+        return self._labels[label]
+
+    def index(self, block):
+        """Return the position of the given block in the layout."""
+        return self._indices[block]
+
+    def commands(self):
+        """Return the flat list of commands in layout order."""
+        return [command for block in self.blocks
+                for command in block.commands]
+
+    def fallthrough(self, block, index=None):
+        """Return the block `block` falls through to, or None.
+
+        index (int) - Position of `block` in the layout, if already known.
+        """
+        if not block.falls_through():
+            return None
+        i = self._indices[block] if index is None else index
+        return self.blocks[i + 1] if i + 1 < len(self.blocks) else None
+
+    # Incremental updates
+
+    def set_commands(self, block, commands):
+        """Replace the commands of the given block.
+
+        The new commands must still form a basic block. If the label
+        starting the block changes, jumps to the old label are not updated.
+        """
+        if block.label():
+            del self._labels[block.label()]
+        block.commands = commands
+        if block.label():
+            self._labels[block.label()] = block
+
+        self._link(block)
+        self._invalidate()
+
+    def insert_block(self, index, commands):
+        """Insert a new block at the given position in the layout.
+
+        Returns the new block. The block before it, if it falls through,
+        now falls through into the new block.
+        """
+        block = BasicBlock(commands)
+        self.blocks.insert(index, block)
+        self._reindex(index)
+        if block.label():
+            self._labels[block.label()] = block
+
+        self._link(block, index)
+        if index > 0:
+            self._link(self.blocks[index - 1], index - 1)
+        self._invalidate()
+        return block
+
+    def remove_block(self, block):
+        """Remove an unreachable block from the CFG.
+
+        Any remaining predecessors must be unreachable too, and are expected
+        to be removed as well.
+        """
+        i = self._indices.pop(block)
+        self.blocks.pop(i)
+        self._reindex(i)
+        if block.label():
+            del self._labels[block.label()]
+
+        for succ in block.succs:
+            succ.preds.remove(block)
+            _drop_phi_args(succ, block)
+        for pred in block.preds:
+            pred.succs.remove(block)
+        block.succs = []
+        block.preds = []
+
+        if i > 0:
+            self._link(self.blocks[i - 1], i - 1)
+        self._invalidate()
+
+    def remove_unreachable(self):
+        """Remove all blocks not reachable from the entry block.
+
+        Returns whether any block was removed.
+        """
+        dead = [block for block in self.blocks if not self.reachable(block)]
+        for block in dead:
+            self.remove_block(block)
+        return bool(dead)
+
+    def split_edge(self, pred, succ, label):
+        """Insert an empty block on the edge from pred to succ.
+
+        The new block starts with a Label command using the given label
+        name, and pred is updated to jump there instead of to succ. Phi
+        inputs for the edge are moved to the new edge into succ. If pred
+        falls through to succ, the new block is placed between them in the
+        layout. Otherwise, it is placed at the end of the function and
+        ends with a jump to succ. Returns the new block.
+        """
+        if self.fallthrough(pred) is succ:
+            index = self._indices[succ]
+            commands = [Label(label)]
+        else:
+            index = len(self.blocks)
+            commands = [Label(label), Jump(succ.label())]
+
+        if succ.label():
+            pred.commands[-1].replace_target(succ.label(), label)
+
+        block = self.insert_block(index, commands)
+        for phi in succ.phis():
+            if pred in phi.args:
+                phi.args[block] = phi.args.pop(pred)
+        self._link(pred)
+        return block
+
+    def _link(self, block, index=None):
+        """Recompute the successors of the given block.
+
+        index (int) - Position of `block` in the layout, if already known.
+        """
+        succs = [self._labels[label] for label in block.targets()]
+        fallthrough = self.fallthrough(block, index)
+        if fallthrough:
+            succs.append(fallthrough)
+
+        for succ in block.succs:
+            succ.preds.remove(block)
+            if succ not in succs:
+                _drop_phi_args(succ, block)
+
+        block.succs = []
+        for succ in succs:
+            if succ not in block.succs:
+                block.succs.append(succ)
+                succ.preds.append(block)
+
+    def _reindex(self, start):
+        """Update the positions of the blocks from the given one onwards."""
+        for i in range(start, len(self.blocks)):
+            self._indices[self.blocks[i]] = i
+
+    def _invalidate(self):
+        """Drop cached analyses after the graph changed."""
+        self._rpo = None
+        self._idom = None
+        self._frontier = None
+        self._loops = None
+
+    # Analyses
+
+    def reverse_postorder(self):
+        """Return the reachable blocks in reverse postorder."""
+        if self._rpo is None:
+            order = []
+            seen = {self.entry()}
+            stack = [(self.entry(), iter(self.entry().succs))]
+            while stack:
+                block, succs = stack[-1]
+                for succ in succs:
+                    if succ not in seen:
+                        seen.add(succ)
+                        stack.append((succ, iter(succ.succs)))
+                        break
+                else:
+                    stack.pop()
+                    order.append(block)
+            self._rpo = order[::-1]
+        return self._rpo
+
+    def reachable(self, block):
+        """Return whether the given block is reachable from the entry."""
+        return block in self._dominators()
+
+    def idom(self, block):
+        """Return the immediate dominator of a reachable block.
+
+        The entry block has no immediate dominator, so returns None for it.
+        """
+        idom = self._dominators()[block]
+        return idom if idom is not block else None
+
+    def dominates(self, a, b):
+        """Return whether block a dominates reachable block b."""
+        while b is not None:
+            if b is a:
+                return True
+            b = self.idom(b)
+        return False
+
+    def dominance_frontier(self, block):
+        """Return the dominance frontier of the given reachable block."""
+        if self._frontier is None:
+            self._frontier = {b: [] for b in self.reverse_postorder()}
+            for b in self.reverse_postorder():
+                preds = [p for p in b.preds if self.reachable(p)]
+                if len(preds) < 2:
+                    continue
+                for pred in preds:
+                    runner = pred
+                    while runner is not self._dominators()[b]:
+                        if b not in self._frontier[runner]:
+                            self._frontier[runner].append(b)
+                        runner = self._dominators()[runner]
+        return self._frontier[block]
+
+    def loops(self):
+        """Return all natural loops, outer loops before the loops they nest.
+
+        Back edges with the same header are merged into one loop.
+        """
+        if self._loops is None:
+            headers = {}
+            for block in self.reverse_postorder():
+                for succ in block.succs:
+                    if self.dominates(succ, block):
+                        loop = headers.setdefault(succ, Loop(succ))
+                        self._fill_loop(loop, block)
+
+            loops = sorted(headers.values(), key=lambda l: -len(l.blocks))
+            for i, loop in enumerate(loops):
+                # The parent is the smallest larger loop containing this one.
+                for outer in reversed(loops[:i]):
+                    if loop.header in outer.blocks:
+                        loop.parent = outer
+                        outer.children.append(loop)
+                        loop.depth = outer.depth + 1
+                        break
+            self._loops = loops
+        return self._loops
+
+    def loop_of(self, block):
+        """Return the innermost loop containing the given block, or None."""
+        best = None
+        for loop in self.loops():
+            if block in loop.blocks and (not best or loop.depth > best.depth):
+                best = loop
+        return best
+
+    def preheader(self, header, get_label):
+        """Return the preheader of the loop with the given header, or None.
+
+        The preheader is a block outside the loop which runs just before
+        every entry to the loop. If the header has a single predecessor
+        outside the loop, the preheader is that predecessor, or a new block
+        on the edge from it if it may also branch elsewhere. If the loop
+        can be entered from several blocks, it has no preheader.
+
+        get_label - Function returning a new unique label name.
+        """
+        loop = next(loop for loop in self.loops() if loop.header is header)
+        outside = [p for p in header.preds if p not in loop.blocks]
+        if len(outside) != 1:
+            return None
+
+        pred = outside[0]
+        if len(pred.succs) > 1 or (pred.targets() and pred.falls_through()):
+            pred = self.split_edge(pred, header, get_label())
+        return pred
+
+    def _fill_loop(self, loop, tail):
+        """Add the blocks of the loop body ending in the given back edge."""
+        stack = [tail]
+        while stack:
+            block = stack.pop()
+            if block not in loop.blocks:
+                loop.blocks.add(block)
+                stack.extend(p for p in block.preds if self.reachable(p))
+
+    def _dominators(self):
+        """Return a dict mapping each reachable block to its idom.
+
+        The entry block maps to itself. This uses the algorithm of Cooper,
+        Harvey, and Kennedy from "A Simple, Fast Dominance Algorithm".
+        """
+        if self._idom is None:
+            order = self.reverse_postorder()
+            index = {block: i for i, block in enumerate(order)}
+            idom = {self.entry(): self.entry()}
+
+            def intersect(a, b):
+                while a is not b:
+                    while index[a] > index[b]:
+                        a = idom[a]
+                    while index[b] > index[a]:
+                        b = idom[b]
+                return a
+
+            changed = True
+            while changed:
+                changed = False
+                for block in order[1:]:
+                    new = None
+                    for pred in block.preds:
+                        if pred in idom:
+                            new = pred if not new else intersect(pred, new)
+                    if idom.get(block) is not new:
+                        idom[block] = new
+                        changed = True
+            self._idom = idom
+        return self._idom
+
+
+def _drop_phi_args(block, pred):
+    """Remove the phi inputs of block for the edge from pred."""
+    for phi in block.phis():
+        phi.args.pop(pred, None)
+
+
+def live_in(cfg, values, reads=None):
+    """Return a dict mapping each block to the values live on entry to it.
+
+    values (Set(ILValue)) - Values to consider.
+    reads - Function returning the values a command reads. Defaults to the
+    inputs of the command.
+
+    The live values of each block are given as a dict with the values as
+    keys, so iterating over them is deterministic. The inputs of a Phi are
+    live at the end of the corresponding predecessor, rather than at the
+    start of the block containing the Phi.
+    """
+    reads = reads or (lambda command: command.inputs())
+
+    uses = {}
+    defs = {}
+    for block in cfg.blocks:
+        uses[block] = {}
+        defs[block] = set()
+        for command in block.commands:
+            if not isinstance(command, Phi):
+                for v in reads(command):
+                    if v in values and v not in defs[block]:
+                        uses[block][v] = None
+            for v in command.outputs():
+                if v in values:
+                    defs[block].add(v)
+
+    # Iterate to a fixed point, visiting blocks in reverse layout order so
+    # most information flows backward in a single pass.
+    live = {block: {} for block in cfg.blocks}
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(cfg.blocks):
+            new = dict(uses[block])
+            for v in live_out(block, live, values):
+                if v not in defs[block]:
+                    new[v] = None
+
+            if new.keys() != live[block].keys():
+                live[block] = new
+                changed = True
+    return live
+
+
+def live_out(block, live, values):
+    """Return the values live on exit from the given block.
+
+    live (dict) - Result of live_in for the CFG containing block.
+    values (Set(ILValue)) - Values passed to live_in.
+    """
+    out = {}
+    for succ in block.succs:
+        out.update(live[succ])
+        for phi in succ.phis():
+            if phi.args.get(block) in values:
+                out[phi.args[block]] = None
+    return out
@@ -0,0 +1,96 @@
+"""Copy propagation.
+
+The IL generator emits a Set command for many casts and temporaries, and
+most of these copy a value without changing it. This pass makes every
+command read the original value instead of such a copy, and then deletes
+the copy.
+
+It also merges a Set which stores a freshly computed temporary to a
+variable in memory into the command computing the temporary, so that
+command writes the variable directly.
+"""
+
+import shivyc.il_cmds.compare as compare_cmds
+import shivyc.il_cmds.math as math_cmds
+from shivyc.il_cmds.value import Set
+
+
+# Commands which can write their output directly to any variable.
+_forwardable = (math_cmds._AddMult, math_cmds._BitShiftCmd,
+                math_cmds._DivMod, math_cmds._NegNot,
+                compare_cmds._GeneralCmp, Set)
+
+
+def signed_int(ctype):
+    """Return whether a scalar type is a signed integer type."""
+    return ctype.is_integral() and ctype.signed
+
+
+def same_repr(a, b):
+    """Return whether values of two scalar types are interchangeable.
+
+    This is the case if the IL commands treat a value of one type exactly
+    as they would the same bits as a value of the other type.
+    """
+    return (a.size == b.size and a.is_bool() == b.is_bool()
+            and signed_int(a) == signed_int(b))
+
+
+def propagate_copies(func):
+    """Run copy propagation on the given function."""
+    cfg = func.cfg
+
+    copies = {}
+    for block in cfg.blocks:
+        for command in block.commands:
+            if (isinstance(command, Set) and command.output in func.versions
+                  and command.arg in func.versions
+                  and same_repr(command.output.ctype, command.arg.ctype)):
+                copies[command.output] = command.arg
+
+    def source(v):
+        """Return the value that v is ultimately a copy of."""
+        while v in copies:
+            v = copies[v]
+        return v
+
+    uses = {}
+    for block in cfg.blocks:
+        commands = []
+        for command in block.commands:
+            if isinstance(command, Set) and command.output in copies:
+                continue
+            command.replace_values({v: source(v) for v in command.inputs()
+                                    if v in copies}, {})
+            for v in command.inputs():
+                uses[v] = uses.get(v, 0) + 1
+            commands.append(command)
+        block.commands = commands
+
+    _forward_stores(func, uses)
+
+
+def _forward_stores(func, uses):
+    """Make commands write directly to the variable their output is stored to.
+
+    This applies where a command computes an SSA value read only by a Set,
+    immediately after it, which writes a variable not in SSA form.
+
+    uses (dict) - Maps each value to the number of commands reading it.
+    """
+    for block in func.cfg.blocks:
+        commands = []
+        for command in block.commands:
+            prev = commands[-1] if commands else None
+            if (isinstance(command, Set) and isinstance(prev, _forwardable)
+                  and command.arg in func.versions
+                  and command.output not in func.versions
+                  and prev.outputs() == [command.arg]
+                  and uses[command.arg] == 1
+                  and command.output not in prev.inputs()
+                  and command.output.ctype.is_scalar()
+                  and same_repr(command.output.ctype, command.arg.ctype)):
+                prev.replace_values({}, {command.arg: command.output})
+                continue
+            commands.append(command)
+        block.commands = commands
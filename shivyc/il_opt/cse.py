@@ -0,0 +1,149 @@
+"""Common subexpression elimination by dominator-based value numbering.
+
+Each arithmetic, comparison, conversion, address, or load command is given
+a key made of its operation and its inputs. If a command with the same key
+was already computed in a block which dominates the current one, the
+command is replaced with a Set copying the earlier result, which copy
+propagation then removes.
+
+A key whose inputs are all SSA values, literals, or addresses names the
+same value wherever it is available. A key which reads memory, either
+through a load or by reading a variable in memory, is only reused within
+the block that computed it, and is forgotten as soon as a command may
+write memory.
+"""
+
+import shivyc.il_cmds.compare as compare_cmds
+import shivyc.il_cmds.control as control_cmds
+import shivyc.il_cmds.math as math_cmds
+import shivyc.il_cmds.value as value_cmds
+from shivyc.il_opt.copyprop import same_repr, signed_int
+
+# Commands which are numbered, those among them whose arguments may be
+# given in either order, and those which read memory.
+_numbered = (math_cmds.Add, math_cmds.Subtr, math_cmds.Mult,
+             value_cmds.AddrOf, value_cmds.AddrRel, compare_cmds._GeneralCmp,
+             value_cmds.Set, value_cmds.ReadAt, value_cmds.ReadRel)
+_commutative = (math_cmds.Add, math_cmds.Mult,
+                compare_cmds.EqualCmp, compare_cmds.NotEqualCmp)
+_loads = (value_cmds.ReadAt, value_cmds.ReadRel)
+
+# First element of the key of a command which only copies a value.
+_copy = "copy"
+
+
+def eliminate_common_subexpressions(func):
+    """Run common subexpression elimination on the given function."""
+    cfg = func.cfg
+    blocks = cfg.reverse_postorder()
+    children = {block: [] for block in blocks}
+    for block in blocks[1:]:
+        children[cfg.idom(block)].append(block)
+
+    # Map each key to the stack of values computing it, innermost last.
+    available = {}
+
+    # Map each SSA value known to equal an earlier one to that value.
+    same = {}
+
+    work = [(cfg.entry(), None)]
+    while work:
+        block, pushed = work.pop()
+        if pushed is not None:
+            for key in pushed:
+                available[key].pop()
+            continue
+
+        pushed = []
+        memory = {}
+        commands = []
+        for command in block.commands:
+            key = _key(func, command, same)
+            if key is None:
+                if _writes_memory(func, command):
+                    memory = {}
+            elif key[0] is _copy:
+                same[command.output] = key[1]
+            else:
+                table = available if key[1] else memory
+                values = table.setdefault(key, [])
+                if values:
+                    same[command.output] = values[-1]
+                    command = value_cmds.Set(command.output, values[-1])
+                else:
+                    values.append(command.output)
+                    if table is available:
+                        pushed.append(key)
+            commands.append(command)
+        block.commands = commands
+
+        work.append((block, pushed))
+        work.extend((child, None) for child in children[block][::-1])
+
+
+def _key(func, command, same):
+    """Return the value numbering key of a command, or None.
+
+    The second element of the key is True if the value computed does not
+    depend on memory. If the command just copies an SSA value without
+    changing it, the key is instead (_copy, value).
+
+    same (dict) - Maps SSA values to the earlier values they equal.
+    """
+    if (not isinstance(command, _numbered) or
+          command.output not in func.versions):
+        return None
+
+    if isinstance(command, value_cmds.Set):
+        # Literals are cheaper to set again than to keep in a register.
+        if command.arg in func.il_code.literals:
+            return None
+
+        arg = same.get(command.arg, command.arg)
+        if arg in func.versions and same_repr(command.output.ctype,
+                                              arg.ctype):
+            return _copy, arg
+
+    if isinstance(command, value_cmds.AddrOf):
+        # The address of a variable never changes.
+        return (value_cmds.AddrOf, True, command.var)
+
+    output = command.output.ctype
+    key = [type(command), True,
+           (output.size, output.is_bool(), signed_int(output))]
+    if isinstance(command, (value_cmds.AddrRel, value_cmds.ReadRel)):
+        key += [command.base, command.chunk, command.offset]
+        args = [command.count] if command.count else []
+    else:
+        args = command.inputs()
+    if isinstance(command, _loads):
+        key[1] = False
+
+    arg_keys = []
+    for arg in args:
+        if arg in func.il_code.literals:
+            arg_keys.append(
+                ("literal", arg.ctype.size, signed_int(arg.ctype),
+                 int(func.il_code.literals[arg])))
+        else:
+            arg = same.get(arg, arg)
+            arg_keys.append(arg)
+            if arg not in func.versions:
+                key[1] = False
+
+    if isinstance(command, compare_cmds._GeneralCmp):
+        # Comparisons read their arguments as the type of the first one.
+        key.append(command.arg1.ctype.is_pointer())
+
+    if isinstance(command, _commutative):
+        key.append(frozenset(arg_keys))
+    else:
+        key.append(tuple(arg_keys))
+    return tuple(key)
+
+
+def _writes_memory(func, command):
+    """Return whether a command may write to a variable in memory."""
+    return (isinstance(command, (control_cmds.Call, value_cmds.SetRel))
+            or command.indir_write()
+            or any(v not in func.versions for v in command.outputs()))
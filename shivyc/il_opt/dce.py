@@ -0,0 +1,133 @@
+"""Dead code and dead store elimination.
+
+A command is dead if it is pure (see ILCommand.is_pure) and nothing ever
+reads its outputs. Dead commands are found by marking every command which
+must run, then every command computing an input of a marked command, and
+deleting the commands left unmarked. This also deletes groups of commands
+which only feed each other, such as a Phi in a loop whose value is never
+used after the loop.
+
+Before that, stores to stack slots which are never read again are deleted.
+A stack slot here is a value in memory, such as a struct, whose address is
+never taken. Such a value can only be read by commands which name it, so
+an ordinary liveness analysis shows which stores to it are dead.
+"""
+
+from shivyc.il_cmds.value import SetRel
+from shivyc.il_opt.cfg import live_in, live_out
+
+
+def eliminate_dead_code(func):
+    """Delete the dead stores and dead commands of the given function."""
+    _eliminate_dead_stores(func)
+
+    defs = {}
+    for block in func.cfg.blocks:
+        for command in block.commands:
+            for v in command.outputs():
+                defs[v] = command
+
+    def required(command):
+        """Return whether the command must run even if its outputs are dead.
+
+        Writes to values which are not in SSA form are always kept, because
+        the value written may be read through a pointer or in a later
+        iteration of a loop.
+        """
+        return (not command.is_pure() or command.indir_write() or
+                any(v not in func.versions for v in command.outputs()))
+
+    marked = set()
+    work = [command for block in func.cfg.blocks
+            for command in block.commands if required(command)]
+    while work:
+        command = work.pop()
+        if command in marked:
+            continue
+        marked.add(command)
+        work += [defs[v] for v in command.inputs() if v in defs]
+
+    for block in func.cfg.blocks:
+        # Only pure commands are deleted, so this never changes the edges of
+        # the CFG.
+        block.commands = [c for c in block.commands if c in marked]
+
+
+def _eliminate_dead_stores(func):
+    """Delete the stores to stack slots which are never read afterward."""
+    cfg = func.cfg
+    slots = _stack_slots(func)
+    if not slots:
+        return
+
+    live = live_in(cfg, slots, _reads)
+    for block in cfg.blocks:
+        cur_live = live_out(block, live, slots)
+
+        commands = []
+        for command in reversed(block.commands):
+            stored = _stored_slots(command, slots)
+            if stored and not any(v in cur_live for v in stored):
+                continue
+
+            for v in command.outputs():
+                cur_live.pop(v, None)
+            for v in _reads(command):
+                if v in slots:
+                    cur_live[v] = None
+            commands.append(command)
+
+        block.commands = commands[::-1]
+
+
+def _stack_slots(func):
+    """Return the set of stack slots of the given function.
+
+    These are the values with automatic storage which are not in SSA form,
+    are not literals, and whose address is never taken.
+    """
+    il_code = func.il_code
+    symbol_table = func.symbol_table
+    commands = func.cfg.commands()
+
+    escaped = set()
+    for command in commands:
+        for key, values in command.references().items():
+            if key is not None:
+                escaped.update(values)
+
+    slots = set()
+    for command in commands:
+        for v in command.inputs() + command.outputs():
+            if (v not in escaped and v not in func.versions
+                  and v not in il_code.literals
+                  and v not in il_code.string_literals
+                  and symbol_table.storage.get(
+                      v, symbol_table.AUTOMATIC) == symbol_table.AUTOMATIC):
+                slots.add(v)
+    return slots
+
+
+def _reads(command):
+    """Return the values read by the given command.
+
+    A SetRel command lists its base object as an input, but it only writes
+    part of the base object without reading it.
+    """
+    if isinstance(command, SetRel):
+        return [v for v in command.inputs() if v is not command.base]
+    return command.inputs()
+
+
+def _stored_slots(command, slots):
+    """Return the stack slots which are the only effect of a command.
+
+    If the command does anything other than store to stack slots, this
+    returns an empty list.
+    """
+    if isinstance(command, SetRel) and command.base in slots:
+        return [command.base]
+    if command.is_pure() and command.outputs() and all(
+            v in slots for v in command.outputs()):
+        return command.outputs()
+    return []
@@ -0,0 +1,200 @@
+"""Strength reduction of induction variables.
+
+A pointer subscript `p[i]` computes the address `p + (long)i * size` from
+scratch. When `i` is a basic induction variable of a loop, meaning it
+is a Phi in the loop header which is increased by the same literal amount
+on every iteration, and `p` does not change in the loop, that address can
+instead be kept in a pointer which is increased by `step * size` on every
+iteration. This pass creates such pointers and replaces the address
+computations with them, leaving the multiplication to dead code
+elimination.
+
+For signed induction variables narrower than a pointer, this relies on
+signed overflow being undefined, so `(long)(i + step)` always equals
+`(long)i + step`.
+"""
+
+import shivyc.ctypes as ctypes
+from shivyc.il_cmds.math import Add, Mult, Subtr
+from shivyc.il_cmds.value import Phi, Set
+from shivyc.il_gen import ILValue
+from shivyc.il_opt.sccp import literal_max
+
+
+def reduce_induction_variables(func):
+    """Run induction variable strength reduction on the given function."""
+    cfg = func.cfg
+    headers = [loop.header for loop in cfg.loops()]
+    preheaders = {h: cfg.preheader(h, func.il_code.get_label)
+                  for h in headers}
+
+    defs = {}
+    for block in cfg.blocks:
+        for command in block.commands:
+            for v in command.outputs():
+                defs[v] = (block, command)
+
+    for loop in cfg.loops():
+        preheader = preheaders.get(loop.header)
+        latches = [p for p in loop.header.preds if p in loop.blocks]
+        if preheader and len(latches) == 1:
+            _LoopReducer(func, loop, preheader, latches[0], defs).run()
+
+
+class _LoopReducer:
+    """Strength reduction of the address computations in one loop.
+
+    func (Function) - Function being optimized.
+    loop (Loop) - Loop being optimized.
+    preheader (BasicBlock) - Preheader of the loop.
+    latch (BasicBlock) - The only block in the loop jumping to its header.
+    defs (dict) - Maps each value to the (block, command) writing it.
+    steps (dict) - Maps each basic induction variable to its step and the
+    command computing its value for the next iteration.
+    """
+
+    def __init__(self, func, loop, preheader, latch, defs):  # noqa: D102
+        self.func = func
+        self.loop = loop
+        self.preheader = preheader
+        self.latch = latch
+        self.defs = defs
+        self.steps = {}
+
+    def run(self):
+        """Replace address computations with pointer induction variables."""
+        self.find_steps()
+
+        # Find the values equal to an induction variable as a long, and the
+        # values equal to one of those times a literal.
+        widened = {iv: iv for iv in self.steps if iv.ctype.size == 8}
+        for block in self.loop.blocks:
+            for command in block.commands:
+                if (isinstance(command, Set) and command.arg in self.steps
+                      and command.output.ctype.size == 8
+                      and command.output.ctype.is_integral()):
+                    widened[command.output] = command.arg
+
+        scaled = {}
+        for block in self.loop.blocks:
+            for command in block.commands:
+                if not isinstance(command, Mult):
+                    continue
+                for arg, factor in ((command.arg1, command.arg2),
+                                    (command.arg2, command.arg1)):
+                    if arg in widened and self.literal(factor) is not None:
+                        scaled[command.output] = (widened[arg], factor)
+
+        pointers = {}
+        replaced = {}
+        for block in self.loop.blocks:
+            for command in block.commands:
+                if not (isinstance(command, Add)
+                        and command.output.ctype.is_pointer()):
+                    continue
+                for base, offset in ((command.arg1, command.arg2),
+                                     (command.arg2, command.arg1)):
+                    if offset in scaled and self.invariant(base):
+                        iv, factor = scaled[offset]
+                        key = (base, iv, self.literal(factor))
+                        if key not in pointers:
+                            pointers[key] = self.make_pointer(
+                                command.output.ctype, base, iv, factor)
+                        if pointers[key]:
+                            replaced[command.output] = pointers[key]
+                        break
+
+        # Read the pointers instead of the values they replace. The
+        # replaced values are written only in the loop, so each pointer
+        # Phi in the header dominates all their uses.
+        if replaced:
+            for block in self.func.cfg.blocks:
+                block.commands = [c for c in block.commands if not any(
+                    v in replaced for v in c.outputs())]
+                for command in block.commands:
+                    command.replace_values(replaced, {})
+
+    def literal(self, v):
+        """Return the integer value of v if it is a literal, or None."""
+        literals = self.func.il_code.literals
+        return int(literals[v]) if v in literals else None
+
+    def invariant(self, v):
+        """Return whether v is an SSA value defined outside the loop."""
+        return v in self.func.versions and (
+            v not in self.defs or self.defs[v][0] not in self.loop.blocks)
+
+    def find_steps(self):
+        """Find the basic induction variables of the loop."""
+        for phi in self.loop.header.phis():
+            ctype = phi.output.ctype
+            if (not ctype.is_integral() or ctype.is_bool()
+                  or (ctype.size != 8 and not ctype.signed)):
+                continue
+
+            nxt = phi.args.get(self.latch)
+            if nxt not in self.defs:
+                continue
+            command = self.defs[nxt][1]
+            if isinstance(command, Add) and command.arg1 is phi.output:
+                step = self.literal(command.arg2)
+            elif isinstance(command, Add) and command.arg2 is phi.output:
+                step = self.literal(command.arg1)
+            elif isinstance(command, Subtr) and command.arg1 is phi.output:
+                step = self.literal(command.arg2)
+                step = -step if step is not None else None
+            else:
+                continue
+
+            if step is not None:
+                self.steps[phi.output] = (phi, step, command)
+
+    def make_pointer(self, ctype, base, iv, factor):
+        """Create a pointer induction variable equal to `base + iv * factor`.
+
+        Returns the output of the Phi holding the pointer, or None if the
+        pointer step does not fit in a literal.
+        """
+        phi, step, step_command = self.steps[iv]
+        ptr_step = step * self.literal(factor)
+        if not -literal_max <= ptr_step < literal_max:
+            return None
+
+        # Compute the first value of the pointer in the preheader.
+        init = ILValue(ctype)
+        offset = ILValue(ctypes.longint)
+        new_values = [init, offset]
+        iv_init = phi.args[self.preheader]
+        if self.literal(iv_init) == 0:
+            self.preheader.add_at_end([Set(init, base)])
+        elif (self.literal(iv_init) is not None and -literal_max <=
+              self.literal(iv_init) * self.literal(factor) < literal_max):
+            self.func.il_code.register_literal_var(
+                offset, self.literal(iv_init) * self.literal(factor))
+            self.preheader.add_at_end([Add(init, base, offset)])
+        else:
+            long_init = ILValue(ctypes.longint)
+            new_values.append(long_init)
+            self.preheader.add_at_end([Set(long_init, iv_init),
+                                       Mult(offset, long_init, factor),
+                                       Add(init, base, offset)])
+
+        # Step the pointer right after the induction variable is stepped.
+        current = ILValue(ctype)
+        nxt = ILValue(ctype)
+        step_lit = ILValue(ctypes.longint)
+        self.func.il_code.register_literal_var(step_lit, ptr_step)
+
+        block = self.defs[step_command.output][0]
+        index = block.commands.index(step_command)
+        block.commands.insert(index + 1, Add(nxt, current, step_lit))
+
+        header = self.loop.header
+        header.commands.insert(
+            (1 if header.label() else 0) + len(header.phis()),
+            Phi(current, {self.preheader: init, self.latch: nxt}))
+
+        for v in new_values + [current, nxt]:
+            if v not in self.func.il_code.literals:
+                self.func.versions[v] = v
+        return current
@@ -0,0 +1,107 @@
+"""Inlining of small functions.
+
+A call to a small function defined in the same file is replaced with a
+copy of the IL of that function. The copy reads the call arguments in
+place of its LoadArg commands, and each Return becomes a Set of the call
+result followed by a jump past the end of the copy. Every automatic
+ILValue and every label of the copy is renamed, so the copy never
+interferes with the caller or with other copies.
+
+A function is inlined if it has at most `limit` IL commands and either has
+internal linkage or makes no calls itself. The function itself is still
+emitted, since it may be called from elsewhere or through a pointer.
+"""
+
+from copy import copy
+
+import shivyc.il_cmds.control as control_cmds
+import shivyc.il_cmds.value as value_cmds
+from shivyc.il_gen import ILValue
+
+
+def inline_calls(il_code, symbol_table, limit):
+    """Inline the calls to small functions throughout il_code.
+
+    Inlining is done one level deep. Calls made by an inlined function are
+    kept as calls in the copy.
+
+    limit (int) - Largest number of IL commands in an inlined function.
+    """
+    functions = {}
+    for value, name in symbol_table.names.items():
+        if name in il_code.commands and value.ctype.is_function():
+            functions[value] = name
+
+    for caller in il_code.commands:
+        commands = il_code.commands[caller]
+        addresses = {c.output: c.var for c in commands
+                     if isinstance(c, value_cmds.AddrOf)}
+
+        new_commands = []
+        for command in commands:
+            callee = None
+            if isinstance(command, control_cmds.Call):
+                value = addresses.get(command.func)
+                callee = functions.get(value)
+
+            if (callee and callee != caller and _inlinable(
+                    il_code, symbol_table, value, callee, limit)):
+                new_commands += _inline(il_code, symbol_table, command,
+                                        il_code.commands[callee])
+            else:
+                new_commands.append(command)
+        il_code.commands[caller] = new_commands
+
+
+def _inlinable(il_code, symbol_table, value, name, limit):
+    """Return whether the given function may be inlined."""
+    commands = il_code.commands[name]
+    if len(commands) > limit:
+        return False
+
+    internal = symbol_table.linkage_type.get(value) == symbol_table.INTERNAL
+    leaf = not any(isinstance(c, control_cmds.Call) for c in commands)
+    return internal or leaf
+
+
+def _inline(il_code, symbol_table, call, body):
+    """Return a renamed copy of body replacing the given Call command."""
+    rename = {}
+    labels = {}
+    for command in body:
+        if command.label_name():
+            labels[command.label_name()] = il_code.get_label()
+
+        for v in command.inputs() + command.outputs():
+            if (v and v not in rename and v not in il_code.literals
+                  and v not in il_code.string_literals
+                  and v not in symbol_table.linkage_type
+                  and symbol_table.storage.get(
+                      v, symbol_table.AUTOMATIC) == symbol_table.AUTOMATIC):
+                rename[v] = ILValue(v.ctype)
+
+    end = il_code.get_label()
+    ret = None if call.void_return else call.ret
+
+    commands = []
+    for i, command in enumerate(body):
+        if isinstance(command, value_cmds.LoadArg):
+            commands.append(value_cmds.Set(rename[command.output],
+                                           call.args[command.arg_num]))
+        elif isinstance(command, control_cmds.Return):
+            if ret and command.arg:
+                commands.append(value_cmds.Set(ret, rename.get(command.arg,
+                                                               command.arg)))
+            if i != len(body) - 1:
+                commands.append(control_cmds.Jump(end))
+        elif command.label_name():
+            commands.append(control_cmds.Label(labels[command.label_name()]))
+        else:
+            command = copy(command)
+            command.replace_values(rename, rename)
+            for label in command.targets():
+                command.replace_target(label, labels[label])
+            commands.append(command)
+
+    commands.append(control_cmds.Label(end))
+    return commands
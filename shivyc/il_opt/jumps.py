@@ -0,0 +1,236 @@
+"""Jump threading and simplification of branch chains.
+
+The IL generator emits many jumps which only lead to other jumps. For
+example, `if(!a)` sets a value to 0 or 1 depending on `a` and then tests
+that value again, and `&&`, `||` and the loop statements add labels and
+jumps around each other. This pass simplifies such chains as follows:
+
+- A block which only tests a value that is set to a literal on the way
+  into it is skipped over, and its predecessor goes straight to the
+  block the test would choose.
+- Jumps to a block containing only an unconditional jump go straight to
+  the target of that jump.
+- A conditional jump over an unconditional jump is replaced by the
+  opposite conditional jump.
+- Jumps to the next command and labels no command jumps to are removed,
+  which merges straight-line blocks.
+
+The pass runs on functions which are not in SSA form, both before the SSA
+passes, so that they see the simpler CFG, and after them, to clean up the
+blocks left over from taking the function out of SSA form.
+"""
+
+import shivyc.il_cmds.compare as compare_cmds
+import shivyc.il_cmds.control as control_cmds
+from shivyc.il_cmds.value import Set
+from shivyc.il_opt.cfg import CFG
+from shivyc.il_opt.ssa import tracked_values
+
+# Largest number of rounds of threading. A chain of tests of literal
+# values can loop forever, so threading is not run until nothing changes.
+max_rounds = 4
+
+
+def thread_jumps(func):
+    """Run jump threading on the given function.
+
+    The function must not be in SSA form. Its CFG is replaced with a new
+    one, which has no unreachable blocks.
+    """
+    tracked = set(tracked_values(func.cfg.commands(), func.il_code,
+                                 func.symbol_table))
+
+    for _ in range(max_rounds):
+        threaded = _thread_known_values(func, tracked)
+        commands = func.cfg.commands()
+        simplified, changed = _simplify(commands)
+
+        func.cfg = CFG(simplified)
+        func.cfg.remove_unreachable()
+        if not threaded and not changed:
+            break
+
+
+def _thread_known_values(func, tracked):
+    """Skip the tests of values known on the way into the testing block.
+
+    Returns whether any jump was changed.
+    """
+    cfg = func.cfg
+    changed = False
+    for block in cfg.blocks[:]:
+        commands = block.commands
+        start = 1 if block.label() else 0
+        if (len(commands) != start + 1
+              or not isinstance(commands[-1], control_cmds._GeneralJump)
+              or not block.label()):
+            continue
+
+        jump = commands[-1]
+        if jump.cond not in tracked and jump.cond not in func.il_code.literals:
+            continue
+
+        for pred in block.preds[:]:
+            value = _known_value(func, pred, jump.cond)
+            if value is None:
+                continue
+
+            if (value == 0) == isinstance(jump, control_cmds.JumpZero):
+                dest = cfg.block_of(jump.label)
+            else:
+                dest = cfg.fallthrough(block)
+            if not dest or dest is block:
+                continue
+
+            if not dest.label():
+                label = control_cmds.Label(func.il_code.get_label())
+                cfg.set_commands(dest, [label] + dest.commands)
+
+            changed |= _redirect(cfg, pred, block, dest)
+    return changed
+
+
+def _known_value(func, block, v):
+    """Return the integer value v has at the end of block, or None.
+
+    The value is found by looking back for a Set of a literal to v, through
+    the blocks which are the only predecessor of the block after them.
+    """
+    literals = func.il_code.literals
+    if v in literals:
+        return int(literals[v])
+
+    seen = set()
+    while block not in seen:
+        seen.add(block)
+        for command in reversed(block.commands):
+            if v not in command.outputs():
+                continue
+            if isinstance(command, Set) and command.arg in literals:
+                return _converted(int(literals[command.arg]), v.ctype)
+            return None
+
+        if len(block.preds) != 1:
+            return None
+        block = block.preds[0]
+    return None
+
+
+def _converted(value, ctype):
+    """Return a value converted to the given integral or pointer type.
+
+    Only whether the result is zero matters, so the sign is ignored.
+    """
+    if ctype.is_bool():
+        return int(value != 0)
+    return value % (1 << (8 * ctype.size))
+
+
+def _redirect(cfg, pred, block, dest):
+    """Make pred go to dest instead of block. Returns whether it did."""
+    jumps = block.label() in pred.targets()
+    falls = cfg.fallthrough(pred) is block
+    if jumps and falls:
+        return False
+
+    jump = control_cmds.Jump(dest.label())
+    if jumps:
+        pred.commands[-1].replace_target(block.label(), dest.label())
+        cfg.set_commands(pred, pred.commands)
+    elif pred.targets():
+        # The block ends in a conditional jump, so the new jump goes in a
+        # block of its own.
+        cfg.insert_block(cfg.index(pred) + 1, [jump])
+    else:
+        cfg.set_commands(pred, pred.commands + [jump])
+    return True
+
+
+def _simplify(commands):
+    """Remove jump chains and redundant jumps from the commands.
+
+    Jump commands are retargeted in place. Returns the new list of commands
+    and whether anything was changed.
+    """
+    changed = False
+    while True:
+        commands, changed_once = _simplify_once(commands)
+        if not changed_once:
+            return commands, changed
+        changed = True
+
+
+def _simplify_once(commands):
+    """Run one round of jump simplification over the given commands.
+
+    Returns the new list of commands and whether anything was changed.
+    """
+    # Map each label starting an otherwise empty block which ends in an
+    # unconditional jump to the target of that jump.
+    forward = {}
+    for i, command in enumerate(commands[:-1]):
+        following = commands[i + 1]
+        if (command.label_name() and isinstance(following, control_cmds.Jump)
+              and following.label != command.label_name()):
+            forward[command.label_name()] = following.label
+
+    changed = False
+    new = []
+    for i, command in enumerate(commands):
+        for label in command.targets():
+            target = _chain_end(forward, label)
+            if target != label:
+                command.replace_target(label, target)
+                changed = True
+
+        following = commands[i + 1] if i + 1 < len(commands) else None
+        after = commands[i + 2] if i + 2 < len(commands) else None
+
+        # Remove a jump to the label right after it.
+        if (isinstance(command, control_cmds.Jump) and following
+              and command.label == following.label_name()):
+            continue
+
+        # Invert a conditional jump over an unconditional jump.
+        if (isinstance(command, (control_cmds._GeneralJump,
+                                 compare_cmds.JumpCmp))
+              and isinstance(following, control_cmds.Jump)
+              and after and command.label == after.label_name()):
+            new.append(invert_jump(command, following.label))
+            commands = commands[:i + 1] + commands[i + 2:]
+            return new + commands[i + 1:], True
+
+        new.append(command)
+
+    targeted = {label for command in new for label in command.targets()}
+    new = [c for c in new if not c.label_name() or c.label_name() in targeted]
+    return new, changed or len(new) != len(commands)
+
+
+def _chain_end(forward, label):
+    """Return the label at the end of the chain of jumps from label.
+
+    forward (dict) - Maps each label starting a block which only jumps to
+    the label it jumps to.
+
+    If the chain loops, the label itself is returned.
+    """
+    seen = {label}
+    end = label
+    while end in forward:
+        end = forward[end]
+        if end in seen:
+            return label
+        seen.add(end)
+    return end
+
+
+def invert_jump(jump, label):
+    """Return a jump to label taken exactly when the given one is not."""
+    if isinstance(jump, control_cmds.JumpZero):
+        return control_cmds.JumpNotZero(jump.cond, label)
+    elif isinstance(jump, control_cmds.JumpNotZero):
+        return control_cmds.JumpZero(jump.cond, label)
+    else:
+        return compare_cmds.JumpCmp(compare_cmds.negations[jump.cmp],
+                                    jump.arg1, jump.arg2, label)
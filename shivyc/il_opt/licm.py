@@ -0,0 +1,103 @@
+"""Loop-invariant code motion.
+
+A command in a loop is invariant if it computes the same value on every
+iteration, because each of its inputs is a literal, an address, or a value
+computed outside the loop (possibly by another invariant command). Such
+commands are moved to the loop's preheader, a block which runs once just
+before the loop is entered.
+
+Only commands that are pure and can never fault are moved, because the
+preheader runs even if the loop body does not. Commands reading a
+variable in memory are only moved out of loops which never write memory.
+Inner loops are handled first, so a command can move out of several
+nested loops.
+"""
+
+import shivyc.il_cmds.control as control_cmds
+import shivyc.il_cmds.math as math_cmds
+import shivyc.il_cmds.value as value_cmds
+
+# Pure commands which may never be moved.
+_fixed = (value_cmds.Phi, value_cmds.LoadArg, value_cmds.ReadAt,
+          value_cmds.ReadRel, math_cmds._DivMod)
+
+
+def hoist_loop_invariants(func):
+    """Run loop-invariant code motion on the given function."""
+    cfg = func.cfg
+
+    # Give every loop a preheader first, so that the preheaders of inner
+    # loops are part of the loops containing them.
+    headers = [loop.header for loop in cfg.loops()]
+    preheaders = {h: cfg.preheader(h, func.il_code.get_label)
+                  for h in headers}
+
+    defs = {}
+    for block in cfg.blocks:
+        for command in block.commands:
+            for v in command.outputs():
+                defs[v] = block
+
+    order = {block: i for i, block in enumerate(cfg.reverse_postorder())}
+    for loop in reversed(cfg.loops()):
+        preheader = preheaders.get(loop.header)
+        if not preheader:
+            continue
+
+        memory_invariant = not _writes_memory(func, loop)
+        hoisted = []
+        for block in sorted(loop.blocks, key=lambda b: order[b]):
+            commands = []
+            for command in block.commands:
+                if _invariant(func, loop, command, defs,
+                              memory_invariant):
+                    hoisted.append(command)
+                    defs[command.output] = preheader
+                else:
+                    commands.append(command)
+            block.commands = commands
+
+        preheader.add_at_end(hoisted)
+
+
+def _invariant(func, loop, command, defs, memory_invariant):
+    """Return whether a command of the given loop can be moved out of it.
+
+    memory_invariant (bool) - Whether variables in memory keep their value
+    throughout the loop.
+    """
+    if (not command.is_pure() or isinstance(command, _fixed)
+          or command.indir_read()
+          or any(v not in func.versions for v in command.outputs())):
+        return False
+
+    # Setting a literal again is cheaper than keeping it in a register
+    # through the loop.
+    if (isinstance(command, value_cmds.Set)
+          and command.arg in func.il_code.literals):
+        return False
+
+    for v in command.inputs():
+        if v in func.il_code.literals or v in func.il_code.string_literals:
+            continue
+        if isinstance(command, value_cmds.AddrOf) and v is command.var:
+            continue
+        if isinstance(command, value_cmds.AddrRel) and v is command.base:
+            continue
+        if v in func.versions:
+            if defs[v] in loop.blocks:
+                return False
+        elif not memory_invariant:
+            return False
+    return True
+
+
+def _writes_memory(func, loop):
+    """Return whether any command of the given loop may write memory."""
+    for block in loop.blocks:
+        for command in block.commands:
+            if (isinstance(command, (control_cmds.Call, value_cmds.SetRel))
+                  or command.indir_write()
+                  or any(v not in func.versions for v in command.outputs())):
+                return True
+    return False
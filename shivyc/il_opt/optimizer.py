@@ -0,0 +1,77 @@
+"""Driver for the IL optimization passes.
+
+The optimizer runs between IL generation and ASM generation. First, calls
+to small functions are inlined. Then each function is split into a CFG,
+its jumps are threaded, and it is put in SSA form. The passes in
+`ssa_passes` are run over it in order, and the function is then taken back
+out of SSA form and its jumps are threaded once more.
+
+Each pass is a function accepting a Function object, which it may modify
+in place.
+"""
+
+from shivyc.il_opt.branches import fuse_compare_branches
+from shivyc.il_opt.cfg import CFG
+from shivyc.il_opt.copyprop import propagate_copies
+from shivyc.il_opt.cse import eliminate_common_subexpressions
+from shivyc.il_opt.dce import eliminate_dead_code
+from shivyc.il_opt.induction import reduce_induction_variables
+from shivyc.il_opt.inline import inline_calls
+from shivyc.il_opt.jumps import thread_jumps
+from shivyc.il_opt.licm import hoist_loop_invariants
+from shivyc.il_opt.sccp import propagate_constants
+from shivyc.il_opt.ssa import tracked_values, to_ssa, from_ssa
+from shivyc.il_opt.tailcall import make_tail_calls
+from shivyc.il_opt.unroll import unroll_loops
+
+
+class Function:
+    """A function being optimized.
+
+    name (str) - Name of the function.
+    cfg (CFG) - Control-flow graph of the function.
+    il_code (ILCode) - IL code the function belongs to.
+    symbol_table (SymbolTable) - Symbol table for the IL code.
+    versions (dict) - Maps each ILValue created while putting the function
+    in SSA form to the variable it is a version of.
+    """
+
+    def __init__(self, name, cfg, il_code, symbol_table):  # noqa: D102
+        self.name = name
+        self.cfg = cfg
+        self.il_code = il_code
+        self.symbol_table = symbol_table
+        self.versions = {}
+
+
+# Passes run on each function while it is in SSA form.
+ssa_passes = [propagate_constants, eliminate_common_subexpressions,
+              propagate_copies, hoist_loop_invariants,
+              reduce_induction_variables, eliminate_dead_code,
+              fuse_compare_branches, make_tail_calls]
+
+
+def optimize(il_code, symbol_table, args):
+    """Optimize the IL code of every function in il_code in place."""
+    if args.inline_limit:
+        inline_calls(il_code, symbol_table, args.inline_limit)
+
+    for name in il_code.commands:
+        cfg = CFG(il_code.commands[name])
+        cfg.remove_unreachable()
+
+        func = Function(name, cfg, il_code, symbol_table)
+        thread_jumps(func)
+        if args.unroll_loops:
+            unroll_loops(func, args.unroll_loops)
+        cfg = func.cfg
+
+        tracked = tracked_values(cfg.commands(), il_code, symbol_table)
+        func.versions = to_ssa(cfg, tracked)
+
+        for ssa_pass in ssa_passes:
+            ssa_pass(func)
+
+        from_ssa(cfg, func.versions, il_code.get_label)
+        thread_jumps(func)
+        il_code.commands[name] = func.cfg.commands()
@@ -0,0 +1,294 @@
+"""Profile-guided block layout.
+
+The IL generator lays out blocks in source order, so the hot path through
+a function often jumps over cold code like error handling. Profiling
+happens in two steps.
+
+With `instrument`, each basic block of the IL is given a counter which is
+incremented whenever the block runs. The counters are stored in a static
+array, which is written to the profile file when the program exits. Each
+function registers the function writing the file on its first call.
+
+With `use_profile`, the counts are read back from the profile file and the
+blocks of each function are reordered so that each block is followed by
+its most frequently run successor. Conditional jumps are inverted where
+needed so the hotter successor is the one falling through. The counts are
+also saved in `il_code.profile` for the register allocator, which prefers
+to spill values used in rarely run code.
+
+Both steps number the blocks of the IL as it comes from the IL generator,
+so the profile must come from a build of the same source file.
+"""
+
+import struct
+import zlib
+
+import shivyc.ctypes as ctypes
+import shivyc.il_cmds.control as control_cmds
+import shivyc.il_cmds.math as math_cmds
+import shivyc.il_cmds.value as value_cmds
+from shivyc.errors import error_collector, CompilerError
+from shivyc.il_gen import ILValue
+from shivyc.il_opt.cfg import CFG
+from shivyc.il_opt.jumps import invert_jump
+
+# Name of the function writing the counts to the profile file at exit.
+write_func = "__shivyc_profile_write"
+
+
+def instrument(il_code, symbol_table, path):
+    """Add block counters to every function in il_code.
+
+    path (str) - Name of the profile file written when the program exits.
+    """
+    cfgs = {name: CFG(il_code.commands[name]) for name in il_code.commands}
+    num_blocks = sum(len(cfg.blocks) for cfg in cfgs.values())
+
+    # The first element of the counter array holds the signature.
+    counts = _static(symbol_table, "__shivyc_profile_counts",
+                     ctypes.ArrayCType(ctypes.longint, num_blocks + 1))
+    registered = _static(symbol_table, "__shivyc_profile_registered",
+                         ctypes.integer)
+    write = _function(symbol_table, write_func, ctypes.void, [],
+                      symbol_table.INTERNAL)
+    void_ptr = ctypes.PointerCType(ctypes.void)
+    atexit = _function(symbol_table, "__cxa_atexit", ctypes.integer,
+                       [ctypes.PointerCType(write.ctype), void_ptr,
+                        void_ptr], symbol_table.EXTERNAL)
+
+    index = 1
+    for name, cfg in cfgs.items():
+        for block in cfg.blocks:
+            commands = block.commands
+            start = 1 if block.label() else 0
+            if block is cfg.entry():
+                while (start < len(commands) and
+                       isinstance(commands[start], value_cmds.LoadArg)):
+                    start += 1
+
+            new = _increment(il_code, counts, index)
+            if block is cfg.entry():
+                new += _register(il_code, registered, write, atexit)
+            block.commands = commands[:start] + new + commands[start:]
+            index += 1
+
+        il_code.commands[name] = cfg.commands()
+
+    il_code.commands[write_func] = _write_counts(
+        il_code, symbol_table, counts, num_blocks, _signature(cfgs), path)
+
+
+def use_profile(il_code, path):
+    """Lay out the blocks of every function in il_code using a profile.
+
+    If the profile file is missing or was made from different code, a
+    warning is issued and the blocks are left in source order.
+    """
+    cfgs = {name: CFG(il_code.commands[name]) for name in il_code.commands}
+    num_blocks = sum(len(cfg.blocks) for cfg in cfgs.values())
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except IOError:
+        err = f"profile file '{path}' not found"
+        error_collector.add(CompilerError(err, warning=True))
+        return
+
+    if len(data) != 8 * (num_blocks + 1):
+        counts = None
+    else:
+        counts = struct.unpack(f"<{num_blocks + 1}q", data)
+    if not counts or counts[0] != _signature(cfgs):
+        err = f"profile file '{path}' does not match the source"
+        error_collector.add(CompilerError(err, warning=True))
+        return
+
+    index = 1
+    for name, cfg in cfgs.items():
+        block_counts = counts[index:index + len(cfg.blocks)]
+        index += len(cfg.blocks)
+        il_code.commands[name] = _lay_out(il_code, cfg, block_counts)
+
+        profile = {None: block_counts[0]}
+        for block, count in zip(cfg.blocks, block_counts):
+            if block.label():
+                profile[block.label()] = count
+        il_code.profile[name] = profile
+
+
+def _signature(cfgs):
+    """Return a number identifying the shape of the given CFGs.
+
+    The result fits in a literal, and is the same for the same IL.
+    """
+    shape = ";".join(f"{name}:{len(cfg.blocks)}"
+                     for name, cfg in cfgs.items())
+    return zlib.crc32(shape.encode()) & 0x7FFFFFFF
+
+
+def _static(symbol_table, name, ctype):
+    """Return a new zero-initialized static variable local to the file."""
+    v = ILValue(ctype)
+    symbol_table.names[v] = name
+    symbol_table.storage[v] = symbol_table.STATIC
+    symbol_table.linkage_type[v] = symbol_table.INTERNAL
+    symbol_table.def_state[v] = symbol_table.TENTATIVE
+    return v
+
+
+def _function(symbol_table, name, ret, args, linkage):
+    """Return a new ILValue for a function with the given signature."""
+    v = ILValue(ctypes.FunctionCType(args, ret, False))
+    symbol_table.names[v] = name
+    symbol_table.storage[v] = None
+    symbol_table.linkage_type[v] = linkage
+    symbol_table.def_state[v] = (symbol_table.DEFINED
+                                 if linkage == symbol_table.INTERNAL
+                                 else symbol_table.UNDEFINED)
+    return v
+
+
+def _literal(il_code, ctype, value):
+    """Return a new literal ILValue."""
+    v = ILValue(ctype)
+    il_code.register_literal_var(v, value)
+    return v
+
+
+def _call(func, args, ret=None):
+    """Return the commands calling func with the given arguments."""
+    ptr = ILValue(ctypes.PointerCType(func.ctype))
+    return [value_cmds.AddrOf(ptr, func),
+            control_cmds.Call(ptr, args, ret)]
+
+
+def _increment(il_code, counts, index):
+    """Return the commands incrementing the counter at the given index."""
+    old = ILValue(ctypes.longint)
+    new = ILValue(ctypes.longint)
+    one = _literal(il_code, ctypes.longint, 1)
+    return [value_cmds.ReadRel(old, counts, 8 * index),
+            math_cmds.Add(new, old, one),
+            value_cmds.SetRel(new, counts, 8 * index)]
+
+
+def _register(il_code, registered, write, atexit):
+    """Return the commands registering write to run at exit on first use.
+
+    The function is registered with `__cxa_atexit`, because `atexit` is
+    not exported by the shared C library.
+    """
+    write_ptr = ILValue(ctypes.PointerCType(write.ctype))
+    null = _literal(il_code, ctypes.PointerCType(ctypes.void), 0)
+    skip = il_code.get_label()
+
+    return ([control_cmds.JumpNotZero(registered, skip),
+             value_cmds.Set(registered, _literal(il_code, ctypes.integer, 1)),
+             value_cmds.AddrOf(write_ptr, write)]
+            + _call(atexit, [write_ptr, null, null], ILValue(ctypes.integer))
+            + [control_cmds.Label(skip)])
+
+
+def _write_counts(il_code, symbol_table, counts, num_blocks, signature,
+                  path):
+    """Return the commands of the function writing the profile file."""
+    void_ptr = ctypes.PointerCType(ctypes.void)
+    char_ptr = ctypes.PointerCType(ctypes.char)
+    ulong = ctypes.unsig_longint
+    ext = symbol_table.EXTERNAL
+
+    fopen = _function(symbol_table, "fopen", void_ptr,
+                      [char_ptr, char_ptr], ext)
+    fwrite = _function(symbol_table, "fwrite", ulong,
+                       [void_ptr, ulong, ulong, void_ptr], ext)
+    fclose = _function(symbol_table, "fclose", ctypes.integer,
+                       [void_ptr], ext)
+
+    strings = []
+    commands = []
+    for chars in (path, "wb"):
+        chars = list(chars.encode()) + [0]
+        string = ILValue(ctypes.ArrayCType(ctypes.char, len(chars)))
+        il_code.register_string_literal(string, chars)
+        strings.append(ILValue(char_ptr))
+        commands.append(value_cmds.AddrOf(strings[-1], string))
+
+    file = ILValue(void_ptr)
+    counts_ptr = ILValue(void_ptr)
+    end = il_code.get_label()
+
+    commands += [value_cmds.SetRel(
+        _literal(il_code, ctypes.longint, signature), counts)]
+    commands += _call(fopen, strings, file)
+    commands += [control_cmds.JumpZero(file, end),
+                 value_cmds.AddrOf(counts_ptr, counts)]
+    commands += _call(fwrite, [counts_ptr, _literal(il_code, ulong, 8),
+                               _literal(il_code, ulong, num_blocks + 1),
+                               file], ILValue(ulong))
+    commands += _call(fclose, [file], ILValue(ctypes.integer))
+    commands += [control_cmds.Label(end), control_cmds.Return()]
+    return commands
+
+
+def _lay_out(il_code, cfg, counts):
+    """Return the commands of cfg with its blocks reordered by counts."""
+    count = dict(zip(cfg.blocks, counts))
+
+    # Each block may become the target of a jump, so it needs a label.
+    for block in cfg.blocks[1:]:
+        if not block.label():
+            label = control_cmds.Label(il_code.get_label())
+            cfg.set_commands(block, [label] + block.commands)
+
+    order = _block_order(cfg, count)
+
+    commands = []
+    for i, block in enumerate(order):
+        after = order[i + 1] if i + 1 < len(order) else None
+        block_cmds = block.commands[:]
+        last = block_cmds[-1] if block_cmds else None
+        fallthrough = cfg.fallthrough(block)
+
+        if fallthrough and fallthrough is not after:
+            if (last and last.targets()
+                  and cfg.block_of(last.label) is after):
+                # Jump to the old fallthrough block when the condition
+                # fails, and fall through to the old target otherwise.
+                block_cmds[-1] = invert_jump(last, fallthrough.label())
+            else:
+                block_cmds.append(control_cmds.Jump(fallthrough.label()))
+        elif (isinstance(last, control_cmds.Jump) and after
+              and last.label == after.label()):
+            block_cmds.pop()
+
+        commands += block_cmds
+    return commands
+
+
+def _block_order(cfg, count):
+    """Return the blocks of cfg in their new layout order.
+
+    Blocks are placed in traces. Each trace starts at the hottest block not
+    yet placed and repeatedly continues with the hottest successor not yet
+    placed. Blocks which never ran are placed last, in source order, and
+    the entry block always stays first.
+    """
+    hot = sorted((b for b in cfg.blocks[1:] if count[b]),
+                 key=lambda b: -count[b])
+    cold = [b for b in cfg.blocks[1:] if not count[b]]
+
+    order = []
+    placed = set()
+    for block in [cfg.entry()] + hot + cold:
+        while block and block not in placed:
+            order.append(block)
+            placed.add(block)
+
+            # List the fallthrough first so it wins ties.
+            succs = [s for s in [cfg.fallthrough(block)] +
+                     [cfg.block_of(label) for label in block.targets()]
+                     if s and s not in placed
+                     and (count[s] or not count[block])]
+            block = max(succs, key=lambda s: count[s]) if succs else None
+    return order
@@ -0,0 +1,313 @@
+"""Sparse conditional constant propagation.
+
+This pass finds the SSA values which are constant on every path through a
+function, treating branches on constant conditions as taken in only one
+direction. It follows the algorithm of Wegman and Zadeck, "Constant
+Propagation with Conditional Branches".
+
+Each SSA value starts out as UNKNOWN. As the pass discovers blocks that
+can execute, values move to a known constant, or to VARYING if they can
+take more than one value. Afterward, constant values are computed with a
+Set from a literal, branches on constants become plain jumps or fall
+through, and blocks which can never execute are removed.
+"""
+
+import shivyc.ctypes as ctypes
+import shivyc.il_cmds.compare as compare_cmds
+import shivyc.il_cmds.control as control_cmds
+import shivyc.il_cmds.math as math_cmds
+import shivyc.il_cmds.value as value_cmds
+from shivyc.il_gen import ILValue
+from shivyc.tree.utils import shift_into_range
+
+# Lattice values other than integer constants.
+UNKNOWN = "unknown"
+VARYING = "varying"
+
+# Largest magnitude of a literal this pass creates. Larger literals cannot
+# be used as immediate operands in every context.
+literal_max = 1 << 31
+
+
+def _meet(a, b):
+    """Return the meet of two lattice values."""
+    if a == UNKNOWN:
+        return b
+    if b == UNKNOWN or a == b:
+        return a
+    return VARYING
+
+
+def _fold_set(command, arg):
+    """Return the value of a Set command with the given argument value."""
+    if command.output.ctype.is_pointer():
+        return VARYING
+    if command.output.ctype.weak_compat(ctypes.bool_t):
+        return int(arg != 0)
+    return shift_into_range(arg, command.output.ctype)
+
+
+def _fold_div_mod(command, a, b):
+    """Return the value of a Div or Mod command, or VARYING."""
+    if b == 0:
+        return VARYING
+
+    ctype = command.arg1.ctype
+    if ctype.signed and a == -(1 << (ctype.size * 8 - 1)) and b == -1:
+        return VARYING
+
+    # C division truncates toward zero.
+    quot = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        quot = -quot
+
+    if isinstance(command, math_cmds.Div):
+        return quot
+    return a - b * quot
+
+
+def _fold_shift(command, a, b):
+    """Return the value of a bit shift command, or VARYING."""
+    bits = command.arg1.ctype.size * 8
+    if not 0 <= b < bits:
+        return VARYING
+
+    if isinstance(command, math_cmds.LBitShift):
+        return a << b
+
+    # Right shifts are always arithmetic, which agrees with C for unsigned
+    # values only if the top bit is clear.
+    if a >= 1 << (bits - 1):
+        return VARYING
+    return a >> b
+
+
+def _fold(command, args):
+    """Return the value of the output of command given input values.
+
+    args (List(int)) - Constant value of each input of the command.
+    returns - An integer, or VARYING if the command cannot be folded.
+    """
+    if isinstance(command, value_cmds.Set):
+        return _fold_set(command, *args)
+
+    # The other foldable commands must compute an integer.
+    if not command.output.ctype.is_integral():
+        return VARYING
+
+    if isinstance(command, math_cmds.Add):
+        val = args[0] + args[1]
+    elif isinstance(command, math_cmds.Subtr):
+        val = args[0] - args[1]
+    elif isinstance(command, math_cmds.Mult):
+        val = args[0] * args[1]
+    elif isinstance(command, math_cmds._DivMod):
+        val = _fold_div_mod(command, *args)
+    elif isinstance(command, math_cmds._BitShiftCmd):
+        val = _fold_shift(command, *args)
+    elif isinstance(command, math_cmds.Neg):
+        val = -args[0]
+    elif isinstance(command, math_cmds.Not):
+        val = ~args[0]
+    elif isinstance(command, compare_cmds._GeneralCmp):
+        # Both arguments are compared as values of the type of arg1.
+        a = args[0]
+        b = shift_into_range(args[1], command.arg1.ctype)
+        val = int(_comparisons[type(command)](a, b))
+    else:
+        return VARYING
+
+    if val == VARYING:
+        return VARYING
+    return shift_into_range(val, command.output.ctype)
+
+
+_comparisons = {
+    compare_cmds.EqualCmp: lambda a, b: a == b,
+    compare_cmds.NotEqualCmp: lambda a, b: a != b,
+    compare_cmds.LessCmp: lambda a, b: a < b,
+    compare_cmds.GreaterCmp: lambda a, b: a > b,
+    compare_cmds.LessOrEqCmp: lambda a, b: a <= b,
+    compare_cmds.GreaterOrEqCmp: lambda a, b: a >= b,
+}
+
+
+class _SCCP:
+    """State of the constant propagation over one function.
+
+    func (Function) - Function being optimized.
+    values (dict) - Maps each SSA value to its lattice value.
+    executable (Set(BasicBlock)) - Blocks found to possibly execute.
+    edges (Set) - Set of (pred, succ) block pairs found to possibly execute.
+    """
+
+    def __init__(self, func):  # noqa: D102
+        self.func = func
+        self.cfg = func.cfg
+        self.values = {v: UNKNOWN for v in func.versions}
+        self.executable = set()
+        self.edges = set()
+
+        # Map each SSA value to the (block, command) pairs that read it.
+        self.uses = {v: [] for v in func.versions}
+        for block in self.cfg.blocks:
+            for command in block.commands:
+                for v in command.inputs():
+                    if v in self.uses:
+                        self.uses[v].append((block, command))
+
+        self.block_work = []
+        self.value_work = []
+
+    def run(self):
+        """Compute the lattice value of every SSA value."""
+        self.block_work.append((None, self.cfg.entry()))
+        while self.block_work or self.value_work:
+            while self.block_work:
+                pred, block = self.block_work.pop()
+                if (pred, block) in self.edges:
+                    continue
+                self.edges.add((pred, block))
+
+                for phi in block.phis():
+                    self.visit(block, phi)
+
+                if block not in self.executable:
+                    self.executable.add(block)
+                    for command in block.commands:
+                        if not isinstance(command, value_cmds.Phi):
+                            self.visit(block, command)
+
+                    # Only conditional jumps choose among the successors.
+                    if not (block.commands and isinstance(
+                            block.commands[-1], control_cmds._GeneralJump)):
+                        self.block_work += [(block, s) for s in block.succs]
+
+            while self.value_work:
+                v = self.value_work.pop()
+                for block, command in self.uses[v]:
+                    if block in self.executable:
+                        self.visit(block, command)
+
+    def value(self, v):
+        """Return the lattice value of the given ILValue."""
+        if v in self.values:
+            return self.values[v]
+
+        literal = self.func.il_code.literals.get(v)
+        if literal is not None and v.ctype.is_integral():
+            return shift_into_range(int(literal), v.ctype)
+        return VARYING
+
+    def visit(self, block, command):
+        """Update lattice values and executable edges for a command."""
+        if isinstance(command, value_cmds.Phi):
+            val = UNKNOWN
+            for pred, arg in command.args.items():
+                if (pred, block) in self.edges:
+                    val = _meet(val, self.value(arg))
+            self.set_value(command.output, val)
+
+        elif isinstance(command, control_cmds._GeneralJump):
+            cond = self.value(command.cond)
+            if cond == UNKNOWN:
+                return
+
+            jump = self.cfg.block_of(command.label)
+            fallthrough = self.cfg.fallthrough(block)
+            if cond == VARYING:
+                self.block_work += [(block, jump), (block, fallthrough)]
+            elif (cond == 0) == isinstance(command, control_cmds.JumpZero):
+                self.block_work.append((block, jump))
+            else:
+                self.block_work.append((block, fallthrough))
+
+        else:
+            for output in command.outputs():
+                if output in self.values:
+                    args = [self.value(v) for v in command.inputs()]
+                    if VARYING in args:
+                        val = VARYING
+                    elif UNKNOWN in args:
+                        val = UNKNOWN
+                    else:
+                        val = _fold(command, args)
+                    self.set_value(output, val)
+
+    def set_value(self, v, val):
+        """Lower the lattice value of v to val."""
+        val = _meet(self.values[v], val)
+        if val != self.values[v]:
+            self.values[v] = val
+            self.value_work.append(v)
+
+
+def propagate_constants(func):
+    """Run sparse conditional constant propagation on the given function."""
+    sccp = _SCCP(func)
+    sccp.run()
+
+    cfg = func.cfg
+    literals = {}
+
+    def literal(ctype, val):
+        """Return a literal ILValue with the given type and value."""
+        if (ctype, val) not in literals:
+            lit = ILValue(ctype)
+            func.il_code.register_literal_var(lit, val)
+            literals[(ctype, val)] = lit
+        return literals[(ctype, val)]
+
+    # Replace the computation of each constant value with a Set from a
+    # literal, and read the literal directly where that is always safe.
+    consts = {v: literal(v.ctype, val) for v, val in sccp.values.items()
+              if isinstance(val, int) and -literal_max <= val < literal_max}
+
+    for block in cfg.blocks:
+        if block not in sccp.executable:
+            continue
+
+        commands = []
+        phi_sets = []
+        for command in block.commands:
+            if isinstance(command, (value_cmds.Set, value_cmds.Phi,
+                                    control_cmds.Return)):
+                command.replace_values(consts, {})
+
+            output = command.outputs()[0] if command.outputs() else None
+            if output in consts:
+                if isinstance(command, value_cmds.Phi):
+                    phi_sets.append(value_cmds.Set(output, consts[output]))
+                    continue
+                if not (isinstance(command, value_cmds.Set) and
+                        command.arg is consts[output]):
+                    command = value_cmds.Set(output, consts[output])
+
+            elif isinstance(command, control_cmds._GeneralJump):
+                command = _fold_jump(command, sccp.value(command.cond))
+                if not command:
+                    continue
+
+            commands.append(command)
+
+        # Sets replacing phis go right after the remaining phis.
+        index = (1 if block.label() else 0) + sum(
+            isinstance(c, value_cmds.Phi) for c in commands)
+        commands[index:index] = phi_sets
+        cfg.set_commands(block, commands)
+
+    cfg.remove_unreachable()
+
+
+def _fold_jump(command, cond):
+    """Return the command replacing a conditional jump.
+
+    cond - Lattice value of the condition of the jump.
+    returns - The command to use instead, or None if the jump is never
+    taken.
+    """
+    if not isinstance(cond, int):
+        return command
+    if (cond == 0) == isinstance(command, control_cmds.JumpZero):
+        return control_cmds.Jump(command.label)
+    return None
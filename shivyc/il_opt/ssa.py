@@ -0,0 +1,265 @@
+"""Construction and destruction of SSA form over a CFG.
+
+In SSA form, every tracked ILValue is written by exactly one command. Each
+write to a variable gets a fresh ILValue (a "version" of the variable),
+and Phi commands are placed at the dominance frontier of the writes to
+merge the versions reaching a block from different predecessors.
+
+Only values which are never accessed except by name can be tracked; see
+tracked_values. All other values are left unchanged.
+"""
+
+from shivyc.il_cmds.value import Phi, Set
+from shivyc.il_gen import ILValue
+from shivyc.il_opt.cfg import live_in, live_out
+
+
+def tracked_values(commands, il_code, symbol_table):
+    """Return the ILValues of a function which can be put in SSA form.
+
+    These are the scalar values with automatic storage, including
+    temporaries, whose address is never taken. They are returned in order
+    of first appearance.
+    """
+    referenced = set()
+    for command in commands:
+        for values in command.references().values():
+            referenced.update(values)
+
+    tracked = {}
+    for command in commands:
+        for v in command.inputs() + command.outputs():
+            if (v and v not in tracked and v not in referenced
+                  and v not in il_code.literals
+                  and v not in il_code.string_literals
+                  and symbol_table.storage.get(
+                      v, symbol_table.AUTOMATIC) == symbol_table.AUTOMATIC
+                  and v.ctype.is_scalar()):
+                tracked[v] = None
+    return list(tracked)
+
+
+def to_ssa(cfg, tracked):
+    """Put the tracked values of the given CFG in SSA form.
+
+    The CFG must not contain unreachable blocks. Reads of a variable which
+    are not preceded by any write keep using the original ILValue.
+
+    tracked (List(ILValue)) - Values to rename, as from tracked_values.
+    returns (dict) - Maps each new ILValue to the variable it is a version
+    of.
+    """
+    tracked_set = set(tracked)
+    blocks = cfg.reverse_postorder()
+
+    # A phi is only needed where the variable is live, so first find the
+    # blocks which write each variable and the variables live into each
+    # block.
+    def_blocks = {v: [] for v in tracked}
+    for block in blocks:
+        for command in block.commands:
+            for v in command.outputs():
+                if v in tracked_set and block not in def_blocks[v]:
+                    def_blocks[v].append(block)
+    live = live_in(cfg, tracked_set)
+
+    phi_vars = {}
+    for v in tracked:
+        has_phi = set()
+        work = def_blocks[v][:]
+        while work:
+            block = work.pop()
+            for frontier in cfg.dominance_frontier(block):
+                if frontier in has_phi or v not in live[frontier]:
+                    continue
+                has_phi.add(frontier)
+
+                phi = Phi(v)
+                phi_vars[phi] = v
+                index = (1 if frontier.label() else 0) + len(frontier.phis())
+                frontier.commands.insert(index, phi)
+
+                if frontier not in def_blocks[v]:
+                    work.append(frontier)
+
+    # Rename by walking the dominator tree, keeping a stack of the current
+    # version of each variable.
+    children = {block: [] for block in blocks}
+    for block in blocks[1:]:
+        children[cfg.idom(block)].append(block)
+
+    versions = {}
+    current = {v: [v] for v in tracked}
+    work = [(cfg.entry(), None)]
+    while work:
+        block, pushed = work.pop()
+        if pushed is not None:
+            for v in pushed:
+                current[v].pop()
+            continue
+
+        pushed = []
+        for command in block.commands:
+            if not isinstance(command, Phi):
+                command.replace_values({v: current[v][-1] for v in
+                                        command.inputs() if v in tracked_set},
+                                       {})
+
+            new_outputs = {}
+            for v in command.outputs():
+                if v in tracked_set:
+                    new = ILValue(v.ctype)
+                    versions[new] = v
+                    current[v].append(new)
+                    pushed.append(v)
+                    new_outputs[v] = new
+            command.replace_values({}, new_outputs)
+
+        for succ in block.succs:
+            for phi in succ.phis():
+                phi.args[block] = current[phi_vars[phi]][-1]
+
+        work.append((block, pushed))
+        work.extend((child, None) for child in children[block][::-1])
+
+    return versions
+
+
+def from_ssa(cfg, versions, get_label):
+    """Replace the Phi commands of the given CFG with Set commands.
+
+    First, the output and inputs of each phi are merged into one variable
+    wherever their live ranges do not overlap, so the phi needs no copy
+    for them. The remaining copies are placed at the end of the
+    predecessor blocks. Where a predecessor may also branch elsewhere, the
+    edge is split first so the copies run only on the way into the phi
+    block.
+
+    versions (dict) - Result of to_ssa for this CFG.
+    get_label - Function returning a new unique label name.
+    """
+    _coalesce(cfg, set(versions) | set(versions.values()))
+
+    for block in cfg.blocks[:]:
+        block_phis = block.phis()
+        if not block_phis:
+            continue
+
+        for pred in block.preds[:]:
+            copies = _sequentialize([(phi.output, phi.args[pred])
+                                     for phi in block_phis])
+            if not copies:
+                continue
+
+            # A conditional jump reads its condition after the copies
+            # would run, so that edge is split even if it is the only one.
+            if len(pred.succs) > 1 or (pred.targets() and
+                                       pred.falls_through()):
+                pred = cfg.split_edge(pred, block, get_label())
+
+            pred.add_at_end(copies)
+
+        block.commands = [c for c in block.commands if c not in block_phis]
+
+
+def _coalesce(cfg, values):
+    """Merge each phi output with the phi inputs it does not interfere with.
+
+    Two SSA values interfere if one is live just after the other is
+    written, in which case they cannot share a variable. Merged values are
+    renamed to a single ILValue throughout the CFG, and any copies between
+    them are deleted.
+
+    values (Set(ILValue)) - The values which may be merged.
+    """
+    live = live_in(cfg, values)
+    live_outs = {}
+    last_use = {}
+    defs = {}
+    for block in cfg.blocks:
+        live_outs[block] = live_out(block, live, values)
+        last_use[block] = {}
+        for i, command in enumerate(block.commands):
+            if not isinstance(command, Phi):
+                for v in command.inputs():
+                    last_use[block][v] = i
+            for v in command.outputs():
+                defs[v] = (block, i)
+
+    def written_before(a, b):
+        """Return whether the write of `a` dominates the write of `b`."""
+        block_a, i_a = defs.get(a, (cfg.entry(), -1))
+        block_b, i_b = defs.get(b, (cfg.entry(), -1))
+        if block_a is block_b:
+            return i_a < i_b
+        return cfg.dominates(block_a, block_b)
+
+    def live_after_write(a, b):
+        """Return whether `a` is live just after `b` is written."""
+        block, i = defs.get(b, (cfg.entry(), -1))
+        return a in live_outs[block] or last_use[block].get(a, -1) > i
+
+    def interfere(a, b):
+        """Return whether `a` and `b` cannot share a variable."""
+        if written_before(a, b):
+            return live_after_write(a, b)
+        elif written_before(b, a):
+            return live_after_write(b, a)
+        return False
+
+    # Map each value to the list of values merged with it.
+    classes = {}
+    for block in cfg.blocks:
+        for phi in block.phis():
+            for arg in [phi.output] + list(phi.args.values()):
+                if arg in values and arg not in classes:
+                    classes[arg] = [arg]
+
+            for arg in phi.args.values():
+                if arg not in classes:
+                    continue
+                out_class = classes[phi.output]
+                arg_class = classes[arg]
+                if out_class is arg_class:
+                    continue
+                if any(interfere(a, b) for a in out_class for b in arg_class):
+                    continue
+
+                out_class += arg_class
+                for v in arg_class:
+                    classes[v] = out_class
+
+    rename = {v: cls[0] for v, cls in classes.items() if v is not cls[0]}
+    if rename:
+        for block in cfg.blocks:
+            for command in block.commands:
+                command.replace_values(rename, rename)
+
+            # Renaming can turn a copy into a copy of a variable to itself.
+            block.commands = [c for c in block.commands if not (
+                isinstance(c, Set) and c.output is c.arg)]
+
+
+def _sequentialize(copies):
+    """Return Set commands performing the given copies in parallel.
+
+    copies (List) - List of (destination, source) pairs. Each destination
+    appears only once.
+    """
+    copies = [(dest, src) for dest, src in copies if dest is not src]
+    sets = []
+    while copies:
+        for i, (dest, src) in enumerate(copies):
+            # A copy is safe to do once no other copy reads its destination.
+            if all(dest is not other for _, other in copies):
+                sets.append(Set(dest, src))
+                copies.pop(i)
+                break
+        else:
+            # Every destination is still read, so the copies form cycles.
+            # Save one destination in a temporary to break its cycle.
+            dest = copies[0][0]
+            temp = ILValue(dest.ctype)
+            sets.append(Set(temp, dest))
+            copies = [(d, temp if s is dest else s) for d, s in copies]
+    return sets
@@ -0,0 +1,45 @@
+"""Tail call optimization.
+
+A call immediately followed by a return of its result is a tail call. Such
+a call is replaced with a TailCall command, which tears down the frame of
+the current function and jumps to the called function, so the called
+function returns straight to our caller. A recursive function whose
+recursive calls are all tail calls then runs in constant stack space.
+
+This is only done in functions which never take the address of one of
+their own local variables, because the frame is gone by the time the
+called function runs and so no pointer into it may be passed along.
+"""
+
+from shivyc.il_cmds.control import Call, Return, TailCall
+
+
+def make_tail_calls(func):
+    """Replace the tail calls of the given function with TailCall commands."""
+    if _frame_escapes(func):
+        return
+
+    for block in func.cfg.blocks:
+        commands = []
+        for command in block.commands:
+            prev = commands[-1] if commands else None
+            if (isinstance(command, Return) and type(prev) is Call
+                  and (command.arg is None or
+                       (not prev.void_return and command.arg is prev.ret))):
+                commands[-1] = TailCall(prev.func, prev.args)
+                continue
+            commands.append(command)
+        block.commands = commands
+
+
+def _frame_escapes(func):
+    """Return whether a pointer into the frame of func may be created."""
+    symbol_table = func.symbol_table
+    for block in func.cfg.blocks:
+        for command in block.commands:
+            for key, values in command.references().items():
+                if key is not None and any(
+                        symbol_table.storage.get(v, symbol_table.AUTOMATIC)
+                        == symbol_table.AUTOMATIC for v in values):
+                    return True
+    return False
@@ -0,0 +1,252 @@
+"""Loop unrolling.
+
+A counted loop like
+
+    for(i = start; i < end; i += step) body;
+
+tests its condition and jumps back to its header once per iteration. This
+pass puts an unrolled copy of such a loop in front of it, which runs
+`factor` copies of the body per iteration:
+
+    unrolled:
+      if(!(i + (factor - 1) * step < end)) goto header;
+      body; i += step;
+      ...
+      body; i += step;
+      goto unrolled;
+    header:
+      the original loop
+
+The unrolled loop runs only while all `factor` iterations are known to
+execute, so none of the copies need to test the condition. The original
+loop then runs the remaining iterations. The guard is computed in 64-bit
+arithmetic, or folded into the bound if the bound is a literal, so it
+never overflows.
+
+Only innermost loops are unrolled. Unrolling runs before the function is
+put in SSA form, so the copies of the body simply reuse the same values,
+and the SSA passes then optimize across the copies.
+"""
+
+from copy import copy
+
+import shivyc.ctypes as ctypes
+import shivyc.il_cmds.compare as compare_cmds
+import shivyc.il_cmds.control as control_cmds
+import shivyc.il_cmds.math as math_cmds
+import shivyc.il_cmds.value as value_cmds
+from shivyc.il_gen import ILValue
+from shivyc.il_opt.cfg import CFG
+from shivyc.il_opt.sccp import literal_max
+from shivyc.il_opt.ssa import tracked_values
+
+# Largest number of IL commands in all the copies of an unrolled body.
+max_unrolled_size = 200
+
+# Comparisons which hold for all iterations of a counted loop, and the
+# sign of the steps which approach the bound.
+_increasing = (compare_cmds.LessCmp, compare_cmds.LessOrEqCmp)
+_decreasing = (compare_cmds.GreaterCmp, compare_cmds.GreaterOrEqCmp)
+
+
+def unroll_loops(func, factor):
+    """Unroll the innermost counted loops of func `factor` times.
+
+    The function must not yet be in SSA form. Its CFG is replaced with a
+    new one containing the unrolled loops.
+    """
+    if factor < 2:
+        return
+
+    cfg = func.cfg
+    tracked = set(tracked_values(cfg.commands(), func.il_code,
+                                 func.symbol_table))
+
+    unrolled = {}
+    for loop in cfg.loops():
+        if not loop.children:
+            commands = _LoopUnroller(func, loop, tracked, factor).run()
+            if commands:
+                unrolled[loop.header] = commands
+
+    if unrolled:
+        commands = []
+        for block in cfg.blocks:
+            commands += unrolled.get(block, []) + block.commands
+        func.cfg = CFG(commands)
+
+
+class _LoopUnroller:
+    """Unrolling of one loop.
+
+    func (Function) - Function being optimized.
+    loop (Loop) - Loop being unrolled.
+    tracked (Set(ILValue)) - Values which may be put in SSA form. Only
+    these are known to be written by nothing but the commands naming them.
+    factor (int) - Number of copies of the body in the unrolled loop.
+    """
+
+    def __init__(self, func, loop, tracked, factor):  # noqa: D102
+        self.func = func
+        self.loop = loop
+        self.tracked = tracked
+        self.factor = factor
+
+    def run(self):
+        """Return the commands of the unrolled loop, or None.
+
+        The unrolled loop is meant to be placed just before the header of
+        the original loop. The jumps from outside the loop to its header
+        are redirected to the unrolled loop.
+        """
+        cfg = self.func.cfg
+        header = self.loop.header
+        latches = [p for p in header.preds if p in self.loop.blocks]
+        if len(latches) != 1 or not header.label():
+            return None
+
+        # The body must be laid out between the header and the latch, so
+        # that it can be copied as one piece.
+        start = cfg.index(header)
+        end = cfg.index(latches[0])
+        body = cfg.blocks[start + 1:end + 1]
+        if not body or any(b not in body for b in self.loop.blocks
+                           if b is not header):
+            return None
+
+        # The copies are joined by dropping the jump ending each latch.
+        jump = body[-1].commands[-1]
+        if (not isinstance(jump, control_cmds.Jump)
+              or jump.label != header.label()):
+            return None
+
+        size = sum(len(b.commands) for b in body)
+        if size * self.factor > max_unrolled_size:
+            return None
+
+        guard = self.guard(header, body)
+        if not guard:
+            return None
+
+        label = self.func.il_code.get_label()
+        for pred in header.preds:
+            if pred not in self.loop.blocks:
+                pred.commands[-1].replace_target(header.label(), label)
+
+        commands = [control_cmds.Label(label)] + guard
+        for i in range(self.factor):
+            labels = {b.label(): self.func.il_code.get_label()
+                      for b in body if b.label()}
+            for block in body:
+                for command in block.commands:
+                    commands.append(self.copy(command, labels))
+
+            # Each copy falls through to the next one, and the last one
+            # jumps back to the start of the unrolled loop.
+            commands.pop()
+            if i == self.factor - 1:
+                commands.append(control_cmds.Jump(label))
+
+        return commands
+
+    def guard(self, header, body):
+        """Return the guard of the unrolled loop, or None.
+
+        The guard jumps to the header of the original loop unless the body
+        can run `factor` more times without testing the loop condition. If
+        the loop is not a counted loop, this returns None.
+        """
+        commands = header.commands
+        if (len(commands) != 3
+              or not isinstance(commands[1], compare_cmds._GeneralCmp)
+              or not isinstance(commands[2], control_cmds.JumpZero)
+              or commands[2].cond is not commands[1].output):
+            return None
+
+        cmp = commands[1]
+        iv, bound = cmp.arg1, cmp.arg2
+        step = self.step(iv, body)
+        if (step is None or
+              not (isinstance(cmp, _increasing) and step > 0 or
+                   isinstance(cmp, _decreasing) and step < 0)):
+            return None
+
+        il_code = self.func.il_code
+        last = (self.factor - 1) * step
+        cond = ILValue(cmp.output.ctype)
+
+        if bound in il_code.literals:
+            # Test `iv < bound - last` instead.
+            value = int(il_code.literals[bound]) - last
+            if (not -literal_max <= value < literal_max
+                  or (value < 0 and not iv.ctype.signed)):
+                return None
+
+            new_bound = ILValue(iv.ctype)
+            il_code.register_literal_var(new_bound, value)
+            return [type(cmp)(cond, iv, new_bound),
+                    control_cmds.JumpZero(cond, header.label())]
+
+        if (bound not in self.tracked or iv.ctype.size > 4
+              or any(bound in c.outputs() for b in body
+                     for c in b.commands)):
+            return None
+
+        wide_iv = ILValue(ctypes.longint)
+        wide_last = ILValue(ctypes.longint)
+        wide_bound = ILValue(ctypes.longint)
+        last_lit = ILValue(ctypes.longint)
+        il_code.register_literal_var(last_lit, last)
+        return [value_cmds.Set(wide_iv, iv),
+                math_cmds.Add(wide_last, wide_iv, last_lit),
+                value_cmds.Set(wide_bound, bound),
+                type(cmp)(cond, wide_last, wide_bound),
+                control_cmds.JumpZero(cond, header.label())]
+
+    def step(self, iv, body):
+        """Return the amount iv increases by in each iteration, or None.
+
+        This is the case if the only write to iv in the loop is a literal
+        Add or Subtr in the latch, which runs on every iteration.
+        """
+        if iv not in self.tracked or not iv.ctype.is_integral():
+            return None
+
+        latch = body[-1].commands
+        writes = [(b, i) for b in body for i, c in enumerate(b.commands)
+                  if iv in c.outputs()]
+        if len(writes) != 1 or writes[0][0] is not body[-1]:
+            return None
+
+        index = writes[0][1]
+        command = latch[index]
+
+        # The IL generator computes the new value in a temporary, which is
+        # then set to the variable.
+        if (isinstance(command, value_cmds.Set) and index > 0
+              and latch[index - 1].outputs() == [command.arg]
+              and command.arg.ctype.size == iv.ctype.size):
+            command = latch[index - 1]
+
+        literals = self.func.il_code.literals
+        if isinstance(command, math_cmds.Add):
+            args = [command.arg1, command.arg2]
+            if iv in args:
+                args.remove(iv)
+                if args[0] in literals:
+                    return int(literals[args[0]])
+        elif (isinstance(command, math_cmds.Subtr) and command.arg1 is iv
+              and command.arg2 in literals):
+            return -int(literals[command.arg2])
+        return None
+
+    def copy(self, command, labels):
+        """Return a copy of a body command using the given labels."""
+        if command.label_name():
+            return control_cmds.Label(labels[command.label_name()])
+
+        command = copy(command)
+        for label in command.targets():
+            if label in labels:
+                command.replace_target(label, labels[label])
+        return command
@@ -0,0 +1,371 @@
+"""Saving and loading IL code.
+
+The IL code of a translation unit, together with the parts of its symbol
+table the back end reads, is saved as JSON lines. Each line is one record:
+
+    {"shivyc_il": VERSION, "labels": N}
+        The header. N is the largest label number used in the IL.
+    {"type": ID, "kind": KIND, ...}
+        A C type. Types refer to each other by ID. A const struct or union
+        refers to its unqualified type, which holds the tag and members.
+    {"value": ID, "ctype": ID, ...}
+        An ILValue. The optional keys hold its literal value, string
+        literal, static initializer, name, storage, linkage, and definition
+        state, as set in the ILCode and SymbolTable.
+    {"function": NAME}
+        The start of a function. The records following it, up to the next
+        function, are its commands.
+    {"op": CLASS, ...}
+        An IL command. The other keys hold the arguments of its
+        constructor. ILValues are written as {"v": ID}, and the comparison
+        classes taken by JumpCmp as {"class": CLASS}.
+
+The IDs of types and values are numbered in order of first use, so saving
+the same IL twice gives the same file.
+"""
+
+import inspect
+import json
+
+import shivyc.ctypes as ctypes
+import shivyc.il_cmds.compare as compare_cmds
+import shivyc.il_cmds.control as control_cmds
+import shivyc.il_cmds.math as math_cmds
+import shivyc.il_cmds.value as value_cmds
+from shivyc.il_cmds.base import ILCommand
+from shivyc.il_gen import ILCode, ILValue, SymbolTable
+
+# Version of the format. Files of other versions are rejected.
+version = 3
+
+# Prefix of the labels made by ILCode.get_label, which end in a number.
+_label_prefix = "__shivyc_label"
+
+# Maps the name of each IL command class to the class.
+_commands = {
+    name: cls
+    for module in (compare_cmds, control_cmds, math_cmds, value_cmds)
+    for name, cls in vars(module).items()
+    if isinstance(cls, type) and issubclass(cls, ILCommand)}
+
+# Integer types by size, signedness, and whether they are bool.
+_integers = {(t.size, t.signed, t.is_bool()): t for t in (
+    ctypes.bool_t, ctypes.char, ctypes.unsig_char, ctypes.short,
+    ctypes.unsig_short, ctypes.integer, ctypes.unsig_int, ctypes.longint,
+    ctypes.unsig_longint)}
+
+
+class ILFormatError(Exception):
+    """Raised when a file does not hold valid IL."""
+
+    pass
+
+
+def dump(il_code, symbol_table, stream):
+    """Write the given IL code and symbol table to a text stream.
+
+    Raises ValueError if the IL is in SSA form or holds a type which
+    cannot be saved.
+    """
+    _Writer(il_code, symbol_table, stream).write()
+
+
+def load(stream):
+    """Read IL code from a text stream.
+
+    Returns an (ILCode, SymbolTable) tuple. Raises ILFormatError if the
+    stream does not hold IL written by `dump`.
+    """
+    try:
+        records = [json.loads(line) for line in stream if line.strip()]
+        return _Reader(records).read()
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        raise ILFormatError(str(e))
+
+
+def _params(cls):
+    """Return the names of the constructor parameters of a command class."""
+    return list(inspect.signature(cls.__init__).parameters)[1:]
+
+
+class _Writer:
+    """Writer of one IL file.
+
+    types (List(dict)) - Records of the types written, in order of ID.
+    type_ids (dict) - Maps each CType written to its ID.
+    values (dict) - Maps each ILValue written to its ID.
+    """
+
+    def __init__(self, il_code, symbol_table, stream):  # noqa: D102
+        self.il_code = il_code
+        self.symbol_table = symbol_table
+        self.stream = stream
+        self.types = []
+        self.type_ids = {}
+        self.values = {}
+
+    def write(self):
+        """Write the IL file."""
+        il_code = self.il_code
+        symbol_table = self.symbol_table
+
+        commands = []
+        labels = [0]
+        for name, func_cmds in il_code.commands.items():
+            commands.append({"function": name})
+            for command in func_cmds:
+                commands.append(self.command(command))
+                for label in [command.label_name()] + command.targets():
+                    if label and label.startswith(_label_prefix):
+                        labels.append(int(label[len(_label_prefix):]))
+
+        for values in (symbol_table.storage, symbol_table.linkage_type,
+                       il_code.literals, il_code.string_literals,
+                       il_code.static_inits):
+            for v in values:
+                self.value(v)
+
+        self.record({"shivyc_il": version, "labels": max(labels)})
+
+        values = [self.value_record(v) for v in self.values]
+        for record in self.types + values + commands:
+            self.record(record)
+
+    def record(self, record):
+        """Write one record to the stream."""
+        self.stream.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def command(self, command):
+        """Return the record of an IL command."""
+        if isinstance(command, value_cmds.Phi):
+            raise ValueError("cannot save phi commands")
+
+        record = {"op": type(command).__name__}
+        for param in _params(type(command)):
+            record[param] = self.field(getattr(command, param))
+        return record
+
+    def field(self, field):
+        """Return the JSON form of a constructor argument."""
+        if isinstance(field, ILValue):
+            return {"v": self.value(field)}
+        elif isinstance(field, list):
+            return [self.field(f) for f in field]
+        elif isinstance(field, type):
+            return {"class": field.__name__}
+        return field
+
+    def value(self, v):
+        """Return the ID of the given ILValue."""
+        if v not in self.values:
+            self.values[v] = len(self.values)
+        return self.values[v]
+
+    def value_record(self, v):
+        """Return the record of an ILValue."""
+        il_code = self.il_code
+        symbol_table = self.symbol_table
+        record = {"value": self.values[v], "ctype": self.type(v.ctype)}
+
+        tables = [("literal", il_code.literals),
+                  ("string", il_code.string_literals),
+                  ("init", il_code.static_inits),
+                  ("name", symbol_table.names),
+                  ("storage", symbol_table.storage),
+                  ("linkage", symbol_table.linkage_type),
+                  ("def_state", symbol_table.def_state)]
+        for key, table in tables:
+            if v in table:
+                record[key] = table[v]
+        return record
+
+    def type(self, ctype):
+        """Return the ID of the given CType.
+
+        Since C types are interned, equal types are the same CType and
+        share one ID.
+        """
+        if ctype not in self.type_ids:
+            # Number the type first, since a struct member may refer to it.
+            type_id = self.type_ids[ctype] = len(self.types)
+            self.types.append(None)
+            self.types[type_id] = self.type_record(ctype, type_id)
+        return self.type_ids[ctype]
+
+    def type_record(self, ctype, type_id):
+        """Return the record of a CType with the given ID."""
+        record = {"type": type_id}
+        if ctype.is_void():
+            record["kind"] = "void"
+        elif ctype.is_integral():
+            record.update(kind="int", size=ctype.size, signed=ctype.signed,
+                          bool=ctype.is_bool())
+        elif ctype.is_pointer():
+            record.update(kind="pointer", arg=self.type(ctype.arg))
+        elif ctype.is_array():
+            record.update(kind="array", el=self.type(ctype.el), n=ctype.n)
+        elif ctype.is_function():
+            args = ctype.args
+            if args is not None:
+                args = [self.type(arg) for arg in args]
+            record.update(kind="function", args=args,
+                          ret=self.type(ctype.ret), no_info=ctype.no_info)
+        elif ctype.is_struct_union():
+            record["kind"] = ("struct" if isinstance(ctype, ctypes.StructCType)
+                              else "union")
+            if ctype.const:
+                record["unqual"] = self.type(ctype.make_unqual())
+            else:
+                members = ctype.members
+                if members is not None:
+                    members = [[name, self.type(t)] for name, t in members]
+                record.update(tag=ctype.tag, members=members)
+        else:
+            raise ValueError("cannot save type")
+
+        record["const"] = ctype.const
+        return record
+
+
+class _Reader:
+    """Reader of one IL file.
+
+    records (List(dict)) - Records of the file, in order.
+    types (dict) - Maps each type ID to the record or, once read, the CType.
+    values (dict) - Maps each value ID to the ILValue read.
+    """
+
+    def __init__(self, records):  # noqa: D102
+        self.records = records
+        self.types = {}
+        self.values = {}
+
+    def read(self):
+        """Return the (ILCode, SymbolTable) tuple read from the records."""
+        if not all(isinstance(record, dict) for record in self.records):
+            raise ILFormatError("record is not an object")
+
+        header = self.records[0]
+        if header.get("shivyc_il") != version:
+            raise ILFormatError("unsupported IL version")
+
+        # Import is here to prevent circular import.
+        from shivyc.asm_gen import ASMCode
+        ASMCode.label_num = max(ASMCode.label_num, header["labels"])
+
+        il_code = ILCode()
+        symbol_table = SymbolTable()
+        for record in self.records[1:]:
+            if "type" in record:
+                self.types[record["type"]] = record
+            elif "value" in record:
+                self.read_value(record, il_code, symbol_table)
+            elif "function" in record:
+                il_code.start_func(record["function"])
+            else:
+                il_code.add(self.read_command(record))
+
+        for name, commands in il_code.commands.items():
+            self.check_labels(name, commands)
+        return il_code, symbol_table
+
+    def check_labels(self, name, commands):
+        """Check each label jumped to is defined in the same function."""
+        labels = {command.label_name() for command in commands}
+        for command in commands:
+            for label in command.targets():
+                if label not in labels:
+                    err = f"undefined label '{label}' in function '{name}'"
+                    raise ILFormatError(err)
+
+    def read_value(self, record, il_code, symbol_table):
+        """Read the record of an ILValue."""
+        v = ILValue(self.ctype(record["ctype"]))
+        self.values[record["value"]] = v
+
+        if "literal" in record:
+            il_code.register_literal_var(v, record["literal"])
+        if "string" in record:
+            il_code.register_string_literal(v, record["string"])
+        if "init" in record:
+            il_code.static_initialize(v, record["init"])
+
+        if "name" in record:
+            symbol_table.names[v] = record["name"]
+        if "storage" in record:
+            symbol_table.storage[v] = record["storage"]
+        if "def_state" in record:
+            symbol_table.def_state[v] = record["def_state"]
+        if "linkage" in record:
+            symbol_table.linkage_type[v] = record["linkage"]
+            symbol_table.linkages[record["linkage"]][record["name"]] = v
+
+    def read_command(self, record):
+        """Return the IL command of a record."""
+        cls = _commands[record["op"]]
+        return cls(*[self.field(record[p]) for p in _params(cls)])
+
+    def field(self, field):
+        """Return the constructor argument of its JSON form."""
+        if isinstance(field, dict) and "v" in field:
+            return self.values[field["v"]]
+        elif isinstance(field, dict):
+            return _commands[field["class"]]
+        elif isinstance(field, list):
+            return [self.field(f) for f in field]
+        return field
+
+    def ctype(self, type_id):
+        """Return the CType with the given ID."""
+        record = self.types[type_id]
+        if isinstance(record, ctypes.CType):
+            return record
+
+        kind = record["kind"]
+        if kind == "void":
+            ctype = ctypes.void
+        elif kind == "int":
+            ctype = _integers[record["size"], record["signed"],
+                              record["bool"]]
+        elif kind == "pointer":
+            ctype = ctypes.PointerCType(self.ctype(record["arg"]))
+        elif kind == "array":
+            ctype = ctypes.ArrayCType(self.ctype(record["el"]), record["n"])
+        elif kind == "function":
+            args = record["args"]
+            if args is not None:
+                args = [self.ctype(arg) for arg in args]
+            ctype = ctypes.FunctionCType(args, self.ctype(record["ret"]),
+                                         record["no_info"])
+        elif kind in ("struct", "union"):
+            return self.struct(type_id, record)
+        else:
+            raise ILFormatError(f"unknown type kind '{kind}'")
+
+        if record["const"]:
+            ctype = ctype.make_const()
+        self.types[type_id] = ctype
+        return ctype
+
+    def struct(self, type_id, record):
+        """Return the struct or union CType of a record.
+
+        The type is stored before its members are read, because a member
+        may point back to it. The record of a const struct or union refers
+        to the record of its unqualified type.
+        """
+        if "unqual" in record:
+            ctype = self.ctype(record["unqual"]).make_const()
+            self.types[type_id] = ctype
+            return ctype
+
+        if record["kind"] == "struct":
+            ctype = ctypes.StructCType(record["tag"])
+        else:
+            ctype = ctypes.UnionCType(record["tag"])
+        self.types[type_id] = ctype
+
+        if record["members"] is not None:
+            ctype.set_members([(name, self.ctype(t))
+                               for name, t in record["members"]])
+        return ctype
@@ -1,18 +1,27 @@
 """Main executable for ShivyC compiler."""
 
 import argparse
+import json
+import os
 import pathlib
 import platform
 import subprocess
 import sys
 
+import shivyc.elf as elf
+import shivyc.il_interp as il_interp
+import shivyc.il_serial as il_serial
 import shivyc.lexer as lexer
 import shivyc.preproc as preproc
 
 from shivyc.errors import error_collector, CompilerError
 from shivyc.parser.parser import parse
 from shivyc.il_gen import ILCode, SymbolTable, Context
+from shivyc.il_opt.optimizer import optimize
+from shivyc.il_opt.profile import instrument, use_profile
+from shivyc.asm_encode import EncodeError
 from shivyc.asm_gen import ASMCode, ASMGen
+from shivyc.peephole import Peephole
 
 
 def main():
@@ -24,6 +33,8 @@ def main():
         return 1
 
     arguments = get_arguments()
+    if arguments.interpret:
+        return interpret(arguments)
 
     objs = []
     for file in arguments.files:
@@ -33,7 +44,7 @@ def main():
     if any(not obj for obj in objs):
         return 1
     else:
-        if not link("out", objs):
+        if not link("out", objs, arguments.link_cache):
             err = "linker returned non-zero status"
             print(CompilerError(err))
             return 1
@@ -42,18 +53,33 @@ def main():
 
 def process_file(file, args):
     """Process single file into object file and return the object file name."""
-    if file[-2:] == ".c":
-        return process_c_file(file, args)
-    elif file[-2:] == ".o":
+    if file[-2:] == ".o":
         return file
+
+    il = get_il(file, args)
+    if not il:
+        return None
+    return process_il(*il, args)
+
+
+def get_il(file, args):
+    """Return the IL of a C file or of an IL file, with its symbol table.
+
+    Returns an (ILCode, SymbolTable, name) tuple, where name is the file
+    name without its suffix, or None if the IL cannot be made.
+    """
+    if args.from_il:
+        return read_il_file(file)
+    elif file[-2:] == ".c":
+        return make_il_code(file, args)
     else:
         err = f"unknown file type: '{file}'"
         error_collector.add(CompilerError(err))
         return None
 
 
-def process_c_file(file, args):
-    """Compile a C file into an object file and return the object file name."""
+def make_il_code(file, args):
+    """Make the IL of a C file, as for get_il."""
     code = read_file(file)
     if not error_collector.ok():
         return None
@@ -79,16 +105,118 @@ def process_c_file(file, args):
     if not error_collector.ok():
         return None
 
+    if args.emit_il:
+        write_il(il_code, symbol_table, file[:-2] + ".il")
+        if not error_collector.ok():
+            return None
+
+    return il_code, symbol_table, file[:-2]
+
+
+def read_il_file(file):
+    """Read the IL of an IL file, as for get_il.
+
+    The IL file must have been written by the --emit-il flag.
+    """
+    try:
+        with open(file) as il_file:
+            il_code, symbol_table = il_serial.load(il_file)
+    except IOError:
+        descrip = f"could not read file: '{file}'"
+        error_collector.add(CompilerError(descrip))
+        return None
+    except il_serial.ILFormatError:
+        descrip = f"file is not valid IL: '{file}'"
+        error_collector.add(CompilerError(descrip))
+        return None
+
+    return il_code, symbol_table, os.path.splitext(file)[0]
+
+
+def interpret(args):
+    """Run the program in the IL interpreter and return its exit status.
+
+    The program must be a single C or IL file. It is optimized first if
+    optimizations are enabled, so the interpreter runs the IL that would
+    be compiled.
+    """
+    status = run_il(args)
+    error_collector.show()
+    return 1 if status is None else status % 256
+
+
+def run_il(args):
+    """Run the program in the IL interpreter, as for interpret.
+
+    Returns the value its main function returns, or None on error.
+    """
+    if len(args.files) != 1:
+        err = "the interpreter runs exactly one file"
+        error_collector.add(CompilerError(err))
+        return None
+
+    il = get_il(args.files[0], args)
+    if not il:
+        return None
+    il_code, symbol_table, _ = il
+
+    if args.opt_level:
+        optimize(il_code, symbol_table, args)
+    if not error_collector.ok():
+        return None
+
+    interpreter = il_interp.Interpreter(il_code, symbol_table)
+    try:
+        return interpreter.run()
+    except il_interp.InterpreterError as e:
+        error_collector.add(CompilerError(str(e)))
+        return None
+    finally:
+        sys.stdout.flush()
+        if args.show_il_counts:  # pragma: no cover
+            for name, count in interpreter.counts.items():
+                print(f"{count:>12}  {name}", file=sys.stderr)
+
+
+def process_il(il_code, symbol_table, name, args):
+    """Compile IL code into an object file and return the object file name.
+
+    name (str) - Name of the source file without its suffix, which is used
+    to name the output and profile files.
+    """
+    # The profile file is found next to the source file, whichever
+    # directory the program is run from.
+    profile_file = os.path.abspath(name + ".prof")
+    if args.profile_generate:
+        instrument(il_code, symbol_table, profile_file)
+    elif args.profile_use:
+        use_profile(il_code, profile_file)
+
+    if args.opt_level:
+        optimize(il_code, symbol_table, args)
+
     asm_code = ASMCode()
     ASMGen(il_code, symbol_table, asm_code, args).make_asm()
-    asm_source = asm_code.full_code()
+
+    peephole = Peephole()
+    peephole.optimize(asm_code)
+    if args.show_peephole_stats:  # pragma: no cover
+        peephole.report()
+
     if not error_collector.ok():
         return None
 
-    asm_file = file[:-2] + ".s"
-    obj_file = file[:-2] + ".o"
+    asm_file = name + ".s"
+    obj_file = name + ".o"
 
-    write_asm(asm_source, asm_file)
+    # Use the built-in assembler when it supports all the generated code,
+    # and fall back to the external assembler otherwise.
+    if args.integrated_as and write_object(asm_code, obj_file):
+        if not error_collector.ok():
+            return None
+        return obj_file
+
+    write_asm(asm_code, asm_file)
     if not error_collector.ok():
         return None
 
@@ -114,11 +242,86 @@ def get_arguments():
     # Files to compile
     parser.add_argument("files", metavar="files", nargs="+")
 
+    # Optimization level
+    parser.add_argument("-O", metavar="LEVEL", help="optimization level",
+                        dest="opt_level", type=int, choices=[0, 1],
+                        default=0)
+
+    # Size limit of the functions inlined at -O1
+    parser.add_argument("-finline-limit", metavar="N", type=int,
+                        help="inline functions of at most N IL commands "
+                             "(default 20, 0 disables inlining)",
+                        dest="inline_limit", default=20)
+
+    # Number of copies of the body in unrolled loops at -O1
+    parser.add_argument("-funroll-loops", metavar="N", type=int,
+                        help="unroll innermost counted loops N times "
+                             "(default 0, which disables unrolling)",
+                        dest="unroll_loops", default=0)
+
+    # Number of processes generating the code of functions in parallel
+    parser.add_argument("-fcodegen-jobs", metavar="N", type=int,
+                        help="generate code for N functions at a time in "
+                             "separate processes (default 1)",
+                        dest="codegen_jobs", default=1)
+
+    # Boolean flags for whether to record or use a profile of block counts
+    parser.add_argument("-fprofile-generate",
+                        help="count how often each block runs and write the "
+                             "counts to a .prof file next to each source "
+                             "file when the program exits",
+                        dest="profile_generate", action="store_true")
+    parser.add_argument("-fprofile-use",
+                        help="lay out blocks and allocate registers using "
+                             "the counts in the .prof file of each source "
+                             "file",
+                        dest="profile_use", action="store_true")
+
+    # Boolean flags for whether to save the IL, or to compile saved IL
+    parser.add_argument("--emit-il",
+                        help="save the IL of each C file to a .il file",
+                        dest="emit_il", action="store_true")
+    parser.add_argument("--from-il",
+                        help="compile input files saved with --emit-il "
+                             "instead of C files",
+                        dest="from_il", action="store_true")
+
+    # Boolean flags for whether to run the program in the IL interpreter,
+    # and whether to print how many IL commands each function ran
+    parser.add_argument("--interpret",
+                        help="run the program in the IL interpreter instead "
+                             "of compiling it, optimized as set by -O",
+                        dest="interpret", action="store_true")
+    parser.add_argument("-z-il-counts",
+                        help="display the number of IL commands each "
+                             "function ran in the interpreter",
+                        dest="show_il_counts", action="store_true")
+
     # Boolean flag for whether to print register allocator performance info
     parser.add_argument("-z-reg-alloc-perf",
                         help="display register allocator performance info",
                         dest="show_reg_alloc_perf", action="store_true")
 
+    # Boolean flag for whether to print peephole optimizer rule hit counts
+    parser.add_argument("-z-peephole-stats",
+                        help="display peephole optimizer rule hit counts",
+                        dest="show_peephole_stats", action="store_true")
+
+    # Boolean flag for whether to annotate the ASM with IL command names
+    parser.add_argument("-z-verbose-asm",
+                        help="annotate generated assembly with IL commands",
+                        dest="verbose_asm", action="store_true")
+
+    # Boolean flag for whether to use the external assembler
+    parser.add_argument("-fno-integrated-as",
+                        help="assemble with the external GNU assembler",
+                        dest="integrated_as", action="store_false")
+
+    # File in which to cache the paths of the C runtime files between runs
+    parser.add_argument("--link-cache", metavar="FILE",
+                        help="cache the C runtime paths for linking in FILE",
+                        dest="link_cache", default=None)
+
     return parser.parse_args()
 
 
@@ -132,21 +335,56 @@ def read_file(file):
         error_collector.add(CompilerError(descrip))
 
 
-def write_asm(asm_source, asm_filename):
-    """Save the given assembly source to disk at asm_filename.
+def write_il(il_code, symbol_table, il_filename):
+    """Save the given IL code and symbol table to disk at il_filename."""
+    try:
+        with open(il_filename, "w") as il_file:
+            il_serial.dump(il_code, symbol_table, il_file)
+    except IOError:
+        descrip = f"could not write output file '{il_filename}'"
+        error_collector.add(CompilerError(descrip))
+
 
-    asm_source (str) - Full assembly source code.
+def write_asm(asm_code, asm_filename):
+    """Save the given assembly code to disk at asm_filename.
+
+    asm_code (ASMCode) - Assembly code to write. It is streamed to the file
+    in chunks rather than built up into one string first.
     asm_filename (str) - Filename to which to save the generated assembly.
 
     """
     try:
         with open(asm_filename, "w") as s_file:
-            s_file.write(asm_source)
+            asm_code.write(s_file)
     except IOError:
         descrip = f"could not write output file '{asm_filename}'"
         error_collector.add(CompilerError(descrip))
 
 
+def write_object(asm_code, obj_filename):
+    """Assemble the given assembly code in-process and save the object file.
+
+    Returns False without writing anything if the built-in assembler does
+    not support some of the code.
+
+    asm_code (ASMCode) - Assembly code to assemble.
+    obj_filename (str) - Filename to which to save the object file.
+
+    """
+    try:
+        obj = elf.object_file(asm_code)
+    except EncodeError:
+        return False
+
+    try:
+        with open(obj_filename, "wb") as o_file:
+            o_file.write(obj)
+    except IOError:
+        descrip = f"could not write output file '{obj_filename}'"
+        error_collector.add(CompilerError(descrip))
+    return True
+
+
 def assemble(asm_name, obj_name):
     """Assemble the given assembly file into an object file."""
     try:
@@ -158,10 +396,78 @@ def assemble(asm_name, obj_name):
         return False
 
 
-def link(binary_name, obj_names):
-    """Assemble the given object files into a binary."""
+def link(binary_name, obj_names, cache_file=None):
+    """Link the given object files into a binary.
 
-    try:
+    binary_name (str) - Name of the output executable.
+    obj_names (List(str)) - Object files to link.
+    cache_file (str) - Optional on-disk cache of the link command, see
+    get_link_command.
+    """
+    for _ in range(2):
+        command = get_link_command(cache_file)
+        if not command: return
+
+        try:
+            subprocess.check_call(command.args(binary_name, obj_names))
+            return True
+        except subprocess.CalledProcessError:
+            # If the cached runtime files are still in place, the failure is
+            # genuine. Otherwise, they moved since they were cached (e.g.
+            # after a system upgrade), so search for them again.
+            if command.exists():
+                return False
+            forget_link_command(cache_file)
+
+    return False
+
+
+class LinkCommand:
+    """The part of the `ld` command line that is the same for every link.
+
+    paths (List(str)) - The dynamic linker, crt, crti, and crtn paths.
+    prefix (List(str)) - Arguments preceding the object files.
+    suffix (List(str)) - Arguments following the object files.
+    """
+
+    def __init__(self, linux_so, crtnum, crti, crtn):  # noqa: D102
+        self.paths = [linux_so, crtnum, crti, crtn]
+        self.prefix = ["ld", "-dynamic-linker", linux_so, crtnum, crti, "-lc"]
+        self.suffix = [crtn]
+
+    def args(self, binary_name, obj_names):
+        """Return the full `ld` argument list for linking obj_names."""
+        return self.prefix + obj_names + self.suffix + ["-o", binary_name]
+
+    def exists(self):
+        """Return whether all the runtime files are still on disk."""
+        return all(os.path.isfile(path) for path in self.paths)
+
+
+# Per-process cache of LinkCommand objects, keyed by system fingerprint.
+_link_commands = {}
+
+
+def get_link_command(cache_file=None):
+    """Return the LinkCommand for this system.
+
+    The command is found once per process and then reused. If cache_file is
+    given, the discovered paths are also saved to that JSON file, keyed by
+    the system fingerprint, so later processes skip the search too. Cached
+    paths are not checked on the way in; `link` searches again if a link
+    with them fails because a file disappeared.
+
+    If some runtime file cannot be found, add an error to the
+    error_collector and return None.
+    """
+    key = system_fingerprint()
+    if key in _link_commands:
+        return _link_commands[key]
+
+    cache = _read_link_cache(cache_file)
+    if isinstance(cache.get(key), list) and len(cache[key]) == 4:
+        command = LinkCommand(*cache[key])
+    else:
         crtnum = find_crtnum()
         if not crtnum: return
 
@@ -174,15 +480,56 @@ def link(binary_name, obj_names):
         crtn = find_library_or_err("crtn.o")
         if not crtn: return
 
-        # find files to link
-        subprocess.check_call(
-            ["ld", "-dynamic-linker", linux_so, crtnum, crti, "-lc"]
-            + obj_names + [crtn, "-o", binary_name])
+        command = LinkCommand(linux_so, crtnum, crti, crtn)
+        cache[key] = command.paths
+        _write_link_cache(cache_file, cache)
 
-        return True
+    _link_commands[key] = command
+    return command
+
+
+def forget_link_command(cache_file=None):
+    """Drop the cached LinkCommand for this system from all caches."""
+    key = system_fingerprint()
+    _link_commands.pop(key, None)
+
+    cache = _read_link_cache(cache_file)
+    if key in cache:
+        del cache[key]
+        _write_link_cache(cache_file, cache)
 
-    except subprocess.CalledProcessError:
-        return False
+
+def system_fingerprint():
+    """Return a string identifying the system the runtime files belong to."""
+    uname = platform.uname()
+    return ":".join([uname.system, uname.release, uname.machine]
+                    + [str(path) for path in search_paths])
+
+
+def _read_link_cache(cache_file):
+    """Return the contents of the link cache file, or {} if unavailable."""
+    if not cache_file:
+        return {}
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _write_link_cache(cache_file, cache):
+    """Save the link cache file.
+
+    The cache is best effort, so failures to write it are ignored.
+    """
+    if not cache_file:
+        return
+    try:
+        with open(cache_file, "w") as f:
+            json.dump(cache, f, indent=2)
+    except IOError:
+        pass
 
 
 def find_crtnum():
@@ -214,23 +561,25 @@ def find_library_or_err(file):
         return path
 
 
+# Directories searched for the C runtime files and the dynamic linker.
+search_paths = [pathlib.Path("/usr/local/lib/x86_64-linux-gnu"),
+                pathlib.Path("/lib/x86_64-linux-gnu"),
+                pathlib.Path("/usr/lib/x86_64-linux-gnu"),
+                pathlib.Path("/usr/local/lib64"),
+                pathlib.Path("/lib64"),
+                pathlib.Path("/usr/lib64"),
+                pathlib.Path("/usr/local/lib"),
+                pathlib.Path("/lib"),
+                pathlib.Path("/usr/lib"),
+                pathlib.Path("/usr/x86_64-linux-gnu/lib64"),
+                pathlib.Path("/usr/x86_64-linux-gnu/lib")]
+
+
 def find_library(file):
     """Search the given library file by searching in common directories.
 
     If found, returns the path. Otherwise, returns None.
     """
-    search_paths = [pathlib.Path("/usr/local/lib/x86_64-linux-gnu"),
-                    pathlib.Path("/lib/x86_64-linux-gnu"),
-                    pathlib.Path("/usr/lib/x86_64-linux-gnu"),
-                    pathlib.Path("/usr/local/lib64"),
-                    pathlib.Path("/lib64"),
-                    pathlib.Path("/usr/lib64"),
-                    pathlib.Path("/usr/local/lib"),
-                    pathlib.Path("/lib"),
-                    pathlib.Path("/usr/lib"),
-                    pathlib.Path("/usr/x86_64-linux-gnu/lib64"),
-                    pathlib.Path("/usr/x86_64-linux-gnu/lib")]
-
     for path in search_paths:
         full = path.joinpath(file)
         if full.is_file():
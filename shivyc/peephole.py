@@ -0,0 +1,179 @@
+"""Peephole optimizer for the generated ASM code.
+
+The peephole optimizer slides a small window over the list of ASM commands
+in an ASMCode object and rewrites short instruction sequences into
+cheaper equivalent sequences. Each rewrite is described by a Rule in the
+`rules` table below, so new rewrites can be added without touching the
+driver.
+
+Comments are invisible to the peephole window, so a comment between two
+commands never prevents a rule from matching.
+"""
+
+import shivyc.asm_cmds as asm_cmds
+from shivyc.spots import RegSpot, MemSpot, LiteralSpot
+
+
+class Rule:
+    """A single peephole rewrite rule.
+
+    name (str) - Name of this rule, used for reporting hit counts.
+    pattern (tuple) - Tuple of ASM command classes. The rule is tried only
+    on windows of consecutive commands which are instances of these
+    classes, in order.
+    rewrite - Function accepting the list of matched commands. It returns
+    the list of commands to replace the matched commands with, or None if
+    the rule does not apply to this window.
+    """
+
+    def __init__(self, name, pattern, rewrite):  # noqa: D102
+        self.name = name
+        self.pattern = pattern
+        self.rewrite = rewrite
+
+    def match(self, window):
+        """Return the replacement for given window, or None if no match."""
+        if len(window) != len(self.pattern):
+            return None
+        if not all(isinstance(c, p) for c, p in zip(window, self.pattern)):
+            return None
+        return self.rewrite(window)
+
+
+def _uses_reg(spot, reg):
+    """Return whether the given spot reads the given register."""
+    if isinstance(spot, RegSpot):
+        return spot == reg
+    elif isinstance(spot, MemSpot):
+        return spot.base == reg or spot.count == reg
+    return False
+
+
+def _self_move(cmds):
+    """Remove `mov x, x`.
+
+    A 4-byte register self-move zero-extends into the upper half of the
+    64-bit register, so those are kept.
+    """
+    mov, = cmds
+    if mov.dest == mov.source and mov.size != 4:
+        return []
+
+
+def _store_reload(cmds):
+    """Remove the second move of `mov a, b; mov b, a`."""
+    first, second = cmds
+    if first.dest != second.source or first.source != second.dest:
+        return None
+
+    # If the first move changed a register used to address its source,
+    # the second move is not a plain reload.
+    if (isinstance(first.dest_spot, RegSpot) and
+         _uses_reg(first.source_spot, first.dest_spot)):
+        return None
+
+    # Keep 4-byte loads into a register for the zero-extension.
+    if isinstance(second.dest_spot, RegSpot) and second.size == 4:
+        return None
+
+    return [first]
+
+
+def _jump_to_next(cmds):
+    """Remove a jump to the label immediately following it."""
+    jump, label = cmds
+    if jump.target == label.label:
+        return [label]
+
+
+def _cmp_zero(cmds):
+    """Replace `cmp reg, 0` with the shorter `test reg, reg`."""
+    cmp, = cmds
+    if (isinstance(cmp.dest_spot, RegSpot) and
+         isinstance(cmp.source_spot, LiteralSpot) and
+         int(cmp.source_spot.detail) == 0):
+        return [asm_cmds.Test(cmp.dest_spot, cmp.dest_spot, cmp.size)]
+
+
+rules = [
+    Rule("self_move", (asm_cmds.Mov,), _self_move),
+    Rule("store_reload", (asm_cmds.Mov, asm_cmds.Mov), _store_reload),
+    Rule("jump_to_next", (asm_cmds._JumpCommand, asm_cmds.Label),
+         _jump_to_next),
+    Rule("cmp_zero", (asm_cmds.Cmp,), _cmp_zero),
+]
+
+
+class Peephole:
+    """Runs the peephole rules over the lines of an ASMCode object.
+
+    rules (List(Rule)) - Rules to apply, tried in order at each position.
+    hits (dict) - Mapping from rule name to number of times that rule
+    rewrote the code.
+    """
+
+    def __init__(self, rules=rules):  # noqa: D102
+        self.rules = rules
+        self.hits = {rule.name: 0 for rule in rules}
+        self.window = max((len(rule.pattern) for rule in rules), default=0)
+
+    def optimize(self, asm_code):
+        """Rewrite asm_code.lines in place."""
+        asm_code.lines = self.optimize_lines(asm_code.lines)
+
+    def optimize_lines(self, lines):
+        """Return a rewritten copy of the given list of ASM commands."""
+        # Comments are attached to the command following them, so that
+        # they do not break up the window. Each entry of `entries` is a
+        # (comments, command) pair.
+        entries = []
+        comments = []
+        for line in lines:
+            if isinstance(line, asm_cmds.Comment):
+                comments.append(line)
+            else:
+                entries.append((comments, line))
+                comments = []
+
+        i = 0
+        while i < len(entries):
+            for rule in self.rules:
+                window = entries[i:i + len(rule.pattern)]
+                new = rule.match([cmd for _, cmd in window])
+                if new is None:
+                    continue
+
+                self.hits[rule.name] += 1
+
+                # Keep the comments of the replaced commands in front of
+                # whatever follows them.
+                moved = [c for cmts, _ in window for c in cmts]
+                new_entries = [([], cmd) for cmd in new]
+                after = i + len(window)
+                if new_entries:
+                    new_entries[0] = (moved, new_entries[0][1])
+                elif after < len(entries):
+                    entries[after] = (moved + entries[after][0],
+                                      entries[after][1])
+                else:
+                    comments = moved + comments
+
+                entries[i:after] = new_entries
+
+                # Step back so rewrites that enable a match starting at an
+                # earlier command are also caught.
+                i = max(i - self.window + 1, 0)
+                break
+            else:
+                i += 1
+
+        final = []
+        for cmts, cmd in entries:
+            final += cmts
+            final.append(cmd)
+        return final + comments
+
+    def report(self):
+        """Print the hit count of each rule."""
+        for rule in self.rules:
+            print("peephole", rule.name, self.hits[rule.name])
@@ -1,5 +1,7 @@
 """Nodes in the AST which represent expression values."""
 
+import math
+
 import shivyc.ctypes as ctypes
 import shivyc.tree.nodes as nodes
 import shivyc.il_cmds.compare as compare_cmds
@@ -1143,26 +1145,22 @@ class ArraySubsc(_LExprNode):
     def _lvalue(self, il_code, symbol_table, c):
         """Return lvalue form of this node.
 
-        We have two main cases here. The first case covers most simple
-        situations, like `array[5]` or `array[x+3]`, and the second case
-        covers more complex situations like `array[4][2]` or an array
-        within a struct.
-
-        In the first case, one of the two operands is a DirectLValue array
-        (i.e. just a variable, not a lookup into another object). This
-        means it will have a spot in memory assigned to it by the register
-        allocator, and we can return a RelativeLValue object from this
-        function. This case corresponds to `matched` being True. A
-        RelativeLValue object usually becomes an assembly command like
-        `[rbp-40+3*rax]`, which is more efficient than manually computing
-        the address like happens in the second case.
-
-        In the second case, neither operand is a DirectLValue array. This is
-        the case for two-dimensional arrays, for example. Here, we proceed
-        naively and get the address for the pointer side. This is a little
-        bit less efficient. Ideally, in cases like `array[2][4]` where the
-        lookup address could be computed at compile-time, we'd be able to do
-        that, but this is not yet supported (TODO).
+        We have two main cases here. The first case covers situations like
+        `array[5]`, `array[x+3]`, `array[4][2]`, or an array within a
+        struct, and the second case covers subscripting a pointer.
+
+        In the first case, one of the two operands is an array whose
+        location relative to a variable is known, i.e. a DirectLValue or a
+        RelativeLValue. This corresponds to `array_lv` being found. Since
+        the variable has a spot in memory assigned to it by the register
+        allocator, we can return a RelativeLValue object from this
+        function. The offsets of nested lookups are folded together at
+        compile-time, so the result usually becomes a single assembly
+        command like `[rbp-40+3*rax]`, which is more efficient than manually
+        computing the address like happens in the second case.
+
+        In the second case, neither operand is such an array. Here, we
+        proceed naively and get the address for the pointer side.
 
         """
 
@@ -1172,24 +1170,22 @@ class ArraySubsc(_LExprNode):
         head_lv = self.head.lvalue(il_code, symbol_table, c)
         arg_lv = self.arg.lvalue(il_code, symbol_table, c)
 
-        matched = False
-        if isinstance(head_lv, DirectLValue) and head_lv.ctype().is_array():
-            array, arith = self.head, self.arg
-            matched = True
-        elif isinstance(arg_lv, DirectLValue) and arg_lv.ctype().is_array():
-            array, arith = self.arg, self.head
-            matched = True
-
-        if matched:
-            # If one operand was a DirectLValue array
-            array_val = array.make_il_raw(il_code, symbol_table, c)
+        array_lv = None
+        for lv, arith in ((head_lv, self.arg), (arg_lv, self.head)):
+            if (isinstance(lv, (DirectLValue, RelativeLValue))
+                  and lv.ctype().is_array()):
+                array_lv = lv
+                break
+
+        if array_lv:
+            # If one operand was an array at a known relative location
             arith_val = arith.make_il(il_code, symbol_table, c)
 
             if arith_val.ctype.is_integral():
-                return self.array_subsc(array_val, arith_val)
+                return self.array_subsc(array_lv, arith_val, il_code)
 
         else:
-            # Neither operand was a DirectLValue array
+            # Neither operand was such an array
             head_val = self.head.make_il(il_code, symbol_table, c)
             arg_val = self.arg.make_il(il_code, symbol_table, c)
 
@@ -1216,14 +1212,46 @@ class ArraySubsc(_LExprNode):
         il_code.add(math_cmds.Add(out, point, shift))
         return IndirectLValue(out)
 
-    def array_subsc(self, array, arith):
+    def array_subsc(self, array_lv, arith, il_code):
         """Return the LValue for this node.
 
         This function is called in the case where one operand is an array
-        and the other operand is an integer.
+        at a known location relative to a variable, and the other operand
+        is an integer. A literal subscript is added to the constant offset
+        of the array. Otherwise, if the array is itself at a scaled index
+        from the variable, as in `array[i][j]`, the two indices are merged
+        into a single index scaled by their common chunk size.
         """
-        el = array.ctype.el
-        return RelativeLValue(el, array, el.size, arith)
+        el = array_lv.ctype().el
+        if isinstance(array_lv, DirectLValue):
+            array_lv = RelativeLValue(array_lv.ctype(), array_lv.il_value)
+
+        if arith.literal:
+            return array_lv.shift(el, el.size * int(arith.literal.val))
+        elif not array_lv.count:
+            return RelativeLValue(el, array_lv.base, el.size, arith,
+                                  array_lv.offset + array_lv.chunk)
+
+        chunk = math.gcd(array_lv.chunk, el.size)
+        count = ILValue(ctypes.longint)
+        il_code.add(math_cmds.Add(
+            count, self._scale(array_lv.count, array_lv.chunk // chunk,
+                               il_code),
+            self._scale(arith, el.size // chunk, il_code)))
+        return RelativeLValue(el, array_lv.base, chunk, count,
+                              array_lv.offset)
+
+    def _scale(self, count, factor, il_code):
+        """Return a 64-bit ILValue of the given count times factor."""
+        count = set_type(count, ctypes.longint, il_code)
+        if factor == 1:
+            return count
+
+        scale = ILValue(ctypes.longint)
+        il_code.register_literal_var(scale, str(factor))
+        out = ILValue(ctypes.longint)
+        il_code.add(math_cmds.Mult(out, count, scale))
+        return out
 
 
 class _ObjLookup(_LExprNode):
@@ -1267,6 +1295,8 @@ class ObjMember(_ObjLookup):
         if isinstance(head_lv, DirectLValue):
             head_val = self.head.make_il(il_code, symbol_table, c)
             return RelativeLValue(ctype, head_val, offset)
+        elif isinstance(head_lv, RelativeLValue):
+            return head_lv.shift(ctype, offset)
         else:
             struct_addr = head_lv.addr(il_code)
 
@@ -567,7 +567,9 @@ class Declaration(Node):
         current one.
         """
         if isinstance(decl, decl_nodes.Pointer):
-            new_ctype = PointerCType(prev_ctype, decl.const)
+            new_ctype = PointerCType(prev_ctype)
+            if decl.const:
+                new_ctype = new_ctype.make_const()
         elif isinstance(decl, decl_nodes.Array):
             new_ctype = self._generate_array_ctype(decl, prev_ctype)
         elif isinstance(decl, decl_nodes.Function):
@@ -829,6 +831,13 @@ class Declaration(Node):
         members = []
         members_set = set()
         for member in node.members:
+            if self._is_anonymous_member(member):
+                with report_err():
+                    member_ctype = self._make_anonymous_member(
+                        member, node.kind, members_set)
+                    members.append((None, member_ctype))
+                continue
+
             decl_infos = []  # needed in case get_decl_infos below fails
             with report_err():
                 decl_infos = self.get_decl_infos(member)
@@ -845,6 +854,38 @@ class Declaration(Node):
         ctype.set_members(members)
         return ctype
 
+    def _is_anonymous_member(self, member):
+        """Check whether a member declaration is an anonymous member.
+
+        An anonymous member is an untagged struct or union declared as a
+        member without a name, like `union { int a; long b; };`. See
+        6.7.2.1.13.
+        """
+        return not member.decls and any(
+            isinstance(spec, (decl_nodes.Struct, decl_nodes.Union))
+            and spec.tag is None and spec.members is not None
+            for spec in member.specs)
+
+    def _make_anonymous_member(self, member, kind, members):
+        """Return the ctype of an anonymous struct or union member.
+
+        The names of its members, which are accessed as members of the
+        enclosing struct or union, are added to the given set of names.
+        """
+        member_ctype, storage = self.make_specs_ctype(member.specs, False)
+        spec_range = member.specs[0].r + member.specs[-1].r
+        if storage is not None:
+            err = f"cannot have storage specifier on {kind} member"
+            raise CompilerError(err, spec_range)
+
+        for name in member_ctype.layout.index:
+            if name in members:
+                err = f"duplicate member '{name}'"
+                raise CompilerError(err, spec_range)
+
+        members.update(member_ctype.layout.index)
+        return member_ctype
+
     def _check_struct_member_decl_info(self, decl_info, kind, members):
         """Check whether given decl_info object is a valid struct member."""
 
@@ -866,7 +907,6 @@ class Declaration(Node):
             err = f"cannot have incomplete type as {kind} member"
             raise CompilerError(err, decl_info.range)
 
-        # TODO: 6.7.2.1.13 (anonymous structs)
         if decl_info.identifier.content in members:
             err = f"duplicate member '{decl_info.identifier.content}'"
             raise CompilerError(err, decl_info.identifier.r)
@@ -54,7 +54,7 @@ class LValue:
         if ctype.is_const():
             return False
         if (ctype.is_struct_union() and
-             any(m[1].is_const() for m in ctype.members)):
+             any(m[1].is_const() for m in ctype.layout.index.values())):
             return False
 
         return True
@@ -138,21 +138,25 @@ class RelativeLValue(LValue):
     count - If provided, an integral ILValue representing the number of
     chunks of offset.
 
+    offset - A Python integer representing a constant offset added to the
+    address, like the offset of an array member within a struct.
+
     In summary, if `count` is provided, then the address of the object
     represented by this LValue is:
 
-        &base + chunk * count
+        &base + offset + chunk * count
 
     and if `count` is not provided, the address is just
 
-        &base + chunk
+        &base + offset + chunk
 
     """
-    def __init__(self, ctype, base, chunk=0, count=None):
+    def __init__(self, ctype, base, chunk=0, count=None, offset=0):
         self._ctype = ctype
         self.base = base
         self.chunk = chunk
         self.count = count
+        self.offset = offset
 
         self.fixed_count = None
         self.fixed_chunk = None
@@ -202,26 +206,37 @@ class RelativeLValue(LValue):
     def ctype(self):
         return self._ctype
 
+    def shift(self, ctype, offset):
+        """Return a RelativeLValue of given ctype offset from this one."""
+        if self.count:
+            return RelativeLValue(ctype, self.base, self.chunk, self.count,
+                                  self.offset + offset)
+        return RelativeLValue(ctype, self.base, self.offset + self.chunk
+                              + offset)
+
     def set_to(self, rvalue, il_code, r):
         self._fix_chunk_count(il_code)
         check_cast(rvalue, self.ctype(), r)
         right_cast = set_type(rvalue, self.ctype(), il_code)
         il_code.add(value_cmds.SetRel(
-            right_cast, self.base, self.fixed_chunk, self.fixed_count))
+            right_cast, self.base, self.fixed_chunk, self.fixed_count,
+            self.offset))
         return right_cast
 
     def addr(self, il_code):
         self._fix_chunk_count(il_code)
         out = ILValue(PointerCType(self.ctype()))
         il_code.add(value_cmds.AddrRel(
-            out, self.base, self.fixed_chunk, self.fixed_count))
+            out, self.base, self.fixed_chunk, self.fixed_count,
+            self.offset))
         return out
 
     def val(self, il_code):
         self._fix_chunk_count(il_code)
         out = ILValue(self.ctype())
         il_code.add(value_cmds.ReadRel(
-            out, self.base, self.fixed_chunk, self.fixed_count))
+            out, self.base, self.fixed_chunk, self.fixed_count,
+            self.offset))
         return out
 
 
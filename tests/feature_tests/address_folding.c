@@ -0,0 +1,92 @@
+struct cell {
+  char tag;
+  int values[3];
+};
+
+struct grid {
+  long id;
+  int matrix[3][4];
+  struct cell cells[5];
+};
+
+int get(int v) {
+  return v;
+}
+
+int main() {
+  int matrix[3][4];
+  int i, j;
+
+  // Constant subscripts of a multi-dimensional array
+  matrix[2][3] = 7;
+  matrix[0][1] = 3;
+  if(matrix[2][3] + matrix[0][1] != 10) return 1;
+
+  // Variable subscripts of a multi-dimensional array
+  for(i = 0; i < 3; i++) {
+    for(j = 0; j < 4; j++) {
+      matrix[i][j] = 10 * i + j;
+    }
+  }
+  if(matrix[2][1] != 21 || matrix[1][3] != 13) return 2;
+
+  // Mixed constant and variable subscripts
+  i = get(2);
+  j = get(3);
+  if(matrix[i][1] != 21 || matrix[1][j] != 13) return 3;
+  if(1[matrix][j] != 13 || j[matrix[i]] != 23) return 4;
+
+  // Negative and unsigned subscripts
+  unsigned int u = get(1);
+  int* row = matrix[1];
+  if(matrix[u][u] != 11 || matrix[2][-1] != 13 || row[-2] != 2) return 5;
+
+  // Three dimensions, with char elements
+  char cube[2][3][5];
+  int k;
+  for(i = 0; i < 2; i++)
+    for(j = 0; j < 3; j++)
+      for(k = 0; k < 5; k++)
+        cube[i][j][k] = 15 * i + 5 * j + k;
+  i = get(1);
+  j = get(2);
+  k = get(4);
+  if(cube[i][j][k] != 29 || cube[1][j][3] != 28) return 6;
+  if(cube[i][0][k] != 19 || cube[0][j][0] != 10) return 7;
+
+  // Arrays inside a struct, and structs inside an array
+  struct grid g;
+  for(i = 0; i < 3; i++) {
+    for(j = 0; j < 4; j++) {
+      g.matrix[i][j] = i * j;
+    }
+  }
+  for(i = 0; i < 5; i++) {
+    g.cells[i].tag = i;
+    for(j = 0; j < 3; j++) {
+      g.cells[i].values[j] = 100 * i + j;
+    }
+  }
+  g.id = 99;
+
+  i = get(2);
+  j = get(3);
+  if(g.matrix[i][j] != 6 || g.matrix[2][2] != 4) return 8;
+  if(g.cells[4].values[i] != 402 || g.cells[j].values[1] != 301) return 9;
+  if(g.cells[i].tag != 2 || g.cells[3].tag != 3 || g.id != 99) return 10;
+
+  // Addresses of folded elements
+  int* p = &g.matrix[i][j];
+  int* q = &g.matrix[0][0];
+  if(p - q != 11 || *p != 6) return 11;
+  int* r = &g.cells[j].values[2];
+  *r = 5;
+  if(g.cells[3].values[2] != 5) return 12;
+
+  // Compound assignment and increments through folded addresses
+  g.matrix[i][j] += 10;
+  matrix[i][j]++;
+  if(g.matrix[2][3] != 16 || matrix[2][3] != 24) return 13;
+
+  return 0;
+}
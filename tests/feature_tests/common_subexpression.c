@@ -0,0 +1,63 @@
+struct P {
+  int x;
+  int y;
+};
+
+struct P points[4];
+int g;
+
+int get(int v) {
+  return v;
+}
+
+int set_g(int v) {
+  g = v;
+  return 0;
+}
+
+int main() {
+  int i;
+  for(i = 0; i < 4; i++) {
+    points[i].x = i;
+    points[i].y = i * 10;
+  }
+
+  // Repeated address computations
+  int j = get(2);
+  if(points[j].x + points[j].y != 22) return 1;
+  if(points[j].x * points[j].y != 40) return 2;
+
+  // Repeated arithmetic and comparisons, also across blocks
+  int a = get(3), b = get(4);
+  int c = a * b + 1;
+  if(a < b) {
+    int d = a * b + 1;
+    if(d != c) return 3;
+    if(b * a != 12) return 4;
+  }
+  if((a < b) != 1) return 5;
+
+  // Values read from memory must be read again after a write
+  g = 5;
+  int e = g + 1;
+  g = 6;
+  if(g + 1 != 7) return 6;
+  int* p = &g;
+  int f = g * 2;
+  *p = 10;
+  if(g * 2 != 20) return 7;
+  int h = g - 1;
+  set_g(20);
+  if(g - 1 != 19) return 8;
+  if(e != 6 || f != 12 || h != 9) return 9;
+
+  // Comparisons of the same values with different signedness
+  int neg = get(-1);
+  unsigned int u = neg;
+  unsigned int one = get(1);
+  if(neg < 1) {
+    if(u < one) return 10;
+  } else return 11;
+
+  return 0;
+}
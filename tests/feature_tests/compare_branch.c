@@ -0,0 +1,59 @@
+int get(int a) {
+  return a;
+}
+
+int main() {
+  int a = get(3), b = get(5);
+  unsigned int u = get(-1), v = get(1);
+
+  if(a < b) {} else return 1;
+  if(a > b) return 2;
+  if(a <= b) {} else return 3;
+  if(a >= b) return 4;
+  if(a == b) return 5;
+  if(a != b) {} else return 6;
+
+  if(!(a < b)) return 7;
+  if(!(b <= a)) {} else return 8;
+
+  // Unsigned comparisons
+  if(u < v) return 9;
+  if(u > v) {} else return 10;
+  if(u <= v) return 11;
+
+  // Literal on the left
+  if(5 < a) return 12;
+  if(2 < a) {} else return 13;
+  if(3 >= a) {} else return 14;
+  if(4 <= a) return 15;
+
+  // Pointer comparisons
+  int arr[4];
+  int* p = &arr[1];
+  int* q = &arr[3];
+  if(p < q) {} else return 16;
+  if(q <= p) return 17;
+
+  // Variables whose address is taken
+  int* pa = &a;
+  if(a < *pa) return 18;
+  *pa = 10;
+  if(a > b) {} else return 19;
+
+  // Comparison result used both in a branch and as a value
+  int c = a > b;
+  if(c) {} else return 20;
+  if(c != 1) return 21;
+
+  // Loop conditions
+  int count = 0;
+  for(int i = 0; i < 10; i++) {
+    for(int j = 10; j > i; j--) count++;
+  }
+  if(count != 55) return 22;
+
+  long big = 10000000000;
+  if(big < get(1)) return 23;
+
+  return 0;
+}
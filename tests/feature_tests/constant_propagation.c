@@ -0,0 +1,63 @@
+int main() {
+  int n = 10;
+  int x = n * 4;
+  if(x != 40) return 1;
+
+  // Constants flow through both arms of a branch
+  int s;
+  if(n > 5) s = 3;
+  else s = 7;
+  if(s != 3) return 2;
+
+  // Constants merging from different values are not constant
+  int i, t = 0;
+  for(i = 0; i < n; i++) t += x;
+  if(t != 400) return 3;
+
+  // Division truncates toward zero
+  int a = -7, b = 2;
+  if(a / b != -3) return 4;
+  if(a % b != -1) return 5;
+
+  // Division by zero is left for runtime
+  int zero = 0;
+  if(zero) a = a / zero;
+
+  // Unsigned values and wraparound
+  unsigned int u = 4000000000;
+  if(u / 2 != 2000000000) return 6;
+  unsigned char c = 250;
+  c = c + 10;
+  if(c != 4) return 7;
+
+  // Shifts
+  int sh = 1;
+  if((sh << 4) != 16) return 8;
+  int neg = -16;
+  if((neg >> 2) != -4) return 9;
+
+  // Values too large for an immediate operand
+  long big = 10000000000;
+  long bigger = big + 1;
+  if(bigger != 10000000001) return 10;
+
+  // Comparisons and logical operators
+  int cmp = (n < 3) || (n >= 10 && x == 40);
+  if(cmp != 1) return 11;
+  if(!(n - 10) != 1) return 12;
+
+  _Bool flag = n;
+  if(flag != 1) return 13;
+
+  // Branches on constants
+  int k = 0;
+  while(k) {
+    k = k - 1;
+    return 14;
+  }
+  if(0) return 15;
+  for(k = 0; k != 3; k++);
+  if(k != 3) return 16;
+
+  return 0;
+}
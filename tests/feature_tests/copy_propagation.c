@@ -0,0 +1,54 @@
+int g;
+
+// Returns its argument, so the optimizer cannot treat it as a constant
+int get(int v) {
+  return v;
+}
+
+int main() {
+  int a = get(5);
+  int b = a;
+  int c = b;
+  if(c != 5) return 1;
+
+  // Copies which change the type must keep their conversion
+  int neg = get(-1);
+  unsigned int u = neg;
+  if(u < 10) return 2;
+  if(neg > 10) return 3;
+  _Bool t = a;
+  if(t != 1) return 4;
+  long l = neg;
+  if(l != -1) return 5;
+
+  // Swapping values through a temporary in a loop
+  int x = get(1), y = get(2), i;
+  for(i = 0; i < 5; i++) {
+    int tmp = x;
+    x = y;
+    y = tmp;
+  }
+  if(x != 2 || y != 1) return 6;
+
+  // A value copied in a loop and used after it
+  int prev = 0, cur = get(0);
+  for(i = 0; i < 5; i++) {
+    prev = cur;
+    cur = cur + i;
+  }
+  if(prev != 6 || cur != 10) return 7;
+
+  // Results stored directly to variables in memory
+  int m;
+  int* p = &m;
+  m = a + c;
+  if(*p != 10) return 8;
+  m = m * 2;
+  if(*p != 20) return 9;
+  g = a * 3;
+  if(g != 15) return 10;
+  g = a < g;
+  if(g != 1) return 11;
+
+  return 0;
+}
@@ -0,0 +1,57 @@
+int calls = 0;
+int count() {
+  calls++;
+  return calls;
+}
+
+struct S {
+  int a;
+  long b;
+  char c;
+};
+
+int main() {
+  // Values computed but never used
+  int a = 5, b = 10;
+  int unused = a * b + 3;
+  unused = unused / b;
+
+  // A loop variable which is only ever used to update itself
+  int i, j = 0;
+  for(i = 0; i < 10; i++) j = j * 3 + i;
+
+  // Calls run even if their result is dead
+  count();
+  int r = count();
+  if(calls != 2) return 1;
+
+  // Stores to a struct which is never read again
+  struct S s1;
+  s1.a = 3;
+  s1.b = 4;
+
+  // Stores to a struct which is read again must stay
+  struct S s2;
+  s2.a = 3;
+  s2.b = 4;
+  s2.c = 5;
+  s2.a = 6;
+  if(s2.a + s2.b + s2.c != 15) return 2;
+
+  // Stores in a loop are read by the next iteration
+  struct S s5;
+  s5.a = 0;
+  for(i = 0; i < 5; i++) {
+    s5.b = i;
+    s5.a = s5.a + s5.b;
+  }
+  if(s5.a != 10) return 3;
+
+  // Stores through a pointer must stay
+  struct S s6;
+  struct S* p = &s6;
+  s6.a = 7;
+  if(p->a != 7) return 4;
+
+  return 0;
+}
@@ -0,0 +1,59 @@
+int sum(int* a, int n) {
+  int i, total = 0;
+  for(i = 0; i < n; i++) total += a[i];
+  return total;
+}
+
+long sum_back(long* a, int n) {
+  long total = 0;
+  int i;
+  for(i = n - 1; i >= 0; i = i - 1) total += a[i] * i;
+  return total;
+}
+
+struct P {
+  int x;
+  char c;
+  long y;
+};
+
+int main() {
+  int arr[10];
+  long larr[5];
+  struct P ps[4];
+  int* p = arr;
+  struct P* q = ps;
+  int i, j;
+
+  for(i = 0; i < 10; i++) p[i] = i * 2;
+  if(sum(arr, 10) != 90) return 1;
+  if(sum(arr + 3, 4) != 36) return 2;
+
+  for(i = 0; i < 5; i++) larr[i] = i + 1;
+  if(sum_back(larr, 5) != 40) return 3;
+
+  // Several pointers stepping with one induction variable
+  for(i = 0; i < 4; i++) {
+    q[i].x = i;
+    q[i].y = p[i] + p[i + 1];
+  }
+  if(q[3].x != 3 || q[3].y != 14) return 4;
+
+  // Steps other than one, and nested loops
+  int total = 0;
+  for(i = 0; i < 10; i += 3) total += p[i];
+  if(total != 36) return 5;
+
+  total = 0;
+  for(i = 0; i < 2; i++) {
+    for(j = 0; j < 5; j++) total += p[i * 5 + j] + p[j];
+  }
+  if(total != 90 + 40) return 6;
+
+  // Multiplication by powers of two
+  long k = 3;
+  for(i = 0; i < 3; i++) k = k * 8;
+  if(k != 1536) return 7;
+
+  return 0;
+}
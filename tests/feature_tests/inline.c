@@ -0,0 +1,82 @@
+struct Point {
+  int x;
+  int y;
+};
+
+static int get_x(struct Point* p) {
+  return p->x;
+}
+
+int square(int a) {
+  return a * a;
+}
+
+int abs_val(int a) {
+  if(a < 0) return -a;
+  return a;
+}
+
+int counter() {
+  static int count = 0;
+  count++;
+  return count;
+}
+
+int total;
+void add_total(int a) {
+  total += a;
+}
+
+int sum_to(int n) {
+  int i, s = 0;
+  for(i = 1; i <= n; i++) s += i;
+  return s;
+}
+
+int fact(int n) {
+  if(n <= 1) return 1;
+  return n * fact(n - 1);
+}
+
+int set_through(int a) {
+  int* p = &a;
+  *p = *p + 1;
+  return a;
+}
+
+static int twice_square(int a) {
+  return square(a) + square(a);
+}
+
+int main() {
+  struct Point pt;
+  pt.x = 3;
+  pt.y = 4;
+  if(get_x(&pt) != 3) return 1;
+
+  if(square(5) != 25) return 2;
+  if(square(square(2)) != 16) return 3;
+
+  if(abs_val(-4) != 4 || abs_val(6) != 6) return 4;
+
+  counter();
+  counter();
+  if(counter() != 3) return 5;
+
+  add_total(2);
+  add_total(5);
+  if(total != 7) return 6;
+
+  if(sum_to(4) + sum_to(5) != 25) return 7;
+  if(fact(5) != 120) return 8;
+
+  int b = 10;
+  if(set_through(b) != 11 || b != 10) return 9;
+
+  if(twice_square(3) != 18) return 10;
+
+  int (*f)(int) = square;
+  if(f(7) != 49) return 11;
+
+  return 0;
+}
@@ -0,0 +1,73 @@
+int get(int a) {
+  return a;
+}
+
+int classify(int a, int b) {
+  if(!a) return 1;
+  if(a && b) return 2;
+  if(a || !b) return 3;
+  return 4;
+}
+
+int main() {
+  int zero = get(0), one = get(1), two = get(2);
+
+  if(classify(0, 0) != 1) return 1;
+  if(classify(0, 5) != 1) return 2;
+  if(classify(3, 5) != 2) return 3;
+  if(classify(3, 0) != 3) return 4;
+
+  // The result of a test is also used after branching on it
+  int n = !zero;
+  if(n) {} else return 5;
+  if(n != 1) return 6;
+
+  int m = !two;
+  if(!m) {} else return 7;
+  if(m != 0) return 8;
+
+  int both = one && two;
+  if(!both) return 9;
+  if(both + both != 2) return 10;
+
+  int either = zero || zero;
+  if(either) return 11;
+  if(either != 0) return 12;
+
+  if(!!two) {} else return 13;
+  if(!(zero || !one)) {} else return 14;
+  if(!(one && !zero)) return 15;
+
+  // Nested tests which lead to each other
+  int count = 0;
+  if(one) {
+    if(!zero) {
+      if(two && !zero) count++;
+    } else {
+      return 16;
+    }
+  }
+  if(count != 1) return 17;
+
+  // Loops with break and continue
+  int sum = 0;
+  for(int i = 0; i < 20; i++) {
+    if(!(i % 2)) continue;
+    if(i > 11 && !zero) break;
+    sum += i;
+  }
+  if(sum != 1 + 3 + 5 + 7 + 9 + 11) return 18;
+
+  int j = 0;
+  while(!(j >= 10 || (j > 5 && two == 2))) j++;
+  if(j != 6) return 19;
+
+  int k = 0;
+  while(1) {
+    if(k == 3 || !one) break;
+    k++;
+  }
+  if(k != 3) return 20;
+
+  return 0;
+}
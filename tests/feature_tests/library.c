@@ -0,0 +1,47 @@
+#include <ctype.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+struct point {
+  int x, y;
+};
+
+int main() {
+  char* word = "library";
+  printf("%s has %d letters\n", word, (int)strlen(word));
+  printf("[%5d] [%-5d] [%05d] [%+d]\n", 42, 42, 42, 42);
+  printf("%x %X %o %u\n", 255, 255, 8, -1);
+  printf("%c%c\n", 'o', 'k');
+  printf("%ld %lu %%\n", -5000000000, 5000000000);
+  printf("[%.3s] [%8s]\n", word, word);
+  puts("line");
+  putchar('!');
+  putchar('\n');
+
+  char* copy = malloc(strlen(word) + 1);
+  strcpy(copy, word);
+  if(strcmp(copy, word)) return 1;
+  copy[0] = toupper(copy[0]);
+  if(strcmp(copy, "Library")) return 2;
+  if(strcmp(copy, word) >= 0) return 3;
+  free(copy);
+
+  struct point* points = calloc(3, sizeof(points[0]));
+  for(int i = 0; i < 3; i++) {
+    if(points[i].x || points[i].y) return 4;
+    points[i].x = i;
+    points[i].y = i * i;
+  }
+  if(points[2].y != 4) return 5;
+
+  if(atoi("  -123abc") != -123) return 6;
+  if(abs(-7) != 7) return 7;
+  if(!isdigit('7') || isdigit('a')) return 8;
+  if(!isspace(' ') || !isalpha('q') || tolower('Q') != 'q') return 9;
+
+  char buffer[8];
+  strncpy(buffer, "abc", 8);
+  if(buffer[3] || buffer[7] || strcmp(buffer, "abc")) return 10;
+  return 0;
+}
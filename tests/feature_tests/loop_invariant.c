@@ -0,0 +1,55 @@
+int get(int v) {
+  return v;
+}
+
+int g;
+
+int main() {
+  int arr[10];
+  int a = get(3), b = get(4);
+  int i, j, sum;
+
+  // Invariant arithmetic and address computations
+  for(i = 0; i < 10; i++) arr[i] = a * b + i;
+  if(arr[9] != 21) return 1;
+
+  // Invariant values of an inner loop which vary in the outer loop
+  sum = 0;
+  for(i = 0; i < 3; i++) {
+    for(j = 0; j < 3; j++) {
+      sum = sum + i * a + b;
+    }
+  }
+  if(sum != 63) return 2;
+
+  // A loop which never runs
+  int zero = get(0);
+  int x = 0;
+  while(x < zero) {
+    x = x + a / zero;
+  }
+  if(x != 0) return 3;
+
+  // Invariant reads of memory, in loops with and without writes
+  g = 5;
+  sum = 0;
+  for(i = 0; i < 4; i++) sum = sum + g * 2;
+  if(sum != 40) return 4;
+
+  sum = 0;
+  for(i = 0; i < 4; i++) {
+    sum = sum + g * 2;
+    g = g + 1;
+  }
+  if(sum != 52) return 5;
+
+  int* p = &g;
+  sum = 0;
+  for(i = 0; i < 4; i++) {
+    sum = sum + g * 2;
+    *p = 0;
+  }
+  if(sum != 18) return 6;
+
+  return 0;
+}
@@ -0,0 +1,98 @@
+int get(int a) {
+  return a;
+}
+
+int sum_below(int n) {
+  int sum = 0;
+  for(int i = 0; i < n; i++) sum += i;
+  return sum;
+}
+
+int sum_down(int n) {
+  int sum = 0;
+  for(int i = n; i >= 0; i -= 3) sum += i;
+  return sum;
+}
+
+int ref_down(int n) {
+  if(n < 0) return 0;
+  return n + ref_down(n - 3);
+}
+
+int first_over(int* arr, int n, int limit) {
+  for(int i = 0; i < n; i++) {
+    if(arr[i] > limit) return i;
+  }
+  return -1;
+}
+
+int main() {
+  // Every trip count around the unroll factor
+  for(int n = 0; n < 12; n++) {
+    if(sum_below(n) != n * (n - 1) / 2) return 1;
+  }
+
+  for(int n = 0; n < 12; n++) {
+    if(sum_down(n) != ref_down(n)) return 2;
+  }
+
+  // Literal bounds
+  int arr[10];
+  for(int i = 0; i < 10; i++) arr[i] = i * i;
+  int sum = 0;
+  for(int i = 1; i <= 9; i += 2) sum += arr[i];
+  if(sum != 1 + 9 + 25 + 49 + 81) return 3;
+
+  if(first_over(arr, 10, 30) != 6) return 4;
+  if(first_over(arr, 10, 100) != -1) return 5;
+
+  // Break and continue
+  sum = 0;
+  for(int i = 0; i < get(100); i++) {
+    if(i % 2) continue;
+    if(i > 20) break;
+    sum += i;
+  }
+  if(sum != 110) return 6;
+
+  // Unsigned counters close to wrapping around
+  unsigned int count = 0;
+  for(unsigned int u = 4294967290; u > 4294967280; u--) count++;
+  if(count != 10) return 7;
+
+  count = 0;
+  unsigned int end = get(-2);
+  for(unsigned int u = end - 9; u < end; u++) count++;
+  if(count != 9) return 8;
+
+  // Signed counters close to overflowing
+  count = 0;
+  int max = get(2147483647);
+  for(int i = max - 5; i < max; i++) count++;
+  if(count != 5) return 9;
+
+  // Nested loops
+  sum = 0;
+  for(int i = 0; i < 7; i++) {
+    for(int j = 0; j < i; j++) sum++;
+  }
+  if(sum != 21) return 10;
+
+  // Loops whose bound or counter changes in the body
+  int n = get(10);
+  sum = 0;
+  for(int i = 0; i < n; i++) {
+    n--;
+    sum++;
+  }
+  if(sum != 5) return 11;
+
+  sum = 0;
+  for(int i = 0; i < 10; i++) {
+    if(i == 3) i += 4;
+    sum++;
+  }
+  if(sum != 6) return 12;
+
+  return 0;
+}
@@ -0,0 +1,31 @@
+int check(int value, int limit) {
+  // Rarely taken error paths
+  if(value < 0) return 1;
+  if(value > limit) return 2;
+  return 0;
+}
+
+int collatz(long n) {
+  int steps = 0;
+  while(n != 1) {
+    if(n % 2) n = 3 * n + 1;
+    else n = n / 2;
+    steps++;
+  }
+  return steps;
+}
+
+int main() {
+  int errors = 0;
+  long total = 0;
+  for(int i = 1; i < 2000; i++) {
+    int steps = collatz(i);
+    if(check(steps, 1000)) errors++;
+    total += steps;
+  }
+
+  if(errors) return 1;
+  if(total != 133988) return 2;
+  if(collatz(27) != 111) return 3;
+  return 0;
+}
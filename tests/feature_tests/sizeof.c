@@ -48,9 +48,9 @@ int main() {
     int a_int_two, *a_ptr;
   } c;
   struct C q;
-  if(sizeof q != 32) return 27;
+  if(sizeof q != 48) return 27;
   if(sizeof q.a_int_one != 4) return 28;
-  if(sizeof q.b_struct != 16) return 29;
+  if(sizeof q.b_struct != 24) return 29;
 
   typedef int T;
   if(sizeof(T) != 4) return 30;
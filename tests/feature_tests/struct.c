@@ -17,7 +17,7 @@ int main() {
   char* p2 = p1;
 
   // this is a hacky test to check sizeof(struct A)
-  void* p3 = p2 - 8*4;
+  void* p3 = p2 - 8*6;
 
   if(p3 != q) return 1;
 
@@ -0,0 +1,99 @@
+struct Three {
+  char a, b, c;
+};
+
+struct Six {
+  short a, b, c;
+};
+
+struct Twelve {
+  int a, b, c;
+};
+
+struct TwentyFour {
+  long a, b, c;
+};
+
+struct Big {
+  int values[25];
+};
+
+struct Outer {
+  char tag;
+  struct Big big;
+  struct TwentyFour small;
+};
+
+int check_big(struct Big* b, int start) {
+  for(int i = 0; i < 25; i++) {
+    if(b->values[i] != start + i) return 0;
+  }
+  return 1;
+}
+
+int main() {
+  struct Three t1, t2;
+  t1.a = 1; t1.b = 2; t1.c = 3;
+  t2 = t1;
+  if(t2.a != 1 || t2.b != 2 || t2.c != 3) return 1;
+
+  struct Six s1, s2;
+  s1.a = 4; s1.b = 5; s1.c = 6;
+  s2 = s1;
+  if(s2.a != 4 || s2.b != 5 || s2.c != 6) return 2;
+
+  struct Twelve w1, w2;
+  w1.a = 7; w1.b = 8; w1.c = 9;
+  w2 = w1;
+  if(w2.a != 7 || w2.b != 8 || w2.c != 9) return 3;
+
+  struct TwentyFour f1, f2;
+  f1.a = 10; f1.b = 11; f1.c = 12;
+  f2 = f1;
+  if(f2.a != 10 || f2.b != 11 || f2.c != 12) return 4;
+
+  struct Big b1, b2;
+  for(int i = 0; i < 25; i++) b1.values[i] = 100 + i;
+  b2 = b1;
+  if(!check_big(&b2, 100)) return 5;
+
+  // Copies through pointers
+  struct Big b3;
+  struct Big* p = &b3;
+  *p = b1;
+  if(!check_big(&b3, 100)) return 6;
+
+  struct Big b4;
+  b4 = *p;
+  if(!check_big(&b4, 100)) return 7;
+
+  // Copies into and out of members
+  struct Outer o;
+  o.tag = 'x';
+  o.big = b1;
+  o.small = f1;
+  if(o.tag != 'x' || !check_big(&o.big, 100)) return 8;
+  if(o.small.a != 10 || o.small.c != 12) return 9;
+
+  struct Big b5;
+  b5 = o.big;
+  if(!check_big(&b5, 100)) return 10;
+
+  // Copies into and out of arrays of structs
+  struct Big arr[3];
+  for(int i = 0; i < 3; i++) {
+    for(int j = 0; j < 25; j++) b1.values[j] = i * 100 + j;
+    arr[i] = b1;
+  }
+  for(int i = 0; i < 3; i++) {
+    struct Big b6;
+    b6 = arr[i];
+    if(!check_big(&b6, i * 100)) return 11;
+  }
+
+  struct Six six_arr[4];
+  for(int i = 0; i < 4; i++) six_arr[i] = s1;
+  if(six_arr[3].c != 6) return 12;
+
+  return 0;
+}
@@ -0,0 +1,87 @@
+struct padded {
+  char c;
+  int i;
+  char d;
+  long l;
+  short s;
+};
+
+struct chars {
+  char a, b, c;
+};
+
+union mixed {
+  char c[5];
+  int i;
+};
+
+struct nested {
+  char tag;
+  struct chars chars;
+  union mixed mixed;
+  struct padded padded;
+};
+
+struct with_anonymous {
+  int kind;
+  union {
+    long number;
+    struct {
+      char first;
+      int second;
+    };
+  };
+  char last;
+};
+
+long distance(void* base, void* member) {
+  char* b = base;
+  char* m = member;
+  return m - b;
+}
+
+int main() {
+  // Members are aligned to their size, and the struct is padded to a
+  // multiple of its largest member.
+  struct padded p;
+  if(sizeof(p) != 32) return 1;
+  if(distance(&p, &p.i) != 4) return 2;
+  if(distance(&p, &p.d) != 8) return 3;
+  if(distance(&p, &p.l) != 16) return 4;
+  if(distance(&p, &p.s) != 24) return 5;
+
+  struct chars c;
+  union mixed m;
+  if(sizeof(c) != 3) return 6;
+  if(sizeof(m) != 8) return 7;
+
+  struct nested n;
+  if(sizeof(n) != 48) return 8;
+  if(distance(&n, &n.chars) != 1) return 9;
+  if(distance(&n, &n.mixed) != 4) return 10;
+  if(distance(&n, &n.padded) != 16) return 11;
+  if(distance(&n, &n.padded.l) != 32) return 12;
+
+  struct padded array[3];
+  if(distance(&array[0], &array[2].s) != 88) return 13;
+
+  // Members of anonymous members are accessed directly.
+  struct with_anonymous w;
+  if(sizeof(w) != 24) return 14;
+  if(distance(&w, &w.number) != 8) return 15;
+  if(distance(&w, &w.first) != 8) return 16;
+  if(distance(&w, &w.second) != 12) return 17;
+  if(distance(&w, &w.last) != 16) return 18;
+
+  w.first = 3;
+  w.second = 4;
+  w.kind = 1;
+  w.last = 5;
+  if(w.first + w.second + w.kind + w.last != 13) return 19;
+
+  struct with_anonymous* pw = &w;
+  pw->number = 1000;
+  if(w.number != 1000 || pw->number != 1000) return 20;
+
+  return 0;
+}
@@ -0,0 +1,58 @@
+// Each of these recursions is deep enough to overflow the stack unless the
+// recursive calls are compiled as tail calls.
+
+long sum_to(long n, long acc) {
+  if(n == 0) return acc;
+  return sum_to(n - 1, acc + n);
+}
+
+int is_odd(int n);
+
+int is_even(int n) {
+  if(n == 0) return 1;
+  return is_odd(n - 1);
+}
+
+int is_odd(int n) {
+  if(n == 0) return 0;
+  return is_even(n - 1);
+}
+
+int count;
+void count_down(int n) {
+  if(n == 0) return;
+  count++;
+  count_down(n - 1);
+  return;
+}
+
+int add(int a, int b) {
+  return a + b;
+}
+
+int apply(int (*f)(int, int), int a, int b) {
+  return f(a, b);
+}
+
+int read(int* p) {
+  return *p;
+}
+
+// Not a tail call, because a pointer to `a` is passed along.
+int read_local(int a) {
+  return read(&a);
+}
+
+int main() {
+  if(sum_to(10000000, 0) != 50000005000000) return 1;
+  if(is_even(10000001) != 0) return 2;
+  if(is_odd(10000001) != 1) return 3;
+
+  count_down(10000000);
+  if(count != 10000000) return 4;
+
+  if(apply(add, 3, 4) != 7) return 5;
+  if(read_local(6) != 6) return 6;
+
+  return 0;
+}
@@ -0,0 +1,48 @@
+struct point;
+
+// The const type is made before the struct is complete.
+const struct point* origin;
+
+struct point {
+  int x, y;
+};
+
+int sum(const struct point* p) {
+  return p->x + p->y;
+}
+
+int first(int (*a)[], int i) {
+  return (*a)[i];
+}
+
+int main() {
+  struct point p;
+  p.x = 3;
+  p.y = 4;
+  origin = &p;
+  if(sizeof(*origin) != 8) return 1;
+  if(origin->y != 4) return 2;
+  if(sum(&p) != 7) return 3;
+
+  // Equal types written differently are the same type.
+  int* const* a;
+  int* const* b = a;
+  unsigned int u = 5;
+  unsigned* pu = &u;
+  if(*pu != 5) return 4;
+
+  const int c = 10;
+  const int* pc = &c;
+  if(*pc != 10) return 5;
+
+  // An array of known size is compatible with one of unknown size.
+  int arr[3];
+  arr[0] = 1; arr[1] = 2; arr[2] = 3;
+  if(first(&arr, 2) != 3) return 6;
+
+  int (*pa)[] = &arr;
+  int (*pb)[3] = pa;
+  if((*pb)[1] != 2) return 7;
+
+  return 0;
+}
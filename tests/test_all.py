@@ -4,7 +4,8 @@ This module defines metaclassis which generate test cases from files on disk,
 and a test class based off that metaclass. For each file that matches
 "tests/feature_tests/*.c", a feature test function is generated, and for
 each file that matches "tests/frontend_tests/*.c", a frontend test function
-is generated.
+is generated. Feature tests are generated twice, once compiling with the
+default options and once with the optimizer enabled.
 
 If a file name ends in "_helper.c", a test function is not generated for
 that file, but that file is linked into another test. For example,
@@ -26,33 +27,86 @@ Then, the test expects compilation to raise an error or warning on the
 following line whose message is the string "____".
 """
 
+import contextlib
 import glob
+import io
+import json
 import pathlib
+import shutil
 import subprocess
+import tempfile
 import unittest
 
+import shivyc.asm_cmds as asm_cmds
+import shivyc.asm_gen
+import shivyc.ctypes
+import shivyc.elf
+import shivyc.il_cmds.control as control_cmds
+import shivyc.il_interp
+import shivyc.il_opt.jumps
+import shivyc.il_serial
 import shivyc.main
+import shivyc.peephole
 from shivyc.errors import error_collector
+from shivyc.il_gen import ILValue
+from shivyc.spots import RAX, RBP, LiteralSpot, MemSpot
 
 
-def compile_with_shivyc(test_file_names):
+def compile_with_shivyc(test_file_names, cache_file=None, **options):
     """Compile given file with ShivyC.
 
-    Errors are saved in the error collector.
+    Errors are saved in the error collector. Any keyword arguments override
+    the command-line arguments of the same name. Returns the exit status of
+    the compiler.
 
     """
     # Mock out arguments to ShivyC call
     class MockArguments:
         files = test_file_names
         show_reg_alloc_perf = False
+        show_peephole_stats = False
+        verbose_asm = False
+        integrated_as = True
+        link_cache = cache_file
+        opt_level = 0
+        inline_limit = 20
+        unroll_loops = 0
+        codegen_jobs = 1
+        profile_generate = False
+        profile_use = False
+        emit_il = False
+        from_il = False
+        interpret = False
+        show_il_counts = False
         variables_on_stack = False
 
+    for name, value in options.items():
+        setattr(MockArguments, name, value)
+
     shivyc.main.get_arguments = lambda: MockArguments()
 
     # Mock out error collector functions
     error_collector.show = lambda: True
 
-    shivyc.main.main()
+    return shivyc.main.main()
+
+
+# Options of the optimized build which the tests are also run with.
+optimized = {"opt_level": 1, "unroll_loops": 4}
+
+# Options of each build the tests are run with, by name.
+builds = {"O0": {}, "O1": optimized}
+
+# Feature tests which only pass with the optimizer, like the tail calls
+# which keep deep recursion from overflowing the stack.
+optimized_only = ["tail_call.c"]
+
+
+def _feature_options(test_file_name):
+    """Return the options a feature test is compiled with by default."""
+    if pathlib.Path(test_file_name).name in optimized_only:
+        return optimized
+    return {}
 
 
 def _read_params(test_file_name):
@@ -80,8 +134,11 @@ def _read_params(test_file_name):
     return exp_errors, exp_warnings, exp_ret_val
 
 
-def generate_test(test_file_name, helper_name):
-    """Return a function that tests given file."""
+def generate_test(test_file_name, helper_name, options):
+    """Return a function that tests given file.
+
+    The file is compiled with the given options for compile_with_shivyc.
+    """
 
     def test_function(self):
         exp_errors, exp_warnings, exp_ret_val = _read_params(test_file_name)
@@ -90,7 +147,7 @@ def generate_test(test_file_name, helper_name):
             files = [test_file_name, helper_name]
         else:
             files = [test_file_name]
-        compile_with_shivyc(files)
+        compile_with_shivyc(files, **options)
 
         act_errors = []
         act_warnings = []
@@ -108,19 +165,24 @@ def generate_test(test_file_name, helper_name):
     return test_function
 
 
-def new(glob_str, dct):
-    """The implementation of __new__ used for generating tests."""
+def new(glob_str, dct, options=None):
+    """The implementation of __new__ used for generating tests.
+
+    options (dict) - Options the tests compile with, or None for defaults.
+    """
     test_file_names = glob.glob(glob_str)
     for test_file_name in test_file_names:
         short_name = test_file_name.split("/")[-1][:-2]
         test_func_name = "test_" + short_name
 
-        if not short_name.endswith("_helper"):
+        if (not short_name.endswith("_helper") and
+             (options or short_name + ".c" not in optimized_only)):
             helper_name = test_file_name.replace(".c", "_helper.c")
             if helper_name not in test_file_names:
                 helper_name = None
 
-            dct[test_func_name] = generate_test(test_file_name, helper_name)
+            dct[test_func_name] = generate_test(test_file_name, helper_name,
+                                                options or {})
 
 
 class TestUtils(unittest.TestCase):
@@ -130,6 +192,25 @@ class TestUtils(unittest.TestCase):
         """Clear error collector before each test."""
         error_collector.clear()
 
+    @contextlib.contextmanager
+    def record_asm(self):
+        """Record the ASMCode of each object file the compiler writes.
+
+        Yields the list the ASMCode objects are appended to, in order.
+        """
+        asm_codes = []
+        write_object = shivyc.main.write_object
+
+        def record(asm_code, obj_filename):
+            asm_codes.append(asm_code)
+            return write_object(asm_code, obj_filename)
+
+        shivyc.main.write_object = record
+        try:
+            yield asm_codes
+        finally:
+            shivyc.main.write_object = write_object
+
 
 class MetaFrontendTests(type):
     """Metaclass for creating frontend tests."""
@@ -162,6 +243,21 @@ class FeatureTests(TestUtils, metaclass=MetaFeatureTests):
     pass
 
 
+class MetaOptimizedFeatureTests(type):
+    """Metaclass for creating feature tests of the optimized build."""
+
+    def __new__(meta, name, bases, dct):
+        """Create OptimizedFeatureTests class."""
+        new("tests/feature_tests/*.c", dct, optimized)
+        return super().__new__(meta, name, bases, dct)
+
+
+class OptimizedFeatureTests(TestUtils, metaclass=MetaOptimizedFeatureTests):
+    """Feature tests compiled with the optimizer enabled."""
+
+    pass
+
+
 class IntegrationTests(TestUtils):
     """Integration tests for the compiler.
 
@@ -169,7 +265,7 @@ class IntegrationTests(TestUtils):
     """
 
     def io_test(self, rel_dir, cfile, stdin):
-        """Run a general I/O test.
+        """Run a general I/O test with each build.
 
         Args:
             name (str): Name of this test
@@ -183,28 +279,31 @@ class IntegrationTests(TestUtils):
         rm = "rm -f {0}/gcc_out {0}/out {0}/shivyc_output {0}/gcc_output"
         subprocess.run(rm.format(dir), shell=True, check=True)
 
-        # Compile with ShivyC
-        compile_with_shivyc([str(pathlib.Path(dir).joinpath(cfile))])
-        self.assertEqual(error_collector.issues, [])
-
         # Compile with gcc
         gcc_compile = f"gcc -std=c11 {dir}/{cfile} -o gcc_out"
         subprocess.run(gcc_compile, shell=True, check=True)
 
-        # Run ShivyC executable on sample input
+        # Run the executables on sample input
         if stdin:
             shivyc_run = f"./out < {dir}/input.c > {dir}/shivyc_output"
             gcc_run = f"./gcc_out < {dir}/input.c > {dir}/gcc_output"
         else:
             shivyc_run = f"./out > {dir}/shivyc_output"
             gcc_run = f"./gcc_out > {dir}/gcc_output"
-
-        subprocess.run(shivyc_run, shell=True, check=True)
         subprocess.run(gcc_run, shell=True, check=True)
 
-        # Diff the two output files
-        diff = f"diff {dir}/gcc_output {dir}/shivyc_output"
-        subprocess.run(diff, shell=True, check=True)
+        for build, options in builds.items():
+            with self.subTest(build=build):
+                # Compile with ShivyC
+                error_collector.clear()
+                compile_with_shivyc([str(pathlib.Path(dir).joinpath(cfile))],
+                                    **options)
+                self.assertEqual(error_collector.issues, [])
+                subprocess.run(shivyc_run, shell=True, check=True)
+
+                # Diff the two output files
+                diff = f"diff {dir}/gcc_output {dir}/shivyc_output"
+                subprocess.run(diff, shell=True, check=True)
 
     def test_count(self):
         """Test the Count.c program from the first pset of CPSC 223 at Yale."""
@@ -220,3 +319,455 @@ class IntegrationTests(TestUtils):
         """Test the trie.c program."""
 
         self.io_test("general_tests/trie", "trie.c", None)
+
+
+class PeepholeTests(TestUtils):
+    """Tests for the rules of the peephole optimizer."""
+
+    def optimize(self, lines):
+        """Return the optimized lines as strings, and the rule hit counts."""
+        peephole = shivyc.peephole.Peephole()
+        new = peephole.optimize_lines(lines)
+        return [str(line) for line in new], peephole.hits
+
+    def test_self_move(self):
+        """Test moves of a register to itself are removed."""
+        lines, hits = self.optimize([asm_cmds.Mov(RAX, RAX, 8)])
+        self.assertEqual(lines, [])
+        self.assertEqual(hits["self_move"], 1)
+
+        # A 4-byte move zeroes the upper half of the register.
+        move = asm_cmds.Mov(RAX, RAX, 4)
+        lines, hits = self.optimize([move])
+        self.assertEqual(lines, [str(move)])
+        self.assertEqual(hits["self_move"], 0)
+
+    def test_store_reload(self):
+        """Test a value is not loaded back from where it was just stored."""
+        mem = MemSpot(RBP, -8)
+        store = asm_cmds.Mov(mem, RAX, 8)
+        lines, hits = self.optimize([store, asm_cmds.Mov(RAX, mem, 8)])
+        self.assertEqual(lines, [str(store)])
+        self.assertEqual(hits["store_reload"], 1)
+
+        # The second move reads through the register the first one wrote.
+        indirect = MemSpot(RAX)
+        moves = [asm_cmds.Mov(RAX, indirect, 8),
+                 asm_cmds.Mov(indirect, RAX, 8)]
+        lines, hits = self.optimize(moves)
+        self.assertEqual(lines, [str(move) for move in moves])
+        self.assertEqual(hits["store_reload"], 0)
+
+        # A 4-byte load zeroes the upper half of the register.
+        moves = [asm_cmds.Mov(mem, RAX, 4), asm_cmds.Mov(RAX, mem, 4)]
+        lines, hits = self.optimize(moves)
+        self.assertEqual(lines, [str(move) for move in moves])
+        self.assertEqual(hits["store_reload"], 0)
+
+    def test_jump_to_next(self):
+        """Test a jump to the label right after it is removed."""
+        label = asm_cmds.Label("next")
+        lines, hits = self.optimize([asm_cmds.Jmp("next"), label])
+        self.assertEqual(lines, [str(label)])
+        self.assertEqual(hits["jump_to_next"], 1)
+
+        lines, hits = self.optimize([asm_cmds.Jne("other"), label])
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(hits["jump_to_next"], 0)
+
+    def test_cmp_zero(self):
+        """Test a comparison of a register with zero becomes a test."""
+        lines, hits = self.optimize([asm_cmds.Cmp(RAX, LiteralSpot(0), 8)])
+        self.assertEqual(lines, [str(asm_cmds.Test(RAX, RAX, 8))])
+        self.assertEqual(hits["cmp_zero"], 1)
+
+        lines, hits = self.optimize([asm_cmds.Cmp(RAX, LiteralSpot(1), 8)])
+        self.assertEqual(hits["cmp_zero"], 0)
+
+    def test_comments(self):
+        """Test comments neither block a match nor get lost."""
+        mem = MemSpot(RBP, -8)
+        store = asm_cmds.Mov(mem, RAX, 8)
+        comment = asm_cmds.Comment("reload")
+        ret = asm_cmds.Ret()
+        lines, hits = self.optimize([store, comment,
+                                     asm_cmds.Mov(RAX, mem, 8), ret])
+        self.assertEqual(lines, [str(comment), str(store), str(ret)])
+        self.assertEqual(hits["store_reload"], 1)
+
+
+class ASMOutputTests(TestUtils):
+    """Tests for writing out the generated ASM code."""
+
+    def compile(self, file, **options):
+        """Compile a file and return the ASMCode made for it."""
+        with self.record_asm() as asm_codes:
+            compile_with_shivyc([file], **options)
+
+        self.assertEqual(error_collector.issues, [])
+        return asm_codes[0]
+
+    def test_chunks(self):
+        """Test the code written in chunks is the same as the full code."""
+        asm_code = self.compile("tests/feature_tests/pointer_math.c")
+        full = asm_code.full_code()
+        num_lines = full.count("\n")
+        self.assertGreater(num_lines, 10)
+
+        # Include chunks ending exactly at the last line, and just before.
+        for chunk_lines in (1, 2, 3, 10, num_lines - 1, num_lines):
+            out = io.StringIO()
+            asm_code.write(out, chunk_lines)
+            self.assertEqual(out.getvalue(), full, chunk_lines)
+
+    def test_verbose_asm(self):
+        """Test IL commands are noted in comments only with verbose_asm."""
+        file = "tests/feature_tests/addition.c"
+
+        def comments(asm_code):
+            return [line for line in asm_code.lines
+                    if isinstance(line, asm_cmds.Comment)]
+
+        verbose = self.compile(file, verbose_asm=True)
+        self.assertIn(str(asm_cmds.Comment("RETURN")),
+                      [str(c) for c in comments(verbose)])
+        self.assertIn("// RETURN", verbose.full_code())
+
+        plain = self.compile(file)
+        self.assertEqual(comments(plain), [])
+        self.assertNotIn("//", plain.full_code())
+
+
+class LinkTests(TestUtils):
+    """Tests for finding and caching the C runtime files used to link."""
+
+    def test_link_cache(self):
+        """Test the on-disk link cache is written, reused, and repaired."""
+        file = "tests/feature_tests/addition.c"
+        key = shivyc.main.system_fingerprint()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_file = f"{tmp}/link.json"
+
+            shivyc.main._link_commands.clear()
+            compile_with_shivyc([file], cache_file)
+            self.assertEqual(error_collector.issues, [])
+            with open(cache_file) as f:
+                paths = json.load(f)[key]
+            self.assertTrue(all(pathlib.Path(p).is_file() for p in paths))
+
+            # Stale cached paths are replaced after the link fails.
+            with open(cache_file, "w") as f:
+                json.dump({key: [f"{tmp}/missing.o"] * 4}, f)
+            shivyc.main._link_commands.clear()
+            compile_with_shivyc([file], cache_file)
+            self.assertEqual(subprocess.call(["./out"]), 0)
+            with open(cache_file) as f:
+                self.assertEqual(json.load(f)[key], paths)
+
+
+class JumpTests(TestUtils):
+    """Tests for the simplification of jump chains."""
+
+    def test_chain(self):
+        """Test a chain of jumps is followed to its end in one call."""
+        cond = ILValue(shivyc.ctypes.integer)
+        commands = [control_cmds.JumpZero(cond, "A"), control_cmds.Return(),
+                    control_cmds.Label("A"), control_cmds.Jump("B"),
+                    control_cmds.Label("B"), control_cmds.Jump("C"),
+                    control_cmds.Label("C"), control_cmds.Jump("D"),
+                    control_cmds.Return(), control_cmds.Label("D"),
+                    control_cmds.Return()]
+
+        simplified, changed = shivyc.il_opt.jumps._simplify(commands)
+        self.assertTrue(changed)
+        self.assertEqual(simplified[0].targets(), ["D"])
+        self.assertEqual([c.label_name() for c in simplified
+                          if c.label_name()], ["D"])
+
+        # Nothing is left to change.
+        simplified, changed = shivyc.il_opt.jumps._simplify(simplified)
+        self.assertFalse(changed)
+
+    def test_loop(self):
+        """Test a loop of jumps is left as it is."""
+        commands = [control_cmds.Label("A"), control_cmds.Jump("B"),
+                    control_cmds.Return(), control_cmds.Label("B"),
+                    control_cmds.Jump("A")]
+
+        simplified, changed = shivyc.il_opt.jumps._simplify(commands[:])
+        self.assertFalse(changed)
+        self.assertEqual(simplified, commands)
+
+
+class ProfileTests(TestUtils):
+    """Tests for profile-guided block layout."""
+
+    def test_profile(self):
+        """Test a profile is written, read back, and checked."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file = f"{tmp}/profile.c"
+            shutil.copy("tests/feature_tests/profile.c", file)
+
+            compile_with_shivyc([file], profile_generate=True)
+            self.assertEqual(error_collector.issues, [])
+            self.assertEqual(subprocess.call(["./out"]), 0)
+            self.assertTrue(pathlib.Path(f"{tmp}/profile.prof").is_file())
+
+            compile_with_shivyc([file], profile_use=True)
+            self.assertEqual(error_collector.issues, [])
+            self.assertEqual(subprocess.call(["./out"]), 0)
+
+            # A profile of different code is ignored with a warning.
+            with open(file, "a") as f:
+                f.write("int extra() { return 0; }\n")
+            compile_with_shivyc([file], profile_use=True)
+            self.assertEqual(len(error_collector.issues), 1)
+            self.assertTrue(error_collector.issues[0].warning)
+            self.assertEqual(subprocess.call(["./out"]), 0)
+
+
+class ILFileTests(TestUtils):
+    """Tests for saving IL with --emit-il and compiling it with --from-il."""
+
+    def test_round_trip(self):
+        """Test each feature test works when compiled from its saved IL."""
+        with tempfile.TemporaryDirectory() as tmp:
+            # Copy the tests so the headers they include are found.
+            tests = shutil.copytree("tests/feature_tests", f"{tmp}/tests")
+            for file in glob.glob(f"{tests}/*.c"):
+                name = pathlib.Path(file).name
+                if name.startswith("error_") or name.endswith("_helper.c"):
+                    continue
+                helper = file.replace(".c", "_helper.c")
+                files = [file] + ([helper] if pathlib.Path(helper).exists()
+                                  else [])
+
+                options = _feature_options(file)
+                compile_with_shivyc(files, emit_il=True, **options)
+                il_files = [f[:-2] + ".il" for f in files]
+
+                # Saving the IL read back gives the same file.
+                with open(il_files[0]) as f:
+                    saved = f.read()
+                with open(il_files[0]) as f:
+                    il_code, symbol_table = shivyc.il_serial.load(f)
+                out = io.StringIO()
+                shivyc.il_serial.dump(il_code, symbol_table, out)
+                self.assertEqual(out.getvalue(), saved, name)
+
+                error_collector.clear()
+                compile_with_shivyc(il_files, from_il=True, **options)
+                self.assertEqual(error_collector.issues, [], name)
+                _, _, exp_ret_val = _read_params(file)
+                self.assertEqual(subprocess.call(["./out"]), exp_ret_val,
+                                 name)
+
+    def assert_invalid(self, file, **options):
+        """Assert compiling the given file as IL reports it is invalid."""
+        error_collector.clear()
+        compile_with_shivyc([file], from_il=True, **options)
+        self.assertEqual(len(error_collector.issues), 1)
+        self.assertIn("not valid IL", error_collector.issues[0].descrip)
+
+    def test_invalid_il(self):
+        """Test a file which does not hold IL is rejected."""
+        self.assert_invalid("tests/feature_tests/addition.c")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            # Valid JSON, but not a record
+            file = f"{tmp}/list.il"
+            with open(file, "w") as f:
+                f.write("[1]\n")
+            self.assert_invalid(file)
+
+            # A jump to a label the function does not define
+            shutil.copy("tests/feature_tests/addition.c", tmp)
+            error_collector.clear()
+            compile_with_shivyc([f"{tmp}/addition.c"], emit_il=True)
+            self.assertEqual(error_collector.issues, [])
+            file = f"{tmp}/addition.il"
+            with open(file, "a") as f:
+                f.write('{"op":"Jump","label":"nowhere"}\n')
+            self.assert_invalid(file, **optimized)
+
+
+class ParallelCodegenTests(TestUtils):
+    """Tests for generating the code of functions in worker processes."""
+
+    def test_parallel(self):
+        """Test code generated in parallel runs and is deterministic."""
+        with self.record_asm() as asm_codes:
+            for _ in range(2):
+                # Number the IL labels the same way both times.
+                shivyc.asm_gen.ASMCode.label_num = 0
+                compile_with_shivyc(["tests/feature_tests/tail_call.c"],
+                                    codegen_jobs=4, **optimized)
+                self.assertEqual(error_collector.issues, [])
+                self.assertEqual(subprocess.call(["./out"]), 0)
+
+        self.assertEqual(asm_codes[0].full_code(), asm_codes[1].full_code())
+
+
+class InterpreterTests(TestUtils):
+    """Tests for running programs in the IL interpreter."""
+
+    # Feature tests which call library functions the interpreter does not
+    # have, or which take too long to interpret.
+    skipped = ["function_call.c", "storage.c", "tail_call.c"]
+
+    def test_feature_tests(self):
+        """Test the interpreter runs each feature test correctly."""
+        for file in glob.glob("tests/feature_tests/*.c"):
+            name = pathlib.Path(file).name
+            helper = file.replace(".c", "_helper.c")
+            if (name.startswith("error_") or name.endswith("_helper.c")
+                  or pathlib.Path(helper).exists() or name in self.skipped):
+                continue
+
+            error_collector.clear()
+            status = compile_with_shivyc([file], interpret=True)
+            self.assertEqual(error_collector.issues, [], name)
+            _, _, exp_ret_val = _read_params(file)
+            self.assertEqual(status, exp_ret_val, name)
+
+    def interpret(self, file, **options):
+        """Run a file in the interpreter through the compiler.
+
+        Returns the exit status, the Interpreter used, and the output of the
+        program.
+        """
+        interpreters = []
+        out = io.StringIO()
+        Interpreter = shivyc.il_interp.Interpreter
+
+        def record(il_code, symbol_table):
+            interpreters.append(Interpreter(il_code, symbol_table, out))
+            return interpreters[-1]
+
+        shivyc.il_interp.Interpreter = record
+        try:
+            status = compile_with_shivyc([file], interpret=True, **options)
+        finally:
+            shivyc.il_interp.Interpreter = Interpreter
+
+        self.assertEqual(error_collector.issues, [])
+        return status, interpreters[0], out.getvalue()
+
+    def test_output(self):
+        """Test the interpreted program prints what the compiled one does."""
+        file = "tests/feature_tests/library.c"
+        compile_with_shivyc([file])
+        self.assertEqual(error_collector.issues, [])
+        native = subprocess.run(["./out"], stdout=subprocess.PIPE)
+
+        status, _, output = self.interpret(file)
+        self.assertEqual(status, 0)
+        self.assertEqual(output, native.stdout.decode())
+
+    def test_counts(self):
+        """Test the commands run are counted, and the optimizer cuts them."""
+        file = "tests/feature_tests/profile.c"
+        _, unoptimized, _ = self.interpret(file, opt_level=0)
+        _, optimized, _ = self.interpret(file, opt_level=1)
+
+        # Each call of check runs at least its two tests, but at -O1 every
+        # call is inlined.
+        self.assertGreater(unoptimized.counts["check"], 2 * 1999)
+        self.assertEqual(optimized.counts["check"], 0)
+        self.assertLess(sum(optimized.counts.values()),
+                        sum(unoptimized.counts.values()))
+
+    def test_invalid_access(self):
+        """Test following a null pointer stops the program with an error."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file = f"{tmp}/null.c"
+            with open(file, "w") as f:
+                f.write("int main() { int* p = 0; return *p; }\n")
+
+            status = compile_with_shivyc([file], interpret=True)
+            self.assertEqual(status, 1)
+            self.assertEqual(len(error_collector.issues), 1)
+            self.assertIn("invalid memory access",
+                          error_collector.issues[0].descrip)
+
+    def test_invalid_realloc(self):
+        """Test reallocating memory not from malloc stops the program."""
+        with tempfile.TemporaryDirectory() as tmp:
+            file = f"{tmp}/realloc.c"
+            with open(file, "w") as f:
+                f.write("#include <stdlib.h>\n"
+                        "int main() { int a[2]; realloc(a, 16); }\n")
+
+            status = compile_with_shivyc([file], interpret=True)
+            self.assertEqual(status, 1)
+            self.assertEqual(len(error_collector.issues), 1)
+            self.assertIn("realloc of invalid pointer",
+                          error_collector.issues[0].descrip)
+
+
+class AssemblerTests(TestUtils):
+    """Tests that the built-in assembler matches the GNU assembler.
+
+    Each feature test is compiled with each build, and the ASM code is
+    assembled by both the built-in assembler and `as`. The machine code,
+    data, relocations, and symbols of the two object files must match.
+    """
+
+    def dump(self, obj_name):
+        """Return the objdump listing of an object file."""
+        out = subprocess.check_output(["objdump", "-drst", obj_name],
+                                      universal_newlines=True)
+        return [line for line in out.split("\n") if obj_name not in line]
+
+    def test_matches_gnu_as(self):
+        """Test all feature tests against the GNU assembler."""
+        with self.record_asm() as asm_codes:
+            for file in glob.glob("tests/feature_tests/*.c"):
+                name = pathlib.Path(file).name
+                if name.startswith("error_") or name.endswith("_helper.c"):
+                    continue
+                helper = file.replace(".c", "_helper.c")
+                files = [file] + ([helper] if pathlib.Path(helper).exists()
+                                  else [])
+                for options in builds.values():
+                    compile_with_shivyc(files, **options)
+
+        self.assertTrue(asm_codes)
+        with tempfile.TemporaryDirectory() as tmp:
+            asm_name = f"{tmp}/test.s"
+            as_name = f"{tmp}/as.o"
+            builtin_name = f"{tmp}/builtin.o"
+
+            for asm_code in asm_codes:
+                shivyc.main.write_asm(asm_code, asm_name)
+                subprocess.check_call(["as", "-64", "-o", as_name, asm_name])
+                with open(builtin_name, "wb") as f:
+                    f.write(shivyc.elf.object_file(asm_code))
+
+                self.assertListEqual(self.dump(builtin_name),
+                                     self.dump(as_name))
+
+    def test_fallback(self):
+        """Test only code the encoder does not support falls back to `as`."""
+        asm_code = shivyc.asm_gen.ASMCode()
+        asm_code.add(asm_cmds.Mov(MemSpot(RBP, -8),
+                                  LiteralSpot(10000000000), 8))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            obj_name = f"{tmp}/test.o"
+            self.assertFalse(shivyc.main.write_object(asm_code, obj_name))
+            self.assertFalse(pathlib.Path(obj_name).exists())
+
+            # Other errors are not mistaken for unsupported code.
+            object_file = shivyc.elf.object_file
+
+            def fail(asm_code):
+                raise NotImplementedError
+
+            shivyc.elf.object_file = fail
+            try:
+                with self.assertRaises(NotImplementedError):
+                    shivyc.main.write_object(asm_code, obj_name)
+            finally:
+                shivyc.elf.object_file = object_file